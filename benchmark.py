@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the csvtable and minted filters with synthetic documents and CSV files.
+
+Every scenario is run several times and the timings are written as JSON, so that the results of two runs can be
+compared (e.g. before and after a change) with ``--compare``. With ``--stub-pandoc`` the conversions are done by a
+simple stand-in for pandoc which measures the overhead of the filters without the time spent in pandoc.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from pandocfilters import Code, CodeBlock, Para, Space, Str
+
+import csvtable
+import minted
+import pandocfilter
+import pandocjson
+
+__VERSION__ = "0.1"
+__AUTHOR__ = "Julien Hadley Jack <git@jlhj.de>"
+
+# The version of the format of the results
+RESULTS_VERSION = 1
+
+# Markdown that is used for cells when they shouldn't be plain text
+MARKDOWN_CELLS = ["**Bold {}**", "*Emphasis {}*", "`code {}`", "Text {}[^note]", "~~Strike {}~~"]
+
+# The modules that the filters import only when they are needed, because loading them slows down the start of every
+# filter process
+LAZY_MODULES = ["argparse", "concurrent.futures", "cProfile", "pygments.formatters", "pypandoc", "requests"]
+
+# The maximum time in seconds to import a filter (including its dependencies but not the interpreter itself)
+IMPORT_BUDGET = 0.15
+
+# Code that is used for the generated code blocks
+CODE_LINES = ["import os", "def hello_world(name='World'):", "    print('Hello {}!'.format(name))", "    return 1"]
+
+
+def generate_csv(rows, columns, markdown=0.0, seed=0):
+    """
+    Generates the content of a CSV file with a header row.
+
+    :param rows: The number of rows without the header
+    :type rows: int
+    :param columns: The number of columns
+    :type columns: int
+    :param markdown: The probability of a cell to contain markdown instead of plain text
+    :type markdown: float
+    :param seed: The seed of the random generator
+    :type seed: int
+    :return: The content
+    :rtype: str
+    """
+    generator = random.Random(seed)
+    lines = [",".join("Header {}".format(column) for column in range(columns))]
+    for row in range(rows):
+        cells = []
+        for column in range(columns):
+            if generator.random() < markdown:
+                cells.append(generator.choice(MARKDOWN_CELLS).format(row))
+            elif column % 2:
+                cells.append(str(row * column))
+            else:
+                cells.append("Text {} {}".format(row, column))
+        lines.append(",".join(cells))
+    return "\n".join(lines) + "\n"
+
+
+def generate_document(tables=1, rows=10, columns=4, markdown=0.0, code_blocks=10, inline_codes=10, seed=0):
+    """
+    Generates a document in the JSON structure used by pandoc with tables, code blocks and inline code.
+
+    :param tables: The number of tables (code blocks with the "table" class)
+    :type tables: int
+    :param rows: The number of rows of every table
+    :type rows: int
+    :param columns: The number of columns of every table
+    :type columns: int
+    :param markdown: The probability of a cell to contain markdown instead of plain text
+    :type markdown: float
+    :param code_blocks: The number of code blocks
+    :type code_blocks: int
+    :param inline_codes: The number of inline code elements
+    :type inline_codes: int
+    :param seed: The seed of the random generator
+    :type seed: int
+    :return: The document
+    :rtype: list
+    """
+    generator = random.Random(seed)
+    blocks = []
+
+    for number in range(tables):
+        content = generate_csv(rows, columns, markdown, seed + number).rstrip("\n")
+        blocks.append(CodeBlock(["", ["table"], [["header", "yes"], ["caption", "Table {}".format(number)]]],
+                                content))
+
+    for number in range(code_blocks):
+        lines = [generator.choice(CODE_LINES) for _ in range(1 + number % 8)]
+        blocks.append(CodeBlock(["", ["minted"], [["language", "python"]]], "\n".join(lines)))
+
+    inlines = []
+    for number in range(inline_codes):
+        inlines += [Str("Call"), Space(), Code(["", [], [["language", "python"]]], "f({})".format(number % 50)),
+                    Str("."), Space()]
+    blocks.append(Para(inlines or [Str("Text")]))
+
+    return [{"unMeta": {}}, blocks]
+
+
+class StubBackend(csvtable.SubprocessBackend):
+    """
+    Stand-in for pandoc that only splits markdown into paragraphs and words. It is used to measure the time that the
+    filters spend outside of pandoc.
+    """
+
+    def __init__(self):
+        self.conversions = 0
+
+    def convert(self, content, input_format="md", output_format="json"):
+        self.conversions += 1
+        paragraphs = [paragraph.split() for paragraph in re.split(r"\n\s*\n", content) if paragraph.strip()]
+        if output_format != "json":
+            return "\n\n".join(" ".join(words) for words in paragraphs)
+        blocks = []
+        for words in paragraphs:
+            inlines = [Str(words[0])]
+            for word in words[1:]:
+                inlines += [Space(), Str(word)]
+            blocks.append(Para(inlines))
+        return json.dumps([{"unMeta": {}}, blocks])
+
+
+@contextmanager
+def stub_pandoc(enabled=True):
+    """
+    Replaces pandoc with :class:`StubBackend` for the conversions of the csvtable filter.
+
+    :param enabled: Should pandoc be replaced
+    :type enabled: bool
+    :return: The backend that replaces pandoc or ``None`` if pandoc isn't replaced
+    :rtype: collections.Iterator[StubBackend | None]
+    """
+    if not enabled:
+        yield None
+        return
+
+    backend = StubBackend()
+    get_backend = csvtable.get_backend
+    csvtable.get_backend = lambda settings: backend
+    try:
+        yield backend
+    finally:
+        csvtable.get_backend = get_backend
+
+
+def get_scenarios(parameters, directory):
+    """
+    Creates the scenarios with the synthetic input. Every scenario consists of a function that creates the input for
+    a run (which isn't timed) and a function that is timed with this input.
+
+    :param parameters: The parameters for the generators ("rows", "columns", "markdown", "code_blocks",
+      "inline_codes" and "tables")
+    :type parameters: dict[str, int | float]
+    :param directory: The directory for the generated files
+    :type directory: str
+    :return: The scenarios with their name as key
+    :rtype: OrderedDict[str, (callable, callable)]
+    """
+    rows, columns, markdown = parameters["rows"], parameters["columns"], parameters["markdown"]
+    meta = {"cache": "no"}
+    settings = csvtable.generate_settings({}, meta)
+
+    csv_file = os.path.join(directory, "table.csv")
+    with open(csv_file, "w") as output:
+        output.write(generate_csv(rows, columns, markdown))
+    with open(csv_file) as csv_input:
+        csv_rows = list(csvtable.get_reader(csv_input, settings))
+
+    def document():
+        generated = generate_document(parameters["tables"], rows, columns, markdown, parameters["code_blocks"],
+                                      parameters["inline_codes"])
+        generated[0]["unMeta"].update(meta)
+        return generated
+
+    def get_table(_):
+        table_settings = csvtable.generate_settings({"file": csv_file, "header": "yes"}, meta)
+        return csvtable.get_table("", table_settings)
+
+    def get_longtable(_):
+        table_settings = csvtable.generate_settings({"file": csv_file, "header": "yes"}, meta)
+        return csvtable.get_longtable("", table_settings)
+
+    def filter_tables(document):
+        try:
+            return pandocjson.walk(document, csvtable.prepare(document, "latex", meta), "latex", meta,
+                                   csvtable.ELEMENT_TYPES)
+        finally:
+            csvtable.close_resources()
+
+    def format_code(_):
+        code_settings = {"key": "Code", "language": "python"}
+        return [minted.format_code("f({})".format(number), "", code_settings)
+                for number in range(parameters["inline_codes"])]
+
+    def encode(document):
+        return b"".join(bytes(chunk) for chunk in pandocjson.iterencode(document))
+
+    return OrderedDict([
+        ("csvtable_format_rows", (lambda: csv_rows, lambda rows: csvtable.format_rows(rows, settings))),
+        ("csvtable_get_table", (lambda: None, get_table)),
+        ("csvtable_get_longtable", (lambda: None, get_longtable)),
+        ("csvtable_filter", (document, filter_tables)),
+        ("minted_format_code", (lambda: None, format_code)),
+        ("minted_filter", (document, lambda document: minted.apply(document, "latex", meta))),
+        ("pandocfilter_filter", (document, lambda document: pandocfilter.apply_filters(document, "latex",
+                                                                                        ["csvtable", "minted"]))),
+        ("json_encode", (document, encode)),
+        ("json_decode", (lambda: encode(document()), pandocjson.loads)),
+    ])
+
+
+def measure_imports(module):
+    """
+    Imports a module in a new interpreter with ``-X importtime`` and returns the time that each imported module took.
+
+    :param module: The name of the module
+    :type module: str
+    :return: The cumulative import times in seconds (including the modules imported by the module) by module name
+    :rtype: collections.OrderedDict[str, float]
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    times = OrderedDict()
+    for line in output.splitlines():
+        match = re.match(r"^import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$", line)
+        if match:
+            times[match.group(2)] = int(match.group(1)) / 1e6
+    return times
+
+
+def run_scenario(prepare, function, repeat):
+    """
+    Runs a scenario several times.
+
+    :param prepare: The function that creates the input
+    :type prepare: callable
+    :param function: The function that is timed
+    :type function: callable
+    :param repeat: The number of runs
+    :type repeat: int
+    :return: The result with the times in seconds ("times", "min" and "median") or the "error"
+    :rtype: dict
+    """
+    times = []
+    try:
+        for _ in range(repeat):
+            argument = prepare()
+            start = time.perf_counter()
+            function(argument)
+            times.append(time.perf_counter() - start)
+    except Exception as error:
+        return {"error": repr(error)}
+
+    ordered = sorted(times)
+    return {"times": times, "min": ordered[0], "median": ordered[len(ordered) // 2]}
+
+
+def run_benchmarks(parameters, names=None, repeat=5, stub=False):
+    """
+    Runs the benchmarks.
+
+    :param parameters: The parameters for the generators (see :func:`get_scenarios`)
+    :type parameters: dict[str, int | float]
+    :param names: The names of the scenarios that should be run or ``None`` for all scenarios
+    :type names: list[str] | None
+    :param repeat: The number of runs for every scenario
+    :type repeat: int
+    :param stub: Should pandoc be replaced by :class:`StubBackend`
+    :type stub: bool
+    :return: The results that can be written as JSON
+    :rtype: dict
+    """
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory() as directory, stub_pandoc(stub):
+        scenarios = get_scenarios(parameters, directory)
+        for name in names or scenarios:
+            if name not in scenarios:
+                raise ValueError("Unknown scenario: " + name)
+            results[name] = run_scenario(scenarios[name][0], scenarios[name][1], repeat)
+
+    return OrderedDict([
+        ("version", RESULTS_VERSION),
+        ("python", platform.python_version()),
+        ("orjson", pandocjson.orjson is not None),
+        ("stub_pandoc", stub),
+        ("repeat", repeat),
+        ("parameters", parameters),
+        ("results", results),
+    ])
+
+
+def compare_results(previous, current):
+    """
+    Compares the median times of two runs.
+
+    :param previous: The results of the earlier run
+    :type previous: dict
+    :param current: The results of the current run
+    :type current: dict
+    :return: Lines with the median times and their ratio for every scenario that exists in both runs
+    :rtype: list[str]
+    """
+    lines = ["{:<24} {:>12} {:>12} {:>8}".format("scenario", "previous", "current", "ratio")]
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name, {})
+        if "median" not in result or "median" not in before:
+            continue
+        ratio = result["median"] / before["median"] if before["median"] else float("inf")
+        lines.append("{:<24} {:>11.4f}s {:>11.4f}s {:>7.2f}x".format(name, before["median"], result["median"], ratio))
+    return lines
+
+
+def parse_arguments(args=None):
+    """
+    Provides the command line interface for the benchmarks
+
+    :param args: The arguments that should be parsed instead of the ones from the command line
+    :type args: list[str] | None
+    :return: The arguments from the command line.
+    :rtype: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", '--version', action='version', version='%(prog)s ' + __VERSION__)
+    parser.add_argument("--rows", type=int, default=1000, help="The number of rows of a table (default: 1000)")
+    parser.add_argument("--columns", type=int, default=8, help="The number of columns of a table (default: 8)")
+    parser.add_argument("--markdown", type=float, default=0.1,
+                        help="The probability of a cell to contain markdown (default: 0.1)")
+    parser.add_argument("--tables", type=int, default=5, help="The number of tables in a document (default: 5)")
+    parser.add_argument("--code-blocks", type=int, default=200,
+                        help="The number of code blocks in a document (default: 200)")
+    parser.add_argument("--inline-codes", type=int, default=2000,
+                        help="The number of inline code elements in a document (default: 2000)")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="The number of runs of a scenario (default: 5)")
+    parser.add_argument("-s", "--scenarios", help="The scenarios separated by commas (default: all)")
+    parser.add_argument("--stub-pandoc", action="store_true", help="Replace pandoc by a simple stand-in")
+    parser.add_argument("-o", "--output", help="The file for the results (default: stdout)")
+    parser.add_argument("-c", "--compare", metavar="RESULTS", help="Compare with the results of an earlier run")
+
+    return parser.parse_args(args)
+
+
+def main(arguments):
+    parameters = OrderedDict([
+        ("rows", arguments.rows),
+        ("columns", arguments.columns),
+        ("markdown", arguments.markdown),
+        ("tables", arguments.tables),
+        ("code_blocks", arguments.code_blocks),
+        ("inline_codes", arguments.inline_codes),
+    ])
+    names = arguments.scenarios.split(",") if arguments.scenarios else None
+    results = run_benchmarks(parameters, names, arguments.repeat, arguments.stub_pandoc)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if arguments.compare:
+        with open(arguments.compare) as previous:
+            print("\n".join(compare_results(json.load(previous), results)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main(parse_arguments())
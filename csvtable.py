@@ -11,15 +11,32 @@ https://github.com/baig/pandoc-csv2table
 
 from __future__ import print_function
 
-import argparse
 import csv
+import gzip
+import hashlib
+import io
 import json
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
 import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain, islice
+from functools import partial
 from io import StringIO
 
-import pypandoc
-import requests
-from pandocfilters import Table, elt, toJSONFilter, Plain
+from pandocfilters import Table, elt, Plain, Para, RawBlock, RawInline, Space, Str
+
+from pandocjson import (INSTRUMENTATION, Manifest, Setting, SettingsResolver, connect_database, get_blocks,
+                        get_cache_dir, instrumented, resolve_path, run_filter, started_by_pandoc, walk)
+
+# pypandoc, requests and concurrent.futures are imported where they are needed, because loading them takes longer
+# than filtering most documents (especially documents without tables)
 
 __VERSION__ = "0.1"
 __AUTHOR__ = "Julien Hadley Jack <git@jlhj.de>"
@@ -32,8 +49,146 @@ ALIGNMENT = {
     "d": elt("AlignDefault", 1)([]),
 }
 
+# The types of the elements that this filter is interested in
+ELEMENT_TYPES = frozenset(["CodeBlock"])
+
+# Paragraph that separates the cells when the whole table is converted with a single pandoc call
+CELL_SEPARATOR = "csvtablecellseparator"
+
+# Link reference and footnote definitions which would also apply to the other cells of a table if the cells were
+# converted together
+DEFINITION = re.compile(r"^ {0,3}\[[^\]]+\]:", re.MULTILINE)
+
+# The column types of LaTeX longtables and the commands for columns with a fixed width for each alignment
+LATEX_ALIGNMENT = {
+    "AlignLeft": ("l", "\\raggedright"),
+    "AlignCenter": ("c", "\\centering"),
+    "AlignRight": ("r", "\\raggedleft"),
+    "AlignDefault": ("l", "\\raggedright"),
+}
+
+# Characters that have to be escaped in LaTeX and their replacements
+LATEX_ESCAPES = {
+    "\\": "\\textbackslash{}", "&": "\\&", "%": "\\%", "$": "\\$", "#": "\\#", "_": "\\_", "{": "\\{",
+    "}": "\\}", "~": "\\textasciitilde{}", "^": "\\textasciicircum{}",
+}
+
+# Pattern for the characters that have to be escaped in LaTeX
+LATEX_SPECIAL = re.compile(r"[\\&%$#_{}~^]")
+
+# The formats of the table sources besides CSV with their file extensions (the names and extensions can also be used
+# for the "format" setting)
+SOURCE_FORMATS = OrderedDict([
+    ("gzip", (".gz", ".gzip")),
+    ("zstd", (".zst", ".zstd")),
+    ("parquet", (".parquet", ".pq")),
+    ("arrow", (".arrow", ".feather", ".ipc")),
+])
+
+# The formats of the table sources that are read as columns instead of lines
+COLUMNAR_FORMATS = frozenset(["parquet", "arrow"])
+
+# Cell content that pandoc would only split into words (letters, digits, spaces and harmless punctuation)
+PLAIN_TEXT = re.compile(r"^(?:[^\W_]|[ .,:;%/+=()?!-])*\Z")
+
+# Words that pandoc interprets as markers of a list when they are at the start of the cell
+LIST_MARKER = re.compile(r"^(?:[-+]|\(?[^\W_]+[.)])$")
+
+# Cell content that is a number (which pandoc would keep as a single word)
+NUMBER = re.compile(r"^[-+]?\d+(?:[.,]\d+)*%?\Z")
 
-def csv_table(key, value, fmt, meta):
+# Cell content that is a boolean value
+BOOLEAN = frozenset(["yes", "no", "true", "false", "Yes", "No", "True", "False", "YES", "NO", "TRUE", "FALSE"])
+
+# The inline elements that pandoc creates for check and cross marks and their background color (if "colorize" is set)
+MARKERS = {
+    "\\cmark": ([RawInline("tex", "\\cmark")], "\\cellcolor{green!25}"),
+    "\\xmark": ([RawInline("tex", "\\xmark")], "\\cellcolor{red!25}"),
+    "(\\cmark)": ([Str("("), RawInline("tex", "\\cmark"), Str(")")], "\\cellcolor{orange!25}"),
+    "(\\xmark)": ([Str("("), RawInline("tex", "\\xmark"), Str(")")], "\\cellcolor{orange!25}"),
+}
+
+# Size limits (in characters of the serialized JSON) for the caches of the converted markdown
+CACHE_MEMORY_SIZE = 16 * 1024 * 1024
+CACHE_DISK_SIZE = 256 * 1024 * 1024
+
+# The conversion caches for each cache location (``None`` for caches that are only kept in memory)
+CACHES = {}
+
+# The caches for downloaded CSV files for each cache location
+URL_CACHES = {}
+
+# The conversion backends for each combination of backend name and number of workers
+BACKENDS = {}
+
+# The manifests of incremental builds with their path as key
+MANIFESTS = {}
+
+# Timeout in seconds for downloading CSV files and the number of retries if the download fails
+URL_TIMEOUT = 10
+URL_RETRIES = 3
+
+# Timeout in seconds for a conversion by a pandoc server
+SERVER_TIMEOUT = 60
+
+# The maximal number of CSV sources that are read at the same time before the document is filtered and the maximal
+# size of files that are read (larger files are streamed while the table is created)
+PREFETCH_WORKERS = 16
+PREFETCH_FILE_SIZE = 1024 * 1024
+
+# The number of rows whose cells are converted together
+BATCH_ROWS = 1000
+
+# The HTTP session that is shared by all downloads
+SESSION = None
+
+# Lock for creating the shared caches, backends and session when tables are created in parallel
+LOCK = threading.Lock()
+
+# Names of the input formats used by pypandoc and their equivalent for pandoc itself
+PANDOC_FORMATS = {"md": "markdown"}
+
+# The settings of a table from the attributes of its code block and the metadata of the document
+SETTINGS = SettingsResolver("CsvTable", OrderedDict([
+    ("file_name", Setting(["url", "file"], meta=False)),
+    ("format", Setting("format", meta=False)),
+    ("caption", Setting("caption", meta=False)),
+    ("content_pos", Setting("content_pos", "top", "choice", ["top", "bottom"])),
+    ("delimiter", Setting("delimiter", ",")),
+    ("quote_char", Setting(["quotechar", "quote_char"], '"')),
+    ("header", Setting(["header", "headers"], "no", "bool")),
+    ("alignment", Setting(["align", "aligns", "alignment", "alignments"])),
+    ("widths", Setting(["width", "widths"])),
+    ("colorize", Setting(["colorize", "colourise"], "no", "bool")),
+    ("rows", Setting(["rows", "row"], meta=False)),
+    ("skip", Setting("skip", "", "number", meta=False)),
+    ("limit", Setting("limit", "", "number", meta=False)),
+    ("columns", Setting(["columns", "column", "cols"], meta=False)),
+    ("fast_path", Setting(["fast_path", "fastpath"], "yes", "bool")),
+    ("number_format", Setting(["number_format", "numberformat"])),
+    ("auto_align", Setting(["auto_align", "autoalign"], "no", "bool")),
+    ("longtable", Setting("longtable", "no", "bool")),
+    ("cache", Setting("cache", "yes", "choice", ["yes", "memory", "no"])),
+    ("cache_dir", Setting(["cache_dir", "cachedir"])),
+    ("cache_size", Setting("cache_size", "", "number")),
+    ("url_cache", Setting("url_cache", "yes", "bool")),
+    ("url_max_age", Setting("url_max_age", "", "number")),
+    ("offline", Setting("offline", "no", "bool")),
+    ("backend", Setting("backend", "subprocess", "choice", ["subprocess", "server"])),
+    ("workers", Setting("workers", "", "number")),
+    ("pandoc_server", Setting(["pandoc_server", "pandoc-server"])),
+]))
+
+# The settings that only apply to the whole document
+DOCUMENT_SETTINGS = SettingsResolver("CsvTable", OrderedDict([
+    ("incremental", Setting([], "no", "bool", meta="incremental")),
+    ("cache_dir", Setting([], meta=["cache_dir", "cachedir"])),
+    ("parallel", Setting([], "", "number", meta="parallel")),
+    ("parallel_mode", Setting([], "threads", "choice", ["threads", "processes"], meta="parallel_mode")),
+]))
+
+
+def csv_table(key, value, fmt, meta, manifest=None, sources=None, directory=None):
     """
     The filter that creates a table from a csv file.
 
@@ -45,6 +200,13 @@ def csv_table(key, value, fmt, meta):
     :type fmt: str
     :param meta: The metadata of the document.
     :type meta: dict[str, str]
+    :param manifest: The manifest with the tables of earlier runs or ``None`` if every table should be created
+    :type manifest: pandocjson.Manifest | None
+    :param sources: The content of the CSV sources of the document that were already read (see
+      :func:`prefetch_sources`)
+    :type sources: dict[str, str] | None
+    :param directory: The directory that relative paths are resolved against (by default the working directory)
+    :type directory: str | None
     :return: The created table or none if this filter doesn't apply to the element
     :rtype: dict | None
     """
@@ -54,9 +216,90 @@ def csv_table(key, value, fmt, meta):
     (_, classes, paired_attributes), content = value
 
     paired_attributes = map_attributes(paired_attributes)
-    settings = generate_settings(paired_attributes, meta)
+    settings = generate_settings(paired_attributes, meta, directory)
+
+    create = get_longtable if use_longtable(settings, fmt) else get_table
+    inputs = get_inputs(content, settings, fmt, sources) if manifest is not None else None
+    if inputs is not None:
+        return manifest.build(inputs, partial(create, content, settings, sources))
+    return create(content, settings, sources)
+
+
+def use_longtable(settings, fmt):
+    """
+    Checks if the table should be written directly as a LaTeX longtable ("longtable" setting) instead of a pandoc table.
+
+    :param settings: A dictionary with settings for this script. This method uses the "longtable" setting.
+    :type settings: dict[str, str]
+    :param fmt: The target output format
+    :type fmt: str
+    :return: ``True`` if the output format is LaTeX and the setting is enabled
+    :rtype: bool
+    """
+    return fmt == "latex" and settings.get("longtable") in ["yes", "true", "1"]
 
-    return get_table(content, settings)
+
+def get_inputs(content, settings, fmt="", sources=None):
+    """
+    Returns everything that a table depends on for the manifest of an incremental build: the content of the code
+    block, the settings and the version of the CSV source. Files are identified by their modification time and size
+    and urls by the content of the (revalidated) download.
+
+    :param content: The code block content
+    :type content: str
+    :param settings: A dictionary with settings for this script.
+    :type settings: dict[str, str]
+    :param fmt: The target output format (which only matters for LaTeX longtables)
+    :type fmt: str
+    :param sources: The content of the CSV sources that were already read. Downloaded files are added to it.
+    :type sources: dict[str, str] | None
+    :return: The inputs or ``None`` if the source can't be read
+    :rtype: list | None
+    """
+    file_name = settings["file_name"]
+    version = None
+
+    if file_name and file_name.startswith("http"):
+        csv_result = (sources or {}).get(file_name) or read_source(file_name, settings)
+        if csv_result is None:
+            return None
+        if sources is not None:
+            sources[file_name] = csv_result
+        version = hashlib.sha1(csv_result.encode("utf-8")).hexdigest()
+    elif file_name:
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return None
+        version = [os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size]
+
+    inputs = [__VERSION__, content, settings, version]
+    if use_longtable(settings, fmt):
+        inputs.append("longtable")
+    return inputs
+
+
+def get_manifest(meta, directory=None):
+    """
+    Returns the manifest for an incremental build ("incremental" setting). It is stored in the cache directory.
+
+    :param meta: The metadata of the document.
+    :type meta: dict[str, str]
+    :param directory: The directory that a relative cache directory is resolved against
+    :type directory: str | None
+    :return: The manifest or ``None`` if every table should be created
+    :rtype: pandocjson.Manifest | None
+    """
+    settings = DOCUMENT_SETTINGS.resolve_meta(meta)
+    if settings["incremental"] != "yes":
+        return None
+
+    path = os.path.abspath(os.path.join(resolve_path(settings["cache_dir"], directory) or get_cache_dir(),
+                                        "manifest.sqlite"))
+    with LOCK:
+        if path not in MANIFESTS:
+            MANIFESTS[path] = Manifest(path, "CsvTable")
+        return MANIFESTS[path]
 
 
 def check_preconditions(key, value):
@@ -86,141 +329,814 @@ def map_attributes(attributes):
     return {key: value for key, value in attributes}
 
 
-def generate_settings(paired_attributes, meta):
+def generate_settings(paired_attributes, meta, directory=None):
     """
-    Generates a settings object containg all the settings from the code and the metadata of the document.
+    Generates a settings object containg all the settings from the code and the metadata of the document. The
+    metadata is only decoded and checked for the first table of a document (see :data:`SETTINGS`).
 
     :param paired_attributes: The attributes of the code.
     :type paired_attributes: dict[str, str]
     :param meta: The metadata of the document.
     :type meta: dict[str, str]
+    :param directory: The directory that relative paths of files and the cache directory are resolved against (by
+      default they are relative to the working directory)
+    :type directory: str | None
     :return: The settings
-    :rtype: dict[str, str | int]
+    :rtype: dict[str, str]
     """
-    return {
-        "file_name": get_setting(["url", "file"], paired_attributes),
-        "caption": get_setting("caption", paired_attributes),
-        "content_pos": get_setting("content_pos", paired_attributes, meta, "top"),
-        "delimiter": get_setting("delimiter", paired_attributes, meta, ","),
-        "quote_char": get_setting(["quotechar", "quote_char"], paired_attributes, meta, '"'),
-        "header": get_setting(["header", "headers"], paired_attributes, meta, False),
-        "alignment": get_setting(["align", "aligns", "alignment", "alignments"], paired_attributes, meta),
-        "widths": get_setting(["width", "widths"], paired_attributes, meta),
-        "colorize": get_setting(["colorize", "colourise"], paired_attributes, meta)
-    }
+    settings = SETTINGS.resolve(paired_attributes, meta)
+    if directory:
+        if not settings["file_name"].startswith("http"):
+            settings["file_name"] = resolve_path(settings["file_name"], directory)
+        settings["cache_dir"] = resolve_path(settings["cache_dir"], directory)
+    return settings
 
 
-def get_setting(key, paired_attributes, meta=None, default_value="", remove=False):
+def get_source_key(file_name):
     """
-    Looks at the attributes of the code and the metadata of the document (in that order) and returns the value when it
-    finds one with the specified key.
+    Returns the key of a CSV source for the content of the sources that were already read. Files are identified by
+    their absolute path, so that the same relative path in documents from different directories doesn't collide.
 
-    :param key: The key or keys that should be searched for. Only the result for the first key found will be returned.
-    :type key: str | list[str]
-    :param paired_attributes: The attributes for the code.
-    :type paired_attributes: dict[str, str]
-    :param meta: The metadata of the document.
-    :type meta: dict[str, str]
-    :param default_value: The value that should be found if the key(s) can't be found.
-    :type default_value: str | object
-    :param remove: Should the setting be removed from the attributes if it was found there.
-    :type remove: bool
-    :return: The value that is associated with the key or the default value if key not found.
-    :rtype: str | object
+    :param file_name: The path of the file or the url
+    :type file_name: str
+    :return: The url or the absolute path of the file
+    :rtype: str
     """
-    if not isinstance(key, list):
-        key = [key]
-    for single_key in key:
-        if single_key in paired_attributes:
-            return paired_attributes.pop(single_key) if remove else paired_attributes[single_key]
-        if meta is not None and single_key in meta:
-            return meta[single_key]
-    return default_value
+    return file_name if file_name.startswith("http") else os.path.abspath(file_name)
 
 
-def get_table(content, settings):
+@instrumented("get_table")
+def get_table(content, settings, sources=None):
     """
     Creates a table as represented in pandoc.
 
     :param content: The content of the code block
     :type content: str
     :param settings: The settings of this script.
+    :param sources: The content of the CSV sources that were already read
+    :type sources: dict[str, str] | None
     :return: The table as represented in pandoc
     :rtype: dict
     """
-    csv_input = get_csv(content, settings)
+    reader = INSTRUMENTATION.iterate("read_rows", get_rows(content, settings, sources))
 
-    reader = get_reader(csv_input, settings)
-    header = get_header(reader, settings)
-    csv_content = [get_row(row, settings) for row in reader]
+    try:
+        header_row = get_header(reader, settings)
+        rows = select_rows(reader, settings)
 
-    if hasattr(csv_input, "close"):
-        csv_input.close()
+        columns = get_columns(header_row, settings)
+        if columns is not None:
+            header_row = select_columns(header_row, columns) if header_row else []
+            rows = (select_columns(row, columns) for row in rows)
 
-    settings["column_number"] = len(csv_content[0])
+        chunks = get_chunks(rows, BATCH_ROWS)
+        first_chunk = next(chunks, [])
+
+        settings["column_number"] = len(first_chunk[0]) if first_chunk else len(header_row)
+
+        caption, csv_content = format_rows([header_row] + first_chunk, settings, settings["caption"], 1)
+        header = csv_content.pop(0)
+        for chunk in chunks:
+            csv_content += format_rows(chunk, settings)[1]
+    finally:
+        reader.close()
 
-    caption = get_caption(settings)
     alignment = get_alignment(settings)
     widths = get_widths(settings)
 
     return Table(caption, alignment, widths, header, csv_content)
 
 
-def get_csv(content, settings):
+@instrumented("get_longtable")
+def get_longtable(content, settings, sources=None):
+    """
+    Creates a table as a LaTeX longtable for very large tables. The rows are read and written in batches, so only the
+    LaTeX code is kept in memory instead of pandoc's elements for every cell. Cells with numbers, check marks, boolean
+    values or plain text are escaped directly and only the other cells are converted to LaTeX by pandoc.
+
+    :param content: The content of the code block
+    :type content: str
+    :param settings: The settings of this script.
+    :param sources: The content of the CSV sources that were already read
+    :type sources: dict[str, str] | None
+    :return: The raw LaTeX block with the longtable
+    :rtype: dict
+    """
+    reader = INSTRUMENTATION.iterate("read_rows", get_rows(content, settings, sources))
+
+    try:
+        header_row = get_header(reader, settings)
+        rows = select_rows(reader, settings)
+
+        columns = get_columns(header_row, settings)
+        if columns is not None:
+            header_row = select_columns(header_row, columns) if header_row else []
+            rows = (select_columns(row, columns) for row in rows)
+
+        chunks = get_chunks(rows, BATCH_ROWS)
+        first_chunk = next(chunks, [])
+
+        settings["column_number"] = len(first_chunk[0]) if first_chunk else len(header_row)
+
+        caption, lines = format_latex_rows([header_row] + first_chunk, settings, settings["caption"], 1)
+        header = lines.pop(0)
+        for chunk in chunks:
+            lines += format_latex_rows(chunk, settings)[1]
+    finally:
+        reader.close()
+
+    head = ["\\toprule"] + ([header, "\\midrule"] if header_row else [])
+    parts = ["\\begin{longtable}[]{@{}" + get_column_spec(settings) + "@{}}"]
+    if caption:
+        parts.append("\\caption{" + caption + "}\\tabularnewline")
+    parts += head + ["\\endfirsthead"] + head + ["\\endhead"] if caption else head + ["\\endhead"]
+    parts += lines + ["\\bottomrule", "\\end{longtable}"]
+    return RawBlock("latex", "\n".join(parts))
+
+
+@instrumented("format_latex_rows")
+def format_latex_rows(rows, settings, caption="", header_rows=0):
+    """
+    Returns many rows formatted as rows of a LaTeX table (see :func:`format_rows` for the elements of a pandoc table).
+
+    :param rows: The rows with the cell content as string elements
+    :type rows: list[list[str]]
+    :param settings: A dictionary with settings for this script. This method uses the "fast_path" and
+      "number_format" settings and updates the "column_types" setting.
+    :type settings: dict[str, str]
+    :param caption: The caption of the table that should be converted together with the rows
+    :type caption: str
+    :param header_rows: The number of rows at the start that are header rows and are ignored for the column types
+    :type header_rows: int
+    :return: The LaTeX code of the caption and of every row
+    :rtype: (str, list[str])
+    """
+    fast_path = settings.get("fast_path", "yes") != "no"
+    column_types = get_column_types(rows[header_rows:]) if fast_path or settings.get("number_format") else []
+    settings["column_types"] = merge_column_types(settings.get("column_types"), column_types)
+    rows = format_numbers(rows, column_types, settings, header_rows)
+    column_types = column_types if fast_path else []
+
+    cells = []
+    for index, row in enumerate(rows):
+        cells.append([get_typed_latex(elem, column_types[column], settings)
+                      if index >= header_rows and column < len(column_types) and column_types[column] != "text"
+                      else get_plain_latex(elem) if fast_path else None for column, elem in enumerate(row)])
+
+    caption_cell = get_plain_latex(caption) if fast_path else None
+    segments = [caption] if caption_cell is None else []
+    segments += [colorize_cell(elem, settings) for row, latex in zip(rows, cells)
+                 for elem, cell in zip(row, latex) if cell is None]
+    converted = iter(convert_latex(segments, settings))
+
+    caption = next(converted) if caption_cell is None else caption_cell
+    lines = []
+    for latex in cells:
+        row = [next(converted) if cell is None else cell for cell in latex]
+        row += [""] * (settings["column_number"] - len(row))
+        lines.append(" & ".join(row[:max(settings["column_number"], 1)]) + "\\tabularnewline")
+    return caption, lines
+
+
+def get_typed_latex(content, column_type, settings):
+    """
+    Creates the LaTeX code for the cell of a column with numbers, check marks or boolean values.
+
+    :param content: The cell content
+    :type content: str
+    :param column_type: The type of the column (see :func:`get_column_types`)
+    :type column_type: str
+    :param settings: A dictionary with settings for this script. This method uses the "colorize" setting.
+    :type settings: dict[str, str]
+    :return: The LaTeX code
+    :rtype: str
+    """
+    if column_type != "marker":
+        return escape_latex(content.strip())
+    if not content:
+        return ""
+    if settings.get("colorize") in ["yes", "1"]:
+        return content + MARKERS[content][1]
+    return content
+
+
+def get_plain_latex(content):
+    """
+    Creates the LaTeX code for cell content without any markdown or LaTeX syntax (see :func:`tokenize_plain`).
+
+    :param content: The cell content
+    :type content: str
+    :return: The LaTeX code or ``None`` if pandoc is needed for the content
+    :rtype: str | None
+    """
+    if tokenize_plain(content) is None:
+        return None
+    return escape_latex(" ".join(content.split()))
+
+
+def escape_latex(text):
+    """
+    Escapes the characters that have a special meaning in LaTeX.
+
+    :param text: The text
+    :type text: str
+    :return: The escaped text
+    :rtype: str
+    """
+    return LATEX_SPECIAL.sub(lambda match: LATEX_ESCAPES[match.group(0)], text)
+
+
+def get_column_spec(settings):
+    """
+    Returns the column specification of the longtable from the alignment and width of the columns. Columns without a
+    width get the type for their alignment and the others a paragraph column with a share of the line width.
+
+    :param settings: A dictionary with settings for this script. This method uses the settings of
+      :func:`get_alignment` and :func:`get_widths`.
+    :type settings: dict[str, str | int]
+    :return: The column specification
+    :rtype: str
+    """
+    spec = []
+    for alignment, width in zip(get_alignment(settings), get_widths(settings)):
+        column_type, command = LATEX_ALIGNMENT[alignment["t"]]
+        if width > 0:
+            spec.append(">{{{}\\arraybackslash}}p{{{:.2f}\\columnwidth}}".format(command, width))
+        else:
+            spec.append(column_type)
+    return "".join(spec)
+
+
+@instrumented("convert_latex")
+def convert_latex(segments, settings):
+    """
+    Converts markdown segments to LaTeX with a single call to pandoc. Like pandoc's tables only the first paragraph of
+    every segment is used. Segments that were converted before are taken from the conversion cache and segments with
+    link reference or footnote definitions are converted on their own.
+
+    :param segments: The markdown segments
+    :type segments: list[str]
+    :param settings: A dictionary with settings for this script. This method uses the settings of :func:`get_cache`
+      and :func:`get_backend`.
+    :type settings: dict[str, str]
+    :return: The LaTeX code for every segment
+    :rtype: list[str]
+    """
+    cache, backend = get_cache(settings), None
+    result = [cache.get(segment, "md:latex") if cache is not None and segment else None for segment in segments]
+    missing = list(OrderedDict.fromkeys(segment for segment, latex in zip(segments, result)
+                                        if latex is None and segment))
+    if missing:
+        backend = get_backend(settings)
+
+    converted = {}
+    joined = [segment for segment in missing if not DEFINITION.search(segment)]
+    if joined and not any(CELL_SEPARATOR in segment for segment in joined):
+        separator = "\n\n{}\n\n".format(CELL_SEPARATOR)
+        paragraphs = split_paragraphs(convert_pandoc(separator.join(joined), backend, "latex"))
+        if len(paragraphs) == len(joined):
+            converted = dict(zip(joined, paragraphs))
+    for segment in missing:
+        if segment not in converted:
+            converted[segment] = split_paragraphs(convert_pandoc(segment, backend, "latex"))[0]
+
+    if cache is not None and converted:
+        cache.update(converted, "md:latex")
+    return [("" if not segment else converted[segment]) if latex is None else latex
+            for segment, latex in zip(segments, result)]
+
+
+@instrumented("pandoc")
+def convert_pandoc(content, backend, output_format):
+    return backend.convert(content, "md", output_format)
+
+
+def split_paragraphs(text):
+    """
+    Splits the LaTeX code of a document at the separator paragraphs and returns the first paragraph of every part.
+
+    :param text: The LaTeX code
+    :type text: str
+    :return: The first paragraph (or an empty string) between the separators
+    :rtype: list[str]
+    """
+    result = [[]]
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        if paragraph.strip() == CELL_SEPARATOR:
+            result.append([])
+        elif paragraph.strip():
+            result[-1].append(paragraph.strip())
+    return [" ".join(paragraphs[0].split("\n")) if paragraphs else "" for paragraphs in result]
+
+
+def get_rows(content, settings, sources=None):
+    """
+    Returns the rows of the table from the code block content and the source. CSV files (which can be compressed) are
+    read line by line and Parquet or Arrow files in batches while the rows are consumed.
+
+    :param content: The code block content
+    :type content: str
+    :param settings: A dictionary with settings for this script. This method uses the "file_name", "format" and
+      "content_pos" settings.
+    :type settings: dict[str, str]
+    :param sources: The content of the CSV sources that were already read
+    :type sources: dict[str, str] | None
+    :return: The rows with the cell content as string elements. The iterator needs to be closed after use.
+    :rtype: collections.Iterator[list[str]]
+    """
+    source_format = get_source_format(settings)
+
+    if settings["file_name"] and source_format in COLUMNAR_FORMATS:
+        source_rows = read_columnar(settings["file_name"], source_format, settings)
+        content_rows = get_reader(StringIO(content), settings)
+        if settings["content_pos"] == "bottom":
+            rows = chain(source_rows, content_rows)
+        else:
+            rows = chain(content_rows, source_rows)
+        try:
+            for row in rows:
+                yield row
+        finally:
+            source_rows.close()
+        return
+
+    csv_input = get_csv(content, settings, sources)
+    try:
+        for row in get_reader(csv_input, settings):
+            yield row
+    finally:
+        csv_input.close()
+
+
+def get_source_format(settings):
+    """
+    Returns the format of the table source from the "format" setting or the extension of the file.
+
+    :param settings: A dictionary with settings for this script. This method uses the "file_name" and "format" settings.
+    :type settings: dict[str, str]
+    :return: The format ("csv" or one of :data:`SOURCE_FORMATS`)
+    :rtype: str
+    """
+    source_format = (settings.get("format") or "").strip().lower().lstrip(".")
+    file_name = (settings.get("file_name") or "").lower()
+
+    for name, extensions in SOURCE_FORMATS.items():
+        if source_format == name or "." + source_format in extensions:
+            return name
+        if not source_format and file_name.endswith(extensions):
+            return name
+    return "csv"
+
+
+def get_csv(content, settings, sources=None):
     """
-    Return the CSV content. This method will look at urls, files and code block content.
+    Return the CSV content as lines. This method will look at urls, files and code block content.
+    Files are read line by line while the lines are consumed. Sources that were already read by
+    :func:`prefetch_sources` are not read again.
 
     :param content: The code block content
     :type content: str
     :param settings: A dictionary with settings for this script. This method uses the "file_name" setting.
     :type settings: dict[str, str]
-    :return: The CSV content.
-    :rtype: io.StringIO
+    :param sources: The content of the CSV sources that were already read
+    :type sources: dict[str, str] | None
+    :return: The lines of the CSV content. The iterator needs to be closed after use.
+    :rtype: collections.Iterator[str]
     """
     file_name = settings["file_name"]
 
     if not file_name:
         return StringIO(content)
 
-    if file_name.startswith("http"):
-        csv_result = get_content_from_url(file_name)
-    else:
-        csv_result = StringIO(open(file_name).read())
+    csv_result = open_source(file_name, settings, sources)
 
     if settings["content_pos"] == "bottom":
-        order1, order2 = csv_result.getvalue(), content
+        return join_lines(csv_result, StringIO(content))
     else:
-        order1, order2 = content, csv_result.getvalue()
+        return join_lines(StringIO(content), csv_result)
 
-    if order1:
-        order1 += "\n"
-    return StringIO(order1 + order2)
 
+def open_source(file_name, settings, sources=None):
+    """
+    Returns the lines of a CSV source which is either a file or an url.
 
-def get_content_from_url(url):
+    :param file_name: The path of the file or the url
+    :type file_name: str
+    :param settings: A dictionary with settings for this script. This method uses the settings of :func:`get_url_cache`.
+    :type settings: dict[str, str]
+    :param sources: The content of the CSV sources that were already read
+    :type sources: dict[str, str] | None
+    :return: The lines of the source
+    :rtype: collections.Iterator[str]
+    """
+    key = get_source_key(file_name)
+    if sources and key in sources:
+        return StringIO(sources[key])
+
+    source_format = get_source_format(settings)
+    if file_name.startswith("http"):
+        if source_format != "csv":
+            raise ValueError("{} sources can only be read from files: {}".format(source_format, file_name))
+        return StringIO(read_source(file_name, settings) or "")
+    if source_format == "gzip":
+        return gzip.open(file_name, "rt")
+    if source_format == "zstd":
+        return open_zstd(file_name)
+    return open(file_name)
+
+
+def open_zstd(file_name):
+    """
+    Opens a CSV file that is compressed with zstd. This needs the optional package
+    `zstandard <https://pypi.org/project/zstandard/>`_.
+
+    :param file_name: The path of the file
+    :type file_name: str
+    :return: The lines of the decompressed file which are decompressed while they are read
+    :rtype: io.TextIOWrapper
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("The package zstandard is needed to read zstd files: " + file_name)
+
+    return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(file_name, "rb"), closefd=True))
+
+
+def read_columnar(file_name, source_format, settings):
+    """
+    Reads the rows of a Parquet or Arrow (IPC/Feather) file. The file is memory-mapped and only the columns selected by
+    the "columns" setting are decoded. The first row contains the names of the columns and the cells of the other
+    columns are empty, so that the rows can be treated like the rows of a CSV file. This needs the optional package
+    `pyarrow <https://pypi.org/project/pyarrow/>`_.
+
+    :param file_name: The path of the file
+    :type file_name: str
+    :param source_format: The format of the file ("parquet" or "arrow")
+    :type source_format: str
+    :param settings: A dictionary with settings for this script. This method uses the "columns" setting.
+    :type settings: dict[str, str]
+    :return: The rows with the cell content as string elements
+    :rtype: collections.Iterator[list[str]]
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("The package pyarrow is needed to read {} files: {}".format(source_format, file_name))
+
+    if source_format == "parquet":
+        parquet_file = pyarrow.parquet.ParquetFile(file_name, memory_map=True)
+        names = parquet_file.schema_arrow.names
+        selected = get_projection(names, settings)
+        batches = parquet_file.iter_batches(batch_size=BATCH_ROWS, columns=selected)
+    else:
+        arrow_file = pyarrow.ipc.open_file(pyarrow.memory_map(file_name))
+        names = arrow_file.schema.names
+        selected = get_projection(names, settings)
+        batches = (arrow_file.get_batch(index).select(selected) for index in range(arrow_file.num_record_batches))
+
+    yield list(names)
+
+    positions = [names.index(name) for name in selected]
+    for batch in batches:
+        columns = [["" if value is None else str(value) for value in column.to_pylist()] for column in batch.columns]
+        for values in zip(*columns):
+            row = [""] * len(names)
+            for position, value in zip(positions, values):
+                row[position] = value
+            yield row
+
+
+def get_projection(names, settings):
+    """
+    Returns the names of the columns that have to be read for the "columns" setting.
+
+    :param names: The names of all columns
+    :type names: list[str]
+    :param settings: A dictionary with settings for this script. This method uses the "columns" setting.
+    :type settings: dict[str, str]
+    :return: The names of the columns in the order of the file
+    :rtype: list[str]
+    """
+    columns = get_columns(names, settings, report=False)
+    if columns is None:
+        return list(names)
+    return [names[index] for index in sorted(set(columns)) if index < len(names)]
+
+
+def join_lines(first, second):
+    """
+    Chains the lines of two sources as if their content was joined with a newline in between (if the first one isn't
+    empty). Both sources are closed when the lines are consumed or the iterator is closed.
+
+    :param first: The lines of the first source
+    :type first: collections.Iterator[str]
+    :param second: The lines of the second source
+    :type second: collections.Iterator[str]
+    :return: The lines of both sources
+    :rtype: collections.Iterator[str]
+    """
+    try:
+        last_line = None
+        for line in first:
+            if last_line is not None:
+                yield last_line
+            last_line = line
+
+        if last_line is not None:
+            yield last_line if last_line.endswith("\n") else last_line + "\n"
+            if last_line.endswith("\n"):
+                yield "\n"
+
+        for line in second:
+            yield line
+    finally:
+        first.close()
+        second.close()
+
+
+@instrumented("read_source")
+def read_source(file_name, settings):
+    """
+    Reads the content of a CSV source which is either a file or an url. Large files are not read, so that they can be
+    streamed instead.
+
+    :param file_name: The path of the file or the url
+    :type file_name: str
+    :param settings: A dictionary with settings for this script. This method uses the settings of :func:`get_url_cache`.
+    :type settings: dict[str, str]
+    :return: The content of the source or ``None`` if it couldn't be downloaded or is too large.
+    :rtype: str | None
+    """
+    if file_name.startswith("http"):
+        csv_result = get_content_from_url(file_name, get_url_cache(settings))
+        return csv_result.getvalue() if csv_result else None
+
+    if os.path.getsize(file_name) > PREFETCH_FILE_SIZE:
+        return None
+
+    with open(file_name) as csv_file:
+        return csv_file.read()
+
+
+def get_content_from_url(url, cache=None):
     """
     Get content from an url. This method can be used to download a CSV file.
+    If a cache is used, fresh entries are returned without a request. Otherwise the request is conditional on the
+    ETag and modification date of the cached entry, so that an unchanged file isn't downloaded again. In offline mode
+    or if the download fails the cached entry is returned regardless of its age.
 
     :param url: The url where the content should be loaded from.
     :type url: str
+    :param cache: The cache for downloaded files or ``None`` if no cache should be used
+    :type cache: UrlCache | None
     :return: The content at the url.
     :rtype: io.StringIO
     """
-    response = requests.get(url)
+    entry = cache.get(url) if cache else None
+    if entry is not None and (cache.offline or cache.is_fresh(entry)):
+        return StringIO(entry["body"])
+    if cache is not None and cache.offline:
+        print("CsvTable - Couldn't find in cache while offline: " + url, file=sys.stderr)
+        return
+
+    import requests
+
+    headers = {}
+    if entry is not None and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        response = get_session().get(url, headers=headers, timeout=URL_TIMEOUT)
+    except requests.RequestException as error:
+        if entry is not None:
+            print("CsvTable - Using cached content for: {} ({})".format(url, error), file=sys.stderr)
+            return StringIO(entry["body"])
+        print("CsvTable - Couldn't download: {} ({})".format(url, error), file=sys.stderr)
+        return
+
+    INSTRUMENTATION.count("downloads")
+    INSTRUMENTATION.count("bytes_fetched", len(response.content))
+    if response.status_code == 304 and entry is not None:
+        cache.refresh(url)
+        return StringIO(entry["body"])
 
     if not response.ok:
         print("CsvTable - Couldn't download: " + url, file=sys.stderr)
         return
 
+    if cache is not None:
+        cache.set(url, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
     return StringIO(response.text)
 
 
+def get_session():
+    """
+    Returns the HTTP session that is shared by all downloads. Its connections are pooled and failed requests are
+    retried.
+
+    :return: The session
+    :rtype: requests.Session
+    """
+    global SESSION
+    with LOCK:
+        if SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retries = Retry(total=URL_RETRIES, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+            adapter = HTTPAdapter(max_retries=retries, pool_maxsize=PREFETCH_WORKERS)
+            SESSION = requests.Session()
+            SESSION.mount("http://", adapter)
+            SESSION.mount("https://", adapter)
+        return SESSION
+
+
+@instrumented("prefetch_sources")
+def prefetch_sources(document, fmt, meta, directory=None):
+    """
+    Reads the CSV sources of all tables in the document at the same time so that the total time is roughly the time of
+    the slowest source. The content is used by :func:`get_csv` later. Sources that can't be read are ignored here, so
+    that the error is reported when the table is created. The content belongs to this document only, so a source that
+    changes between two documents is read again.
+
+    :param document: The document
+    :type document: list | dict
+    :param fmt: The target output format
+    :type fmt: str
+    :param meta: The metadata of the document.
+    :type meta: dict[str, str]
+    :param directory: The directory that relative paths are resolved against
+    :type directory: str | None
+    :return: The content of the sources with the url or the absolute path of the file as key (see
+      :func:`get_source_key`)
+    :rtype: dict[str, str]
+    """
+    sources = collect_sources(document, fmt, meta, directory)
+    prefetched = {}
+    if not sources:
+        return prefetched
+
+    def prefetch(file_name):
+        try:
+            return file_name, read_source(file_name, sources[file_name])
+        except (OSError, UnicodeDecodeError):
+            return file_name, None
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(len(sources), PREFETCH_WORKERS)) as executor:
+        for file_name, csv_result in executor.map(INSTRUMENTATION.bind(prefetch), list(sources)):
+            if csv_result is not None:
+                prefetched[get_source_key(file_name)] = csv_result
+    return prefetched
+
+
+def collect_sources(document, fmt, meta, directory=None):
+    """
+    Returns the files and urls of all tables in the document.
+
+    :param document: The document
+    :type document: list | dict
+    :param fmt: The target output format
+    :type fmt: str
+    :param meta: The metadata of the document.
+    :type meta: dict[str, str]
+    :param directory: The directory that relative paths are resolved against
+    :type directory: str | None
+    :return: The files and urls in the order of their first appearance with the settings of that table
+    :rtype: OrderedDict[str, dict]
+    """
+    sources = OrderedDict()
+
+    for value in collect_tables(document, fmt, meta):
+        settings = generate_settings(map_attributes(value[0][2]), meta, directory)
+        if settings["file_name"] and settings["file_name"] not in sources and get_source_format(settings) == "csv":
+            sources[settings["file_name"]] = settings
+
+    return sources
+
+
+def collect_tables(document, fmt, meta):
+    """
+    Returns the contents of all code blocks in the document that should be converted to a table.
+
+    :param document: The document
+    :type document: list | dict
+    :param fmt: The target output format
+    :type fmt: str
+    :param meta: The metadata of the document.
+    :type meta: dict[str, str]
+    :return: The contents of the code blocks in document order
+    :rtype: list[list]
+    """
+    tables = []
+
+    def collect(key, value, fmt, meta):
+        if check_preconditions(key, value):
+            tables.append(value)
+
+    walk(document, collect, fmt, meta, ELEMENT_TYPES)
+    return tables
+
+
+def build_tables(document, fmt, meta, workers, processes=False, manifest=None, sources=None, directory=None):
+    """
+    Creates all tables of the document in a pool of threads (or processes). If a table can't be created, the error is
+    reported and the code block is left unchanged.
+
+    :param document: The document
+    :type document: list | dict
+    :param fmt: The target output format
+    :type fmt: str
+    :param meta: The metadata of the document.
+    :type meta: dict[str, str]
+    :param workers: The number of threads or processes
+    :type workers: int
+    :param processes: Should the tables be created in processes instead of threads
+    :type processes: bool
+    :param manifest: The manifest with the tables of earlier runs or ``None`` if every table should be created
+    :type manifest: pandocjson.Manifest | None
+    :param sources: The content of the CSV sources that were already read
+    :type sources: dict[str, str] | None
+    :param directory: The directory that relative paths are resolved against
+    :type directory: str | None
+    :return: The created tables with the ``id`` of the content of their code block as key
+    :rtype: dict[int, dict]
+    """
+    tables = collect_tables(document, fmt, meta)
+    results = {}
+    inputs = {}
+
+    if manifest is not None:
+        pending = []
+        for value in tables:
+            settings = generate_settings(map_attributes(value[0][2]), meta, directory)
+            table_inputs = get_inputs(value[1], settings, fmt, sources)
+            table = manifest.get(table_inputs) if table_inputs is not None else None
+            if table is not None:
+                results[id(value)] = table
+            else:
+                inputs[id(value)] = table_inputs
+                pending.append(value)
+        tables = pending
+
+    if not tables:
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=reset_worker)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(value):
+        table_sources = sources
+        if processes and sources:
+            file_name = generate_settings(map_attributes(value[0][2]), meta, directory)["file_name"]
+            key = get_source_key(file_name) if file_name else None
+            table_sources = {key: sources[key]} if key in sources else None
+        create = csv_table if processes else INSTRUMENTATION.bind(csv_table)
+        return executor.submit(create, "CodeBlock", value, fmt, meta, sources=table_sources, directory=directory)
+
+    with executor:
+        futures = [submit(value) for value in tables]
+        for number, (value, future) in enumerate(zip(tables, futures), 1):
+            try:
+                results[id(value)] = future.result()
+                if inputs.get(id(value)) is not None and results[id(value)] is not None:
+                    manifest.set(inputs[id(value)], results[id(value)])
+            except Exception as error:
+                print("CsvTable - Couldn't create table {}: {!r}".format(number, error), file=sys.stderr)
+
+    return results
+
+
+def reset_worker():
+    """
+    Forgets the caches, backends and sessions inherited from the parent process, because they can't be shared.
+    """
+    global SESSION, LOCK
+    LOCK = threading.Lock()
+    CACHES.clear()
+    URL_CACHES.clear()
+    BACKENDS.clear()
+    MANIFESTS.clear()
+    SESSION = None
+
+
 def get_reader(file, settings):
     """
     Returns the CSV reader for a file.
 
-    :param file: The file for the CSV content.
-    :type file: io.StringIO
+    :param file: The lines of the CSV content.
+    :type file: collections.Iterator[str]
     :param settings: The paired attributes for the code which can contain "delimiter" and "quotechar" settings.
     :return: The CSV reader
     :rtype: csv.reader
@@ -230,17 +1146,96 @@ def get_reader(file, settings):
 
 def get_header(reader, settings):
     """
-    Returns the content of the header already formatted if a header exists.
+    Returns the header row if a header exists.
 
     :param reader: The csv reader
     :type reader: csv.reader
     :param settings: A dictionary with settings for this script. This method uses the "header" setting.
     :type settings: dict[str, str]
-    :return: A list of the header row with the cell content as elements used by pandoc or an empty list if no header
-    :rtype: list
+    :return: A list of the header row with the cell content as string elements or an empty list if no header (or the
+      table is empty)
+    :rtype: list[str]
     """
     header_enabled = settings["header"] and settings["header"] != "no"
-    return get_row(next(reader), settings) if header_enabled else []
+    return next(reader, []) if header_enabled else []
+
+
+def select_rows(reader, settings):
+    """
+    Returns only the rows selected by the settings. The other rows are skipped while reading.
+    The "rows" setting is a range of row numbers (starting at 1, both ends included) like "1:50", "10:" or "5".
+    The "skip" setting is the number of rows to skip and the "limit" setting the maximal number of rows after that.
+
+    :param reader: The csv reader (after the header was read)
+    :type reader: csv.reader
+    :param settings: A dictionary with settings for this script. This method uses the "rows", "skip" and "limit"
+      settings.
+    :type settings: dict[str, str]
+    :return: The selected rows
+    :rtype: collections.Iterator[list[str]]
+    """
+    start, stop = 0, None
+
+    if settings.get("rows"):
+        first, separator, last = settings["rows"].partition(":")
+        start = max(int(convert_to_float(first, 1)) - 1, 0)
+        if not separator:
+            stop = start + 1
+        elif last.strip():
+            stop = max(int(convert_to_float(last, 0)), start)
+
+    start += int(convert_to_float(settings.get("skip", ""), 0))
+    if settings.get("limit"):
+        limit = start + int(convert_to_float(settings["limit"], 0))
+        stop = limit if stop is None else min(stop, limit)
+
+    if start == 0 and stop is None:
+        return reader
+    return islice(reader, start, stop)
+
+
+def get_columns(header_row, settings, report=True):
+    """
+    Returns the indices of the columns selected with the "columns" setting. The columns are separated by commas and can
+    be names from the header or column numbers (starting at 1).
+
+    :param header_row: The header row or an empty list if there is no header
+    :type header_row: list[str]
+    :param settings: A dictionary with settings for this script. This method uses the "columns" setting.
+    :type settings: dict[str, str]
+    :param report: Should columns that don't exist be reported
+    :type report: bool
+    :return: The indices of the selected columns or ``None`` if all columns should be used
+    :rtype: list[int] | None
+    """
+    if not settings.get("columns"):
+        return None
+
+    names = [name.strip() for name in header_row]
+    columns = []
+    for column in settings["columns"].split(","):
+        column = column.strip()
+        if column in names:
+            columns.append(names.index(column))
+        elif column.isdigit() and int(column) > 0:
+            columns.append(int(column) - 1)
+        elif report:
+            print("CsvTable - Couldn't find column: " + column, file=sys.stderr)
+    return columns
+
+
+def select_columns(row, columns):
+    """
+    Returns only the selected cells of a row. Missing cells are empty.
+
+    :param row: The row with the cell content as string elements
+    :type row: list[str]
+    :param columns: The indices of the selected columns
+    :type columns: list[int]
+    :return: The selected cells
+    :rtype: list[str]
+    """
+    return [row[index] if index < len(row) else "" for index in columns]
 
 
 def get_row(row, settings):
@@ -252,7 +1247,180 @@ def get_row(row, settings):
     :return: A list of the row with the cell content as elements used by pandoc
     :rtype: list[list]
     """
-    return [format_cell(elem, settings) for elem in row]
+    return format_rows([row], settings)[1][0]
+
+
+def get_chunks(reader, size):
+    """
+    Splits the rows of the reader into chunks while they are read.
+
+    :param reader: The csv reader
+    :type reader: csv.reader
+    :param size: The number of rows in a chunk
+    :type size: int
+    :return: The chunks of rows
+    :rtype: collections.Iterator[list[list[str]]]
+    """
+    chunk = list(islice(reader, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(reader, size))
+
+
+@instrumented("format_rows")
+def format_rows(rows, settings, caption="", header_rows=0):
+    """
+    Returns the content of many rows already formatted. The type of every column is inferred from the rows (see
+    :func:`get_column_types`) and the cells of columns with numbers, check marks or boolean values are created
+    directly. All other cells (and the caption) are converted together.
+
+    :param rows: The rows with the cell content as string elements
+    :type rows: list[list[str]]
+    :param settings: A dictionary with settings for this script. This method uses the "fast_path" and
+      "number_format" settings and updates the "column_types" setting.
+    :type settings: dict[str, str]
+    :param caption: The caption of the table that should be converted together with the rows
+    :type caption: str
+    :param header_rows: The number of rows at the start that are header rows and are ignored for the column types
+    :type header_rows: int
+    :return: The inline elements of the caption and the rows with the cell content as elements used by pandoc
+    :rtype: (list, list[list[list]])
+    """
+    fast_path = settings.get("fast_path", "yes") != "no"
+    column_types = get_column_types(rows[header_rows:]) if fast_path or settings.get("number_format") else []
+    settings["column_types"] = merge_column_types(settings.get("column_types"), column_types)
+    rows = format_numbers(rows, column_types, settings, header_rows)
+    column_types = column_types if fast_path else []
+
+    def is_typed(index, column):
+        return index >= header_rows and column < len(column_types) and column_types[column] != "text"
+
+    segments = [caption] + [colorize_cell(elem, settings) for index, row in enumerate(rows)
+                            for column, elem in enumerate(row) if not is_typed(index, column)]
+    converted = iter(convert_segments(segments, settings))
+
+    caption = get_inlines(next(converted))
+    return caption, [[get_typed_cell(elem, column_types[column], settings) if is_typed(index, column)
+                      else get_cell(next(converted)) for column, elem in enumerate(row)]
+                     for index, row in enumerate(rows)]
+
+
+def get_column_types(rows):
+    """
+    Infers the type of every column from the cells of the rows: "number" if all cells are numbers, "marker" if they
+    are check or cross marks (see :data:`MARKERS`), "boolean" if they are boolean values like "yes" or "no" and "text"
+    otherwise. Empty cells are ignored and columns that only contain empty cells are "empty".
+
+    :param rows: The rows with the cell content as string elements
+    :type rows: list[list[str]]
+    :return: The types of the columns
+    :rtype: list[str]
+    """
+    column_types = []
+    for column in range(max(len(row) for row in rows) if rows else 0):
+        cells = [row[column] for row in rows if column < len(row) and row[column].strip()]
+        if not cells:
+            column_types.append("empty")
+        elif all(NUMBER.match(cell.strip()) for cell in cells):
+            column_types.append("number")
+        elif all(cell in MARKERS for cell in cells):
+            column_types.append("marker")
+        elif all(cell.strip() in BOOLEAN for cell in cells):
+            column_types.append("boolean")
+        else:
+            column_types.append("text")
+    return column_types
+
+
+def merge_column_types(previous, current):
+    """
+    Combines the column types of two batches of rows of the same table. A column keeps its type only if it has the
+    same type (or is empty) in both batches.
+
+    :param previous: The types of the earlier rows or ``None``
+    :type previous: list[str] | None
+    :param current: The types of the current rows
+    :type current: list[str]
+    :return: The types of the columns of all rows
+    :rtype: list[str]
+    """
+    if previous is None:
+        return current
+
+    merged = []
+    for column in range(max(len(previous), len(current))):
+        before = previous[column] if column < len(previous) else "empty"
+        after = current[column] if column < len(current) else "empty"
+        merged.append(after if before in [after, "empty"] else before if after == "empty" else "text")
+    return merged
+
+
+def get_typed_cell(content, column_type, settings):
+    """
+    Creates the cell of a column with numbers, check marks or boolean values the same way pandoc would.
+
+    :param content: The cell content
+    :type content: str
+    :param column_type: The type of the column (see :func:`get_column_types`)
+    :type column_type: str
+    :param settings: A dictionary with settings for this script. This method uses the "colorize" setting.
+    :type settings: dict[str, str]
+    :return: Returns either an empty list (if content is empty) or with one "Plain" element
+    :rtype: list
+    """
+    content = content.strip() if column_type != "marker" else content
+    if not content:
+        return []
+    if column_type != "marker":
+        return [Plain([Str(content)])]
+
+    inlines, color = MARKERS[content]
+    if settings.get("colorize") in ["yes", "1"]:
+        return [Plain(inlines + [RawInline("tex", color)])]
+    return [Plain(list(inlines))]
+
+
+def format_numbers(rows, column_types, settings, header_rows=0):
+    """
+    Formats the cells of the columns with numbers with the "number_format" setting. Numbers in other columns (e.g. an
+    ID like "007" in a column with text) are kept as they are.
+
+    :param rows: The rows with the cell content as string elements
+    :type rows: list[list[str]]
+    :param column_types: The types of the columns (see :func:`get_column_types`)
+    :type column_types: list[str]
+    :param settings: A dictionary with settings for this script. This method uses the "number_format" setting.
+    :type settings: dict[str, str]
+    :param header_rows: The number of rows at the start that are header rows and aren't formatted
+    :type header_rows: int
+    :return: The rows with the formatted numbers
+    :rtype: list[list[str]]
+    """
+    number_format = settings.get("number_format")
+    if not number_format or "number" not in column_types:
+        return rows
+    return rows[:header_rows] + [[format_number(cell, number_format)
+                                  if column < len(column_types) and column_types[column] == "number" else cell
+                                  for column, cell in enumerate(row)] for row in rows[header_rows:]]
+
+
+def format_number(content, number_format):
+    """
+    Formats the cell content if it is a number (e.g. with the format ",.2f" the content "1234.5" becomes "1,234.50").
+
+    :param content: The cell content
+    :type content: str
+    :param number_format: The format specification as used by :func:`format`
+    :type number_format: str
+    :return: The formatted number or the unchanged content if it isn't a number or the format is invalid
+    :rtype: str
+    """
+    if not NUMBER.match(content.strip()):
+        return content
+    try:
+        return format(float(content), number_format)
+    except ValueError:
+        return content
 
 
 def format_cell(content, settings):
@@ -265,25 +1433,667 @@ def format_cell(content, settings):
     :return: Returns either an empty list (if content is empty) or with one "Plain" element with the JSON as content
     :rtype: list
     """
+    return get_cell(convert_segments([colorize_cell(content, settings)], settings)[0])
+
+
+def colorize_cell(content, settings):
+    """
+    Appends the LaTeX command for the background color of the cell if the "colorize" setting is enabled and the cell
+    only contains a check or cross mark.
+
+    :param content: The cell content
+    :type content: str
+    :param settings: A dictionary with settings for this script. This method uses the "colorize" setting.
+    :type settings: dict[str, str]
+    :return: The cell content with the color command if one applies
+    :rtype: str
+    """
     if settings.get("colorize") in ["yes", "1"]:
-        colors = {
-            "\\cmark": "\\cellcolor{green!25}",
-            "\\xmark": "\\cellcolor{red!25}",
-            "(\\cmark)": "\\cellcolor{orange!25}",
-            "(\\xmark)": "\\cellcolor{orange!25}"
-        }
-        content = content + colors.get(content.strip(), "")
+        marker = MARKERS.get(content.strip())
+        if marker is not None:
+            content = content + marker[1]
+    return content
 
-    result = json.loads(pypandoc.convert(content, format='md', to="json"))
-    return [Plain(result[1][0]["c"])] if result[1] else []
 
+def get_cell(blocks):
+    """
+    Returns the cell as used in a pandoc table from the converted cell content.
 
-def get_caption(settings):
-    if settings["caption"]:
-        result = json.loads(pypandoc.convert(settings["caption"], format='md', to="json"))
-        return result[1][0]["c"]
-    else:
+    :param blocks: The blocks that pandoc created for the cell content
+    :type blocks: list[dict]
+    :return: Returns either an empty list (if there are no blocks) or with one "Plain" element with the JSON as content
+    :rtype: list
+    """
+    return [Plain(blocks[0]["c"])] if blocks else []
+
+
+def get_inlines(blocks):
+    """
+    Returns the inline elements of the first block (e.g. for the caption of a table).
+
+    :param blocks: The blocks that pandoc created for the content
+    :type blocks: list[dict]
+    :return: The inline elements or an empty list if there are no blocks
+    :rtype: list
+    """
+    return blocks[0]["c"] if blocks else []
+
+
+def convert_markdown(content, backend=None):
+    """
+    Converts markdown to the blocks of the JSON structure used by pandoc.
+
+    :param content: The markdown content
+    :type content: str
+    :param backend: The backend that runs pandoc (by default a new pandoc process is started for the conversion)
+    :type backend: SubprocessBackend | None
+    :return: The blocks of the converted document
+    :rtype: list[dict]
+    """
+    return get_blocks(json.loads((backend or SubprocessBackend()).convert(content)))
+
+
+@instrumented("convert_segments")
+def convert_segments(segments, settings):
+    """
+    Converts many markdown segments (e.g. all cells of a table) with a single call to pandoc.
+    Segments that only contain plain text are tokenized without pandoc (see :func:`tokenize_plain`) unless the
+    "fast_path" setting is "no". The remaining segments are joined to one document with a separator paragraph between
+    them and the resulting blocks are split at these separators again. If the number of segments doesn't match
+    afterwards (e.g. a cell contains an unclosed code fence or the separator itself), every segment is converted on
+    its own. Segments with link reference or footnote definitions (see :data:`DEFINITION`) are always converted on
+    their own, so that the definitions don't apply to the other segments.
+
+    :param segments: The markdown segments
+    :type segments: list[str]
+    :param settings: A dictionary with settings for this script. This method uses the "fast_path" setting.
+    :type settings: dict[str, str]
+    :return: A list with the blocks for every segment
+    :rtype: list[list[dict]]
+    """
+    fast_path = settings.get("fast_path", "yes") != "no"
+    result = [tokenize_plain(segment) if fast_path else None for segment in segments]
+    remaining = [segment for segment, blocks in zip(segments, result) if blocks is None]
+    if not remaining:
+        return result
+
+    converted = iter(convert_cached(remaining, get_cache(settings), get_backend(settings)))
+    return [next(converted) if blocks is None else blocks for blocks in result]
+
+
+def convert_cached(segments, cache, backend):
+    """
+    Converts the markdown segments that couldn't be tokenized. Segments that were converted before are taken from the
+    cache and every other segment is only converted once.
+
+    :param segments: The markdown segments
+    :type segments: list[str]
+    :param cache: The cache for the conversions or ``None`` if no cache should be used
+    :type cache: ConversionCache | None
+    :param backend: The backend that runs pandoc
+    :type backend: SubprocessBackend
+    :return: A list with the blocks for every segment
+    :rtype: list[list[dict]]
+    """
+    if cache is None:
+        return convert_remaining(segments, backend)
+
+    result = [cache.get(segment) for segment in segments]
+    missing = list(OrderedDict.fromkeys(segment for segment, blocks in zip(segments, result) if blocks is None))
+
+    converted = dict(zip(missing, convert_remaining(missing, backend)))
+    cache.update(converted)
+    return [converted[segment] if blocks is None else blocks for segment, blocks in zip(segments, result)]
+
+
+@instrumented("pandoc")
+def convert_remaining(segments, backend):
+    """
+    Converts the markdown segments with a single call to pandoc.
+
+    :param segments: The markdown segments
+    :type segments: list[str]
+    :param backend: The backend that runs pandoc
+    :type backend: SubprocessBackend
+    :return: A list with the blocks for every segment
+    :rtype: list[list[dict]]
+    """
+    if not segments:
+        return []
+
+    alone = [bool(DEFINITION.search(segment)) for segment in segments]
+    joined = [segment for segment, separate in zip(segments, alone) if not separate]
+    if joined and not any(CELL_SEPARATOR in segment for segment in joined):
+        separator = "\n\n{}\n\n".format(CELL_SEPARATOR)
+        converted = split_segments(convert_markdown(separator.join(joined), backend))
+        if len(converted) == len(joined):
+            converted = iter(converted)
+            separated = iter(convert_separately([segment for segment, separate in zip(segments, alone) if separate],
+                                                backend))
+            return [next(separated) if separate else next(converted) for separate in alone]
+
+    return convert_separately(segments, backend)
+
+
+def convert_separately(segments, backend):
+    """
+    Converts every markdown segment with its own call to pandoc.
+
+    :param segments: The markdown segments
+    :type segments: list[str]
+    :param backend: The backend that runs pandoc
+    :type backend: SubprocessBackend
+    :return: A list with the blocks for every segment
+    :rtype: list[list[dict]]
+    """
+    converted = iter(backend.convert_many([segment for segment in segments if segment]))
+    return [get_blocks(json.loads(next(converted))) if segment else [] for segment in segments]
+
+
+def tokenize_plain(content):
+    """
+    Creates the blocks for content without any markdown or LaTeX syntax the same way pandoc would: the words are
+    separated by spaces. Content that could be interpreted differently by pandoc (e.g. because of a list marker at the
+    start, an abbreviation or smart punctuation) is not tokenized.
+
+    :param content: The markdown content
+    :type content: str
+    :return: A list with a "Para" element containing the words or ``None`` if pandoc is needed for the content
+    :rtype: list[dict] | None
+    """
+    if not PLAIN_TEXT.match(content) or "--" in content or "..." in content:
+        return None
+
+    indentation = len(content) - len(content.lstrip(" "))
+    if indentation > 3 or content.lstrip(" ").startswith("%"):
+        return None
+
+    words = content.split()
+    if not words:
         return []
+    if LIST_MARKER.match(words[0]) or any(word.endswith(".") for word in words[:-1]):
+        return None
+
+    inlines = [Str(words[0])]
+    for word in words[1:]:
+        inlines += [Space(), Str(word)]
+    return [Para(inlines)]
+
+
+def split_segments(blocks):
+    """
+    Splits the blocks of a document at the separator paragraphs.
+
+    :param blocks: The blocks of the document
+    :type blocks: list[dict]
+    :return: A list with the blocks between the separators
+    :rtype: list[list[dict]]
+    """
+    separator = {"t": "Para", "c": [{"t": "Str", "c": CELL_SEPARATOR}]}
+    result = [[]]
+    for block in blocks:
+        if block == separator:
+            result.append([])
+        else:
+            result[-1].append(block)
+    return result
+
+
+def get_cache(settings):
+    """
+    Returns the conversion cache for the settings. By default the conversions are kept in memory and in a database in
+    the cache directory of the user (``$XDG_CACHE_HOME/pandocfilter``).
+
+    :param settings: A dictionary with settings for this script.
+      This method uses the "cache" ("yes", "memory" or "no"), "cache_dir" and "cache_size" (in MB) settings.
+    :type settings: dict[str, str]
+    :return: The conversion cache or ``None`` if caching is disabled
+    :rtype: ConversionCache | None
+    """
+    mode = settings.get("cache", "yes")
+    if mode == "no":
+        return None
+
+    path = None
+    if mode != "memory":
+        path = os.path.abspath(os.path.join(settings.get("cache_dir") or get_cache_dir(), "csvtable.sqlite"))
+
+    with LOCK:
+        if path not in CACHES:
+            disk_size = convert_to_float(settings.get("cache_size", ""), CACHE_DISK_SIZE / 1024.0 ** 2) * 1024 ** 2
+            CACHES[path] = ConversionCache(path, disk_size=int(disk_size))
+        return CACHES[path]
+
+
+class ConversionCache(object):
+    """
+    Cache for markdown that was converted to the JSON structure used by pandoc. The conversions are kept in a LRU
+    cache in memory and optionally in a SQLite database so that they can be reused by later runs. The entries are keyed
+    by the markdown, the input format and the pandoc version and evicted when the caches exceed their size.
+    """
+
+    def __init__(self, path=None, memory_size=CACHE_MEMORY_SIZE, disk_size=CACHE_DISK_SIZE, version=None):
+        """
+        :param path: The path of the database or ``None`` to only keep the conversions in memory
+        :type path: str | None
+        :param memory_size: The maximal size of the serialized entries in memory
+        :type memory_size: int
+        :param disk_size: The maximal size of the serialized entries in the database
+        :type disk_size: int
+        :param version: The version of pandoc or ``None`` if it should be detected
+        :type version: str | None
+        """
+        self.memory = OrderedDict()
+        self.memory_size = memory_size
+        self.memory_used = 0
+        self.disk_size = disk_size
+        self.version = version
+        self.connection = self.connect(path) if path else None
+        self.accessed = {}
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def connect(path):
+        return connect_database(path, "CREATE TABLE IF NOT EXISTS conversions "
+                                      "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL)", "CsvTable")
+
+    def key(self, content, input_format):
+        if self.version is None:
+            self.version = get_pandoc_version()
+        text = "\0".join([self.version, input_format, content])
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get(self, content, input_format="md"):
+        """
+        Returns the cached conversion for the markdown.
+
+        :param content: The markdown content
+        :type content: str
+        :param input_format: The format of the content
+        :type input_format: str
+        :return: The blocks of the converted content or ``None`` if the content wasn't converted before
+        :rtype: list[dict] | None
+        """
+        with self.lock:
+            key = self.key(content, input_format)
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                self.record("memory_hits")
+                return json.loads(value)
+
+            if self.connection is not None:
+                row = self.connection.execute("SELECT value FROM conversions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.accessed[key] = time.time()
+                    self.remember(key, row[0])
+                    self.record("disk_hits")
+                    return json.loads(row[0])
+
+            self.record("misses")
+            return None
+
+    def record(self, outcome):
+        self.stats[outcome] += 1
+        INSTRUMENTATION.count("cache_" + outcome)
+
+    def update(self, conversions, input_format="md"):
+        """
+        Adds conversions to the cache and writes them (together with the access times of entries that were read from
+        the database) to the database.
+
+        :param conversions: The blocks of the converted content for each markdown content
+        :type conversions: dict[str, list[dict]]
+        :param input_format: The format of the content
+        :type input_format: str
+        """
+        with self.lock:
+            entries = []
+            for content, blocks in conversions.items():
+                key, value = self.key(content, input_format), json.dumps(blocks)
+                self.remember(key, value)
+                entries.append((key, value, len(value), time.time()))
+
+            if self.connection is None or not (entries or self.accessed):
+                return
+
+            accessed = [(accessed, key) for key, accessed in self.accessed.items()]
+            self.accessed = {}
+            try:
+                self.connection.executemany("UPDATE conversions SET accessed = ? WHERE key = ?", accessed)
+                self.connection.executemany("INSERT OR REPLACE INTO conversions VALUES (?, ?, ?, ?)", entries)
+                self.evict()
+                self.connection.commit()
+            except sqlite3.Error as error:
+                self.connection.rollback()
+                print("CsvTable - Couldn't write to cache: {}".format(error), file=sys.stderr)
+
+    def remember(self, key, value):
+        if key in self.memory:
+            self.memory_used -= len(self.memory.pop(key))
+        self.memory[key] = value
+        self.memory_used += len(value)
+        while self.memory_used > self.memory_size and self.memory:
+            self.memory_used -= len(self.memory.popitem(last=False)[1])
+
+    def evict(self):
+        excess = self.connection.execute("SELECT TOTAL(size) FROM conversions").fetchone()[0] - self.disk_size
+        if excess <= 0:
+            return
+
+        keys = []
+        for key, size in self.connection.execute("SELECT key, size FROM conversions ORDER BY accessed, rowid"):
+            if excess <= 0:
+                break
+            keys.append((key,))
+            excess -= size
+        self.connection.executemany("DELETE FROM conversions WHERE key = ?", keys)
+
+
+@instrumented("pandoc_version")
+def get_pandoc_version():
+    """
+    Returns the version of pandoc for the keys of the conversion cache. This runs ``pandoc --version`` (unless pypandoc
+    already knows the version).
+
+    :return: The version
+    :rtype: str
+    """
+    import pypandoc
+
+    INSTRUMENTATION.count("pandoc_processes")
+    return pypandoc.get_pandoc_version()
+
+
+def get_url_cache(settings):
+    """
+    Returns the cache for downloaded CSV files. It is stored in the same directory as the conversion cache.
+
+    :param settings: A dictionary with settings for this script. This method uses the "url_cache" ("yes" or "no"),
+      "cache_dir", "url_max_age" (in seconds, by default every entry is revalidated) and "offline" settings.
+    :type settings: dict[str, str]
+    :return: The cache or ``None`` if caching is disabled
+    :rtype: UrlCache | None
+    """
+    if settings.get("url_cache", "yes") == "no":
+        return None
+
+    path = os.path.abspath(os.path.join(settings.get("cache_dir") or get_cache_dir(), "csvtable-urls.sqlite"))
+    max_age = convert_to_float(settings.get("url_max_age", ""))
+    offline = settings.get("offline", "no") in ["yes", "1"]
+
+    key = (path, max_age, offline)
+    with LOCK:
+        if key not in URL_CACHES:
+            URL_CACHES[key] = UrlCache(path, max_age, offline)
+        return URL_CACHES[key]
+
+
+class UrlCache(object):
+    """
+    Cache for downloaded CSV files. Besides the content the ETag and modification date of the response are stored, so
+    that the file can be revalidated with a conditional request.
+    """
+
+    def __init__(self, path, max_age=0.0, offline=False):
+        """
+        :param path: The path of the database
+        :type path: str
+        :param max_age: The time in seconds that an entry is used without revalidation
+        :type max_age: float
+        :param offline: Should cached entries be used regardless of their age without any requests
+        :type offline: bool
+        """
+        self.max_age = max_age
+        self.offline = offline
+        self.connection = connect_database(path, "CREATE TABLE IF NOT EXISTS responses "
+                                                 "(url TEXT PRIMARY KEY, body TEXT, etag TEXT, last_modified TEXT, "
+                                                 "fetched REAL)", "CsvTable")
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Returns the cached entry for the url.
+
+        :param url: The url of the file
+        :type url: str
+        :return: The entry with the keys "body", "etag", "last_modified" and "fetched" or ``None``
+        :rtype: dict | None
+        """
+        if self.connection is None:
+            return None
+        with self.lock:
+            row = self.connection.execute("SELECT body, etag, last_modified, fetched FROM responses WHERE url = ?",
+                                          (url,)).fetchone()
+        return dict(zip(["body", "etag", "last_modified", "fetched"], row)) if row else None
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched"] < self.max_age
+
+    def set(self, url, body, etag=None, last_modified=None):
+        """
+        Stores the content of a downloaded file.
+
+        :param url: The url of the file
+        :type url: str
+        :param body: The content of the file
+        :type body: str
+        :param etag: The ETag header of the response
+        :type etag: str | None
+        :param last_modified: The Last-Modified header of the response
+        :type last_modified: str | None
+        """
+        self.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                     (url, body, etag, last_modified, time.time()))
+
+    def refresh(self, url):
+        """
+        Marks the entry as fresh after the server confirmed that it didn't change.
+
+        :param url: The url of the file
+        :type url: str
+        """
+        self.execute("UPDATE responses SET fetched = ? WHERE url = ?", (time.time(), url))
+
+    def execute(self, statement, parameters):
+        if self.connection is None:
+            return
+        with self.lock:
+            try:
+                self.connection.execute(statement, parameters)
+                self.connection.commit()
+            except sqlite3.Error as error:
+                self.connection.rollback()
+                print("CsvTable - Couldn't write to cache: {}".format(error), file=sys.stderr)
+
+
+def get_backend(settings):
+    """
+    Returns the backend that runs pandoc for the conversions. By default a new pandoc process is started for every
+    conversion. With the "server" backend the conversions are spread over pandoc servers that are kept running.
+    If the servers can't be started (or stop working), it falls back to a new process for every conversion.
+
+    :param settings: A dictionary with settings for this script.
+      This method uses the "backend" ("subprocess" or "server"), "workers" and "pandoc_server" settings.
+    :type settings: dict[str, str]
+    :return: The backend
+    :rtype: SubprocessBackend
+    """
+    name = settings.get("backend", "subprocess")
+    workers = max(int(convert_to_float(settings.get("workers", ""), os.cpu_count() or 1)), 1)
+    urls = settings.get("pandoc_server", "").split()
+
+    key = (name, workers, tuple(urls))
+    with LOCK:
+        if key not in BACKENDS:
+            backend = SubprocessBackend()
+            if name == "server":
+                try:
+                    backend = ServerBackend(workers, urls)
+                except (OSError, RuntimeError) as error:
+                    print("CsvTable - Couldn't start pandoc server: {}".format(error), file=sys.stderr)
+            BACKENDS[key] = backend
+        return BACKENDS[key]
+
+
+class SubprocessBackend(object):
+    """
+    Runs a new pandoc process with `pypandoc <https://pypi.python.org/pypi/pypandoc/>`_ for every conversion.
+    """
+
+    def convert(self, content, input_format="md", output_format="json"):
+        """
+        Converts the content with pandoc.
+
+        :param content: The content that should be converted
+        :type content: str
+        :param input_format: The format of the content
+        :type input_format: str
+        :param output_format: The format of the result
+        :type output_format: str
+        :return: The converted content
+        :rtype: str
+        """
+        import pypandoc
+
+        INSTRUMENTATION.count("pandoc_processes")
+        return pypandoc.convert(content, format=input_format, to=output_format)
+
+    def convert_many(self, contents, input_format="md", output_format="json"):
+        """
+        Converts every content with pandoc.
+
+        :param contents: The contents that should be converted
+        :type contents: list[str]
+        :param input_format: The format of the contents
+        :type input_format: str
+        :param output_format: The format of the results
+        :type output_format: str
+        :return: The converted contents in the same order
+        :rtype: list[str]
+        """
+        return [self.convert(content, input_format, output_format) for content in contents]
+
+    def close(self):
+        pass
+
+
+class ServerBackend(SubprocessBackend):
+    """
+    Spreads the conversions over a number of pandoc servers (``pandoc-server``) that are started once and kept running
+    until the end of the script. The requests are sent from a pool of threads so that the servers work in parallel.
+    If a request fails, the content is converted by a new pandoc process instead. After a server couldn't be reached
+    all further conversions use pandoc processes.
+    """
+
+    def __init__(self, workers, urls=None, timeout=10.0, request_timeout=SERVER_TIMEOUT):
+        """
+        :param workers: The number of servers and threads
+        :type workers: int
+        :param urls: The urls of servers that are already running. If empty, new servers will be started.
+        :type urls: list[str] | None
+        :param timeout: The time in seconds to wait for a new server to accept connections
+        :type timeout: float
+        :param request_timeout: The time in seconds to wait for a conversion
+        :type request_timeout: float
+        """
+        import requests
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.processes = []
+        self.urls = list(urls or [])
+        self.session = requests.Session()
+        self.request_timeout = request_timeout
+        self.fallback = SubprocessBackend()
+        self.failed = False
+        self.counter = 0
+        self.lock = threading.Lock()
+        self.executor = None
+
+        try:
+            if not self.urls:
+                self.urls = [self.start_server(timeout) for _ in range(workers)]
+        except (OSError, RuntimeError):
+            self.close()
+            raise
+
+        self.executor = ThreadPoolExecutor(max_workers=max(workers, len(self.urls)))
+
+    def start_server(self, timeout):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        import pypandoc
+
+        executable = shutil.which("pandoc-server")
+        command = [executable] if executable else [pypandoc.get_pandoc_path(), "server"]
+        process = subprocess.Popen(command + ["--port", str(port)],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        INSTRUMENTATION.count("pandoc_servers")
+        self.processes.append(process)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("pandoc server exited with code {}".format(process.returncode))
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                return "http://127.0.0.1:{}".format(port)
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("pandoc server didn't accept connections after {} seconds".format(timeout))
+
+    def next_url(self):
+        with self.lock:
+            self.counter += 1
+            return self.urls[self.counter % len(self.urls)]
+
+    def convert(self, content, input_format="md", output_format="json"):
+        if not self.failed:
+            try:
+                return self.request(content, input_format, output_format)
+            except (OSError, RuntimeError, ValueError) as error:
+                print("CsvTable - Couldn't convert with pandoc server, using pandoc instead: {}".format(error),
+                      file=sys.stderr)
+                self.failed = self.failed or isinstance(error, OSError)
+        return self.fallback.convert(content, input_format, output_format)
+
+    def request(self, content, input_format, output_format):
+        request = {
+            "text": content,
+            "from": PANDOC_FORMATS.get(input_format, input_format),
+            "to": output_format,
+            "standalone": output_format == "json"
+        }
+        response = self.session.post(self.next_url(), json=request, headers={"Accept": "application/json"},
+                                     timeout=self.request_timeout)
+        INSTRUMENTATION.count("pandoc_requests")
+        if not response.ok:
+            raise RuntimeError("pandoc server couldn't convert the content: " + response.text)
+        return response.json()["output"]
+
+    def convert_many(self, contents, input_format="md", output_format="json"):
+        convert = INSTRUMENTATION.bind(lambda content: self.convert(content, input_format, output_format))
+        return list(self.executor.map(convert, contents))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        for process in self.processes:
+            process.terminate()
+            process.wait()
+        self.processes = []
+
+
+def close_backends():
+    """
+    Stops the backends (e.g. the pandoc servers) that were started by this script.
+    """
+    for backend in BACKENDS.values():
+        backend.close()
+    BACKENDS.clear()
 
 
 def get_alignment(settings):
@@ -293,14 +2103,18 @@ def get_alignment(settings):
     Pads the provided values if they don't exist or not of the required length with the default value.
 
     :type settings: object
-    :param settings: A dictionary with settings for this script.
-      This method uses the "column_number" and "alignment" settings.
+    :param settings: A dictionary with settings for this script. This method uses the "column_number" and
+      "alignment" settings and with the "auto_align" setting the "column_types" to right-align columns with numbers.
     :type settings: dict[str, str | int]
     :return: The list with alignments
     :rtype: list
     """
     alignment = list(settings["alignment"])
     alignment = pad_element(alignment, settings["column_number"], "d")
+    if settings.get("auto_align") in ["yes", "1"]:
+        column_types = settings.get("column_types") or []
+        alignment = ["r" if key.lower() == "d" and column < len(column_types) and column_types[column] == "number"
+                     else key for column, key in enumerate(alignment)]
     return [ALIGNMENT.get(key.lower(), ALIGNMENT["d"]) for key in alignment]
 
 
@@ -358,7 +2172,7 @@ def convert_to_float(text, default=0.0):
     """
     try:
         return float(text)
-    except ValueError:
+    except (TypeError, ValueError):
         return default
 
 
@@ -369,21 +2183,106 @@ def parse_arguments():
     :return: The arguments from the command line.
     :rtype: argparse.Namespace
     """
+    import argparse
+
     parser = argparse.ArgumentParser(description=__doc__,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument("-v", '--version', action='version', version='%(prog)s ' + __VERSION__)
+    parser.add_argument("format", nargs="?", default="", help="The target output format (provided by pandoc)")
+    parser.add_argument("-j", "--parallel", type=int, metavar="WORKERS",
+                        help="Create the tables in parallel with this number of workers")
+    parser.add_argument("--processes", action="store_true", help="Use processes instead of threads as workers")
 
-    return parser.parse_args()
+    return parser.parse_known_args()[0]
 
 
-def main():
+def main(arguments=None):
     """
     This is the main method that gets data from stdin,
     applies the filter and returns the result to stdout.
+
+    :param arguments: The arguments from the command line. Without them the first argument is the output format.
+    :type arguments: argparse.Namespace | None
+    """
+    def apply(document, fmt, meta):
+        workers, processes = get_parallel_settings(arguments, meta)
+        try:
+            return walk(document, prepare(document, fmt, meta, workers, processes), fmt, meta, ELEMENT_TYPES)
+        finally:
+            close_resources()
+
+    run_filter("CsvTable", apply, arguments.format if arguments else None, ELEMENT_TYPES)
+
+
+def prepare(document, fmt, meta, workers=0, processes=False, directory=None):
+    """
+    Prepares the filter for a document: the CSV sources are read and the tables are created in parallel if there is
+    more than one worker. In an incremental build the unchanged tables are taken from the manifest. The content of the
+    sources is only kept for this document.
+
+    :param document: The document
+    :type document: list | dict
+    :param fmt: The target output format
+    :type fmt: str
+    :param meta: The metadata of the document.
+    :type meta: dict[str, str]
+    :param workers: The number of threads or processes that create the tables
+    :type workers: int
+    :param processes: Should the tables be created in processes instead of threads
+    :type processes: bool
+    :param directory: The directory that relative paths are resolved against (by default the working directory)
+    :type directory: str | None
+    :return: The action that replaces the code blocks with tables while walking the document
+    :rtype: callable
+    """
+    manifest = get_manifest(meta, directory)
+    sources = prefetch_sources(document, fmt, meta, directory)
+    if workers <= 1:
+        return partial(csv_table, manifest=manifest, sources=sources, directory=directory)
+
+    tables = build_tables(document, fmt, meta, workers, processes, manifest, sources, directory)
+
+    def action(key, value, fmt, meta):
+        return tables.get(id(value)) if check_preconditions(key, value) else None
+
+    return action
+
+
+def close_resources(backends=True):
+    """
+    Stops the backends and writes the manifests after a document was filtered.
+
+    :param backends: Should the backends be stopped (they can be kept running for later documents)
+    :type backends: bool
+    """
+    if backends:
+        close_backends()
+    for manifest in MANIFESTS.values():
+        manifest.close()
+    MANIFESTS.clear()
+
+
+def get_parallel_settings(arguments, meta):
+    """
+    Returns the number of workers that create the tables and if they are processes. The command line arguments take
+    precedence over the "parallel" and "parallel_mode" ("threads" or "processes") settings in the metadata.
+
+    :param arguments: The arguments from the command line
+    :type arguments: argparse.Namespace | None
+    :param meta: The metadata of the document.
+    :type meta: dict[str, str]
+    :return: The number of workers and if processes should be used
+    :rtype: (int, bool)
     """
-    toJSONFilter(csv_table)
+    settings = DOCUMENT_SETTINGS.resolve_meta(meta)
+    workers = int(convert_to_float(settings["parallel"], 0))
+    processes = settings["parallel_mode"] == "processes"
+    if arguments is not None and arguments.parallel is not None:
+        workers = arguments.parallel
+    if arguments is not None and arguments.processes:
+        processes = True
+    return workers, processes
 
 
 if __name__ == '__main__':
-    # parse_arguments()
-    main()
+    main(None if started_by_pandoc() else parse_arguments())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Thin client that passes a pandoc document to the filter daemon and relays the result.
+
+Use it instead of the filters with ``pandoc --filter pandocfilter/filterclient.py``. The document is sent to the
+daemon (see filterdaemon.py) over a Unix socket, so the filters and their caches don't have to be loaded again for
+every document. If the daemon isn't running, it is started. The filter is chosen with the environment variable
+``PANDOCFILTER_DAEMON_FILTER`` (csvtable, minted or pandocfilter for both filters, which is the default).
+
+This script only imports modules of the standard library that are loaded by the interpreter anyway.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+__VERSION__ = "0.1"
+__AUTHOR__ = "Julien Hadley Jack <git@jlhj.de>"
+
+# The environment variables with the path of the socket and the name of the filter
+SOCKET_VARIABLE = "PANDOCFILTER_SOCKET"
+FILTER_VARIABLE = "PANDOCFILTER_DAEMON_FILTER"
+
+# The filters that the daemon can apply
+FILTERS = ["csvtable", "minted", "pandocfilter"]
+
+# The environment variables of the client that the filters use while the daemon filters the document
+ENVIRONMENT_VARIABLES = ["PANDOCFILTER_TIMINGS", "PANDOCFILTER_TIMINGS_FILE", "PANDOCFILTER_PROFILE"]
+
+# The types of the frames that the daemon sends: output of the filter, messages for stderr and the exit status
+FRAME_STDOUT = b"o"
+FRAME_STDERR = b"e"
+FRAME_EXIT = b"x"
+
+# The header of a frame with its type and the length of the payload
+FRAME_HEADER = struct.Struct(">cI")
+
+# The time in seconds to wait for a daemon that was just started
+START_TIMEOUT = 10.0
+
+
+def get_socket_path():
+    """
+    Returns the path of the socket of the daemon from the environment variable ``PANDOCFILTER_SOCKET`` or the default
+    one in the cache directory of the filters.
+
+    :return: The path of the socket
+    :rtype: str
+    """
+    if os.environ.get(SOCKET_VARIABLE):
+        return os.environ[SOCKET_VARIABLE]
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "pandocfilter", "daemon.sock")
+
+
+def connect(path, start=True):
+    """
+    Connects to the daemon and starts it if it isn't running.
+
+    :param path: The path of the socket
+    :type path: str
+    :param start: Should the daemon be started if it isn't running
+    :type start: bool
+    :return: The connection
+    :rtype: socket.socket
+    :raises OSError: If the daemon couldn't be reached
+    """
+    try:
+        return open_connection(path)
+    except OSError:
+        if not start:
+            raise
+
+    import subprocess
+
+    daemon = os.path.join(os.path.dirname(os.path.abspath(__file__)), "filterdaemon.py")
+    with open(os.devnull, "r+b") as null:
+        subprocess.Popen([sys.executable, daemon, "--socket", path], stdin=null, stdout=null, stderr=null,
+                         start_new_session=True)
+
+    deadline = time.time() + START_TIMEOUT
+    while True:
+        try:
+            return open_connection(path)
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.02)
+
+
+def open_connection(path):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def send_request(connection, name, fmt, data):
+    """
+    Sends a document to the daemon. The request is a line with the filter, the output format, the working directory
+    and the environment variables of the filters as JSON followed by the document. The daemon resolves relative paths
+    against the working directory of the client instead of its own.
+
+    :param connection: The connection to the daemon
+    :type connection: socket.socket
+    :param name: The name of the filter
+    :type name: str
+    :param fmt: The target output format
+    :type fmt: str
+    :param data: The JSON of the document
+    :type data: bytes
+    """
+    environment = dict((key, os.environ[key]) for key in ENVIRONMENT_VARIABLES if key in os.environ)
+    header = {"filter": name, "format": fmt, "directory": os.getcwd(), "environment": environment}
+    connection.sendall(json.dumps(header).encode("utf-8") + b"\n")
+    connection.sendall(data)
+    connection.shutdown(socket.SHUT_WR)
+
+
+def receive_response(connection, stdout, stderr):
+    """
+    Writes the frames from the daemon to stdout and stderr until the exit status arrives.
+
+    :param connection: The connection to the daemon
+    :type connection: socket.socket
+    :param stdout: The binary stream for the output of the filter
+    :type stdout: io.BufferedIOBase
+    :param stderr: The binary stream for the messages
+    :type stderr: io.BufferedIOBase
+    :return: The exit status of the filter
+    :rtype: int
+    """
+    with connection.makefile("rb") as response:
+        while True:
+            header = response.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                raise OSError("The filter daemon closed the connection")
+            frame_type, length = FRAME_HEADER.unpack(header)
+            payload = response.read(length)
+            if frame_type == FRAME_EXIT:
+                return int(payload)
+            (stdout if frame_type == FRAME_STDOUT else stderr).write(payload)
+
+
+def filter_document(data, name="pandocfilter", fmt="", path=None, stdout=None, stderr=None):
+    """
+    Applies a filter of the daemon to a document.
+
+    :param data: The JSON of the document
+    :type data: bytes
+    :param name: The name of the filter
+    :type name: str
+    :param fmt: The target output format
+    :type fmt: str
+    :param path: The path of the socket (by default the one from :func:`get_socket_path`)
+    :type path: str | None
+    :param stdout: The binary stream for the filtered document (by default stdout)
+    :type stdout: io.BufferedIOBase | None
+    :param stderr: The binary stream for the messages of the filter (by default stderr)
+    :type stderr: io.BufferedIOBase | None
+    :return: The exit status of the filter
+    :rtype: int
+    """
+    connection = connect(path or get_socket_path())
+    try:
+        send_request(connection, name, fmt, data)
+        return receive_response(connection, stdout or sys.stdout.buffer, stderr or sys.stderr.buffer)
+    finally:
+        connection.close()
+
+
+def main():
+    """
+    This is the main method that gets data from stdin,
+    lets the daemon apply the filter and returns the result to stdout.
+    """
+    name = os.environ.get(FILTER_VARIABLE) or "pandocfilter"
+    if name not in FILTERS:
+        print("FilterClient - Unknown filter: " + name, file=sys.stderr)
+        sys.exit(2)
+
+    data = sys.stdin.buffer.read()
+    status = filter_document(data, name, sys.argv[1] if len(sys.argv) > 1 else "")
+    sys.stdout.buffer.flush()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
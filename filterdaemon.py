@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Daemon that applies the csvtable and minted filters to the documents sent by filterclient.py.
+
+pandoc starts every filter as a new process, so the filters are loaded again and their caches in memory are lost for
+every document. The daemon keeps the filters, the conversion cache, the HTTP session and the pandoc servers of the
+backend loaded between documents. It listens on a Unix socket, filters documents from several pandoc runs at the same
+time and exits after it wasn't used for some time.
+"""
+
+from __future__ import print_function
+
+import argparse
+import errno
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from functools import partial
+
+import csvtable
+import minted
+import pandocfilter
+from filterclient import (FILTERS, FRAME_EXIT, FRAME_HEADER, FRAME_STDERR, FRAME_STDOUT, get_socket_path,
+                          open_connection)
+from pandocjson import run_filter, walk
+
+__VERSION__ = "0.1"
+__AUTHOR__ = "Julien Hadley Jack <git@jlhj.de>"
+
+# The time in seconds after which the daemon exits if there were no requests
+IDLE_TIMEOUT = 600.0
+
+# The names of the filters used in messages and reports
+FILTER_NAMES = {"csvtable": "CsvTable", "minted": "Minted", "pandocfilter": "PandocFilter"}
+
+
+class FrameWriter(object):
+    """
+    Binary stream that sends everything written to it as frames of one type over the connection to the client.
+    """
+
+    def __init__(self, connection, frame_type):
+        """
+        :param connection: The connection to the client
+        :type connection: socket.socket
+        :param frame_type: The type of the frames (see filterclient.py)
+        :type frame_type: bytes
+        """
+        self.connection = connection
+        self.frame_type = frame_type
+
+    def write(self, data):
+        if len(data):
+            self.connection.sendall(FRAME_HEADER.pack(self.frame_type, len(data)))
+            self.connection.sendall(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class FrameOutput(object):
+    """
+    Text stream for :func:`pandocjson.run_filter` and :func:`print` that sends everything written to it as frames.
+    """
+
+    def __init__(self, connection, frame_type):
+        """
+        :param connection: The connection to the client
+        :type connection: socket.socket
+        :param frame_type: The type of the frames (see filterclient.py)
+        :type frame_type: bytes
+        """
+        self.buffer = FrameWriter(connection, frame_type)
+
+    def write(self, text):
+        return self.buffer.write(text.encode("utf-8"))
+
+    def flush(self):
+        pass
+
+
+class LocalStream(object):
+    """
+    Replacement for stderr that passes the messages of the filters to the stream of the current thread. This way the
+    messages for a document are sent to the client that requested it. Messages of other threads (e.g. the workers that
+    create tables in parallel) go to the original stream.
+    """
+
+    def __init__(self, default):
+        """
+        :param default: The original stream
+        :type default: io.TextIOBase
+        """
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def stream(self):
+        return getattr(self.local, "stream", None) or self.default
+
+    def write(self, text):
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads a document from the client, applies the filter and sends the result back in frames.
+    """
+
+    def handle(self):
+        local = sys.stderr.local if isinstance(sys.stderr, LocalStream) else threading.local()
+        stderr = FrameOutput(self.connection, FRAME_STDERR)
+        local.stream = stderr
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            data = self.rfile.read()
+            status = apply_filter(request.get("filter"), request.get("format", ""), data,
+                                  FrameOutput(self.connection, FRAME_STDOUT), request.get("directory"),
+                                  request.get("environment"))
+        except Exception:
+            traceback.print_exc(file=stderr)
+            status = 1
+        finally:
+            self.server.end_request()
+            local.stream = None
+        try:
+            FrameWriter(self.connection, FRAME_EXIT).write(str(status).encode("ascii"))
+        except OSError:
+            pass
+
+
+class FilterServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server that handles every request in its own thread and keeps track of the time since the last request.
+    The content of the CSV sources only belongs to the request that read it. The manifests of the csvtable filter are
+    written whenever no document is being filtered (the messages about it go to the client of the last document).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, idle_timeout=IDLE_TIMEOUT):
+        """
+        :param path: The path of the socket
+        :type path: str
+        :param idle_timeout: The time in seconds after which the server stops if there were no requests
+        :type idle_timeout: float
+        """
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+        self.idle_timeout = idle_timeout
+        self.timeout = min(1.0, idle_timeout)
+        self.active = 0
+        self.last_request = time.time()
+        self.condition = threading.Condition()
+
+    def process_request(self, request, client_address):
+        with self.condition:
+            self.active += 1
+        socketserver.ThreadingMixIn.process_request(self, request, client_address)
+
+    def end_request(self):
+        with self.condition:
+            self.active -= 1
+            self.last_request = time.time()
+            if self.active == 0:
+                csvtable.close_resources(backends=False)
+
+    def is_idle(self):
+        with self.condition:
+            return self.active == 0 and time.time() - self.last_request > self.idle_timeout
+
+    def serve_until_idle(self):
+        """
+        Handles requests until the server wasn't used for the idle timeout.
+        """
+        while not self.is_idle():
+            self.handle_request()
+
+
+def apply_filter(name, fmt, data, stdout, directory=None, environment=None):
+    """
+    Applies a filter to a document in the same way as the main method of the filter. Relative paths are resolved
+    against the working directory of the client.
+
+    :param name: The name of the filter ("csvtable", "minted" or "pandocfilter")
+    :type name: str
+    :param fmt: The target output format
+    :type fmt: str
+    :param data: The JSON of the document
+    :type data: bytes
+    :param stdout: The stream for the filtered document
+    :type stdout: FrameOutput
+    :param directory: The working directory of the client (by default the one of the daemon)
+    :type directory: str | None
+    :param environment: The environment variables of the client that the filters use (by default the ones of the
+      daemon)
+    :type environment: dict[str, str] | None
+    :return: The exit status
+    :rtype: int
+    """
+    if name not in FILTERS:
+        print("FilterDaemon - Unknown filter: {}".format(name), file=sys.stderr)
+        return 2
+
+    if name == "csvtable":
+        apply, types = apply_csvtable, csvtable.ELEMENT_TYPES
+    elif name == "minted":
+        apply, types = minted.apply, minted.ELEMENT_TYPES
+    else:
+        apply, types = apply_pandocfilter, pandocfilter.ELEMENT_TYPES
+
+    run_filter(FILTER_NAMES[name], partial(apply, directory=directory), fmt, types, io.BytesIO(data), stdout,
+               environment, directory)
+    return 0
+
+
+def apply_csvtable(document, fmt, meta, directory=None):
+    workers, processes = csvtable.get_parallel_settings(None, meta)
+    action = csvtable.prepare(document, fmt, meta, workers, processes, directory)
+    return walk(document, action, fmt, meta, csvtable.ELEMENT_TYPES)
+
+
+def apply_pandocfilter(document, fmt, meta, directory=None):
+    workers, processes = csvtable.get_parallel_settings(None, meta)
+    return pandocfilter.apply_filters(document, fmt, pandocfilter.get_order(None, meta), workers, processes,
+                                      shared=True, directory=directory)
+
+
+def create_server(path, idle_timeout=IDLE_TIMEOUT):
+    """
+    Creates the server on the socket. A socket that is left over from a daemon that didn't exit properly is removed.
+
+    :param path: The path of the socket
+    :type path: str
+    :param idle_timeout: The time in seconds after which the server stops if there were no requests
+    :type idle_timeout: float
+    :return: The server or ``None`` if another daemon is already listening on the socket
+    :rtype: FilterServer | None
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    if os.path.exists(path):
+        try:
+            open_connection(path).close()
+            return None
+        except OSError:
+            os.remove(path)
+
+    try:
+        return FilterServer(path, idle_timeout)
+    except OSError as error:
+        if error.errno == errno.EADDRINUSE:
+            return None
+        raise
+
+
+def serve(path, idle_timeout=IDLE_TIMEOUT):
+    """
+    Runs the daemon until it wasn't used for the idle timeout.
+
+    :param path: The path of the socket
+    :type path: str
+    :param idle_timeout: The time in seconds after which the daemon exits if there were no requests
+    :type idle_timeout: float
+    :return: ``False`` if another daemon is already running
+    :rtype: bool
+    """
+    server = create_server(path, idle_timeout)
+    if server is None:
+        print("FilterDaemon - Already running on " + path, file=sys.stderr)
+        return False
+
+    stderr = sys.stderr
+    if not isinstance(stderr, LocalStream):
+        sys.stderr = LocalStream(stderr)
+    try:
+        with server:
+            server.serve_until_idle()
+    finally:
+        sys.stderr = stderr
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        csvtable.close_resources()
+    return True
+
+
+def parse_arguments(args=None):
+    """
+    Provides the command line interface of the daemon.
+
+    :param args: The arguments that should be parsed instead of the ones from the command line
+    :type args: list[str] | None
+    :return: The arguments from the command line.
+    :rtype: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", '--version', action='version', version='%(prog)s ' + __VERSION__)
+    parser.add_argument("--socket", default=get_socket_path(),
+                        help="The path of the Unix socket (default: %(default)s)")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT, metavar="SECONDS",
+                        help="Exit after this time without requests (default: %(default)s)")
+
+    return parser.parse_args(args)
+
+
+def main(arguments):
+    """
+    This is the main method that runs the daemon.
+
+    :param arguments: The arguments from the command line
+    :type arguments: argparse.Namespace
+    """
+    if not serve(arguments.socket, arguments.idle_timeout):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(parse_arguments())
@@ -8,15 +8,90 @@ It is based on:
 https://github.com/nick-ulle/pandoc-minted
 https://gist.github.com/jepio/3ecaa6bba2a53ff74f2e
 """
-import argparse
+from __future__ import print_function
+
+import hashlib
+import os
+import sqlite3
+import sys
 import textwrap
+from collections import OrderedDict
+from functools import lru_cache, partial
+
+from pandocfilters import RawBlock, RawInline
+
+from pandocjson import (Manifest, Setting, SettingsResolver, connect_database, get_cache_dir, instrumented,
+                        resolve_path, run_filter, started_by_pandoc, walk)
 
-from pandocfilters import RawBlock, toJSONFilter, RawInline
+# The formatters and lexers of Pygments are only imported by the Highlighter because loading them is slow
+try:
+    import pygments
+except ImportError:
+    pygments = None
 
 __VERSION__ = "0.1"
 __AUTHOR__ = "Julien Hadley Jack <git@jlhj.de>"
 
-def minted(key, value, fmt, meta):
+# The types of the elements that this filter is interested in
+ELEMENT_TYPES = frozenset(["CodeBlock", "Code"])
+
+# Templates for code blocks without and with a caption (inline code is formatted by format_inline)
+MINTED_SIMPLE = textwrap.dedent("""
+    \\begin{{minted}}{formatted_attributes}{{{language}}}
+    {content}
+    \\end{{minted}}
+    """).strip()
+
+MINTED_CAPTIONED = textwrap.dedent("""
+    \\begin{{listing}}[{figure_options}]
+    \\begin{{minted}}{formatted_attributes}{{{language}}}
+    {content}
+    \\end{{minted}}
+    \\vspace{{-5pt}}
+    \\caption{caption_short}{{{caption_long}}}
+    \\end{{listing}}
+    """).strip()
+
+# Template for code blocks with a caption that were highlighted with Pygments
+VERBATIM_CAPTIONED = textwrap.dedent("""
+    \\begin{{listing}}[{figure_options}]
+    {content}
+    \\vspace{{-5pt}}
+    \\caption{caption_short}{{{caption_long}}}
+    \\end{{listing}}
+    """).strip()
+
+# Options of the minted environment that are also understood by the Verbatim environment of fancyvrb
+VERBATIM_OPTIONS = frozenset([
+    "baselinestretch", "commentchar", "firstline", "firstnumber", "fontfamily", "fontseries", "fontshape", "fontsize",
+    "frame", "framerule", "framesep", "gobble", "label", "lastline", "numbers", "numbersep", "resetmargins",
+    "rulecolor", "samepage", "showspaces", "showtabs", "stepnumber", "tabsize", "xleftmargin", "xrightmargin",
+])
+
+# The maximal number of lines of a code block that is saved in a box for minted-dedup (boxes can't be split across
+# pages, so longer code blocks are included every time)
+DEDUP_BOX_LINES = 15
+
+# The settings of code from its attributes and the metadata of the document
+SETTINGS = SettingsResolver("Minted", OrderedDict([
+    ("language", Setting("language", "text", meta="minted-language", empty=False)),
+    ("figure_options", Setting("minted-figure", "H")),
+]))
+
+# The settings that only apply to the whole document
+DOCUMENT_SETTINGS = SettingsResolver("Minted", OrderedDict([
+    ("exclude", Setting([], ["table", "ditaa", "plantuml"], "list", meta="minted-exclude")),
+    ("class", Setting([], "no", "bool", meta="minted-class")),
+    ("mode", Setting([], "minted", "choice", ["minted", "pygments"], meta="minted-mode")),
+    ("style", Setting([], "default", meta="minted-style")),
+    ("cache", Setting([], "yes", "bool", meta="minted-cache")),
+    ("cache_dir", Setting([], meta="minted-cache-dir")),
+    ("incremental", Setting([], "no", "bool", meta="incremental")),
+    ("dedup", Setting([], "no", "bool", meta="minted-dedup")),
+]))
+
+
+def minted(key, value, fmt, meta, highlighter=None, snippets=None, manifest=None):
     if not check_preconditions(key, value, meta):
         return
 
@@ -24,8 +99,53 @@ def minted(key, value, fmt, meta):
 
     paired_attributes = map_attributes(paired_attributes)
     settings = generate_settings(paired_attributes, meta, key)
-    formatted_attributes = format_attributes(paired_attributes, classes)
 
+    identifier = None
+    highlighted = highlighter is not None
+    if snippets is not None and not settings["caption_long"] and snippets.accepts(key, content, highlighted):
+        identifier = (key, content, settings["language"], tuple(sorted(paired_attributes.items())), tuple(classes))
+        reference = snippets.get(identifier)
+        if reference is not None:
+            return [reference]
+
+    create = partial(create_elements, content, key, paired_attributes, classes, settings, highlighter)
+    if identifier is not None:
+        return [snippets.add(identifier, create()[0], highlighted)]
+    if manifest is not None and key == "CodeBlock":
+        if highlighter is not None:
+            highlighter.used = True
+        return manifest.build(get_inputs(content, key, paired_attributes, classes, settings, highlighter), create)
+    return create()
+
+
+def get_inputs(content, key, paired_attributes, classes, settings, highlighter=None):
+    """
+    Returns everything that a code block depends on for the manifest of an incremental build.
+
+    :param content: The code
+    :type content: str
+    :param key: The type of the element
+    :type key: str
+    :param paired_attributes: The attributes of the code.
+    :type paired_attributes: dict[str, str]
+    :param classes: The classes of the code
+    :type classes: list[str]
+    :param settings: The settings of the code
+    :type settings: dict[str, str]
+    :param highlighter: The highlighter if the code is highlighted with Pygments
+    :type highlighter: Highlighter | None
+    :return: The inputs
+    :rtype: list
+    """
+    style = highlighter.style if highlighter is not None else None
+    return [__VERSION__, key, content, paired_attributes, classes, settings, style]
+
+
+def create_elements(content, key, paired_attributes, classes, settings, highlighter=None):
+    if highlighter is not None:
+        return highlighter.get_element(content, key, paired_attributes, classes, settings)
+
+    formatted_attributes = format_attributes(paired_attributes, classes)
     return get_minted(content, key, formatted_attributes, settings)
 
 
@@ -34,12 +154,12 @@ def check_preconditions(key, value, meta):
         return False
 
     classes = value[0][1]
-    default_exceptions = ["table", "ditaa", "plantuml"]
-    classes_exclude = set(classes).intersection(set(meta.get("minted-exclude", default_exceptions)))
+    settings = DOCUMENT_SETTINGS.resolve_meta(meta)
+    classes_exclude = set(classes).intersection(settings["exclude"])
     if classes_exclude:
         return False
 
-    return not meta.get("minted-class", False) or "minted" in classes or key == "Code"
+    return settings["class"] != "yes" or "minted" in classes or key == "Code"
 
 
 def map_attributes(attributes):
@@ -67,13 +187,14 @@ def generate_settings(paired_attributes, meta, key):
     :rtype: dict[str, str | int]
     """
     caption_long, caption_short = get_caption(paired_attributes)
-    return {
-        "language": paired_attributes.get("language") or meta.get("minted-language") or "text",
+    settings = SETTINGS.resolve(paired_attributes, meta)
+    settings.update({
+        "language": settings["language"] or "text",
         "caption_long": caption_long,
         "caption_short": caption_short,
-        "figure_options": get_setting("minted-figure", paired_attributes, meta, "H"),
         "key": key
-    }
+    })
+    return settings
 
 
 def get_caption(paired_attributes):
@@ -88,37 +209,25 @@ def get_caption(paired_attributes):
     return caption_long, caption_short
 
 
-def get_setting(key, paired_attributes, meta=None, default_value="", remove=False):
-    """
-    Looks at the attributes of the code and the metadata of the document (in that order) and returns the value when it
-    finds one with the specified key.
-
-    :param key: The key or keys that should be searched for. Only the result for the first key found will be returned.
-    :type key: str | list[str]
-    :param paired_attributes: The attributes for the code.
-    :type paired_attributes: dict[str, str]
-    :param meta: The metadata of the document.
-    :type meta: dict[str, str]
-    :param default_value: The value that should be found if the key(s) can't be found.
-    :type default_value: str | object
-    :param remove: Should the setting be removed from the attributes if it was found there.
-    :type remove: bool
-    :return: The value that is associated with the key or the default value if key not found.
-    :rtype: str | object
-    """
-    if not isinstance(key, list):
-        key = [key]
-    for single_key in key:
-        if single_key in paired_attributes:
-            return paired_attributes.pop(single_key) if remove else paired_attributes[single_key]
-        if meta is not None and single_key in meta:
-            return meta[single_key]
-    return default_value
+def format_attributes(attributes, classes):
+    return format_attribute_items(tuple(attributes.items()), tuple(classes))
 
 
-def format_attributes(attributes, classes):
+@lru_cache(maxsize=1024)
+def format_attribute_items(items, classes):
+    """
+    Formats the attributes and classes as options for minted. The results are cached because the same combinations
+    appear many times in a document.
+
+    :param items: The paired attributes as tuples of key and value
+    :type items: tuple[tuple[str, str]]
+    :param classes: The classes of the code
+    :type classes: tuple[str]
+    :return: The options in square brackets or an empty string if there are none
+    :rtype: str
+    """
     exceptions = ["language", "caption", "minted"]
-    result = ['{}="{}"'.format(key, value) for key, value in attributes.items() if key not in exceptions]
+    result = ['{}="{}"'.format(key, value) for key, value in items if key not in exceptions]
     result = result + [key for key in classes if key not in exceptions]
     result = ", ".join(sorted(result))
     if result:
@@ -134,34 +243,419 @@ def get_minted(content, key, formatted_attributes, settings):
     return [element("latex", code_block)]
 
 
+@instrumented("format_code")
 def format_code(content, formatted_attributes, settings):
-    minted_simple = """
-    \\begin{{minted}}{formatted_attributes}{{{settings[language]}}}
-    {content}
-    \\end{{minted}}
+    if settings["key"] == "Code":
+        return format_inline(content, formatted_attributes, settings["language"])
+
+    template = MINTED_CAPTIONED if settings["caption_long"] else MINTED_SIMPLE
+    return template.format(content=content, formatted_attributes=formatted_attributes, **settings)
+
+
+def format_inline(content, formatted_attributes, language):
+    return "\\mintinline" + formatted_attributes + "{" + language + "}{" + content + "}"
+
+
+def get_highlighter(meta, directory=None):
     """
+    Returns the highlighter for the document if the code should be highlighted with Pygments while filtering instead
+    of by minted while compiling the LaTeX document ("minted-mode: pygments").
 
-    minted_captioned = """
-    \\begin{{listing}}[{settings[figure_options]}]
-    \\begin{{minted}}{formatted_attributes}{{{settings[language]}}}
-    {content}
-    \\end{{minted}}
-    \\vspace{{-5pt}}
-    \\caption{settings[caption_short]}{{{settings[caption_long]}}}
-    \\end{{listing}}
+    :param meta: The metadata of the document.
+    :type meta: dict
+    :param directory: The directory that a relative cache directory is resolved against
+    :type directory: str | None
+    :return: The highlighter or ``None`` if the minted environment should be used
+    :rtype: Highlighter | None
     """
+    settings = DOCUMENT_SETTINGS.resolve_meta(meta)
+    if settings["mode"] != "pygments":
+        return None
+    if pygments is None:
+        print("Minted - Pygments isn't installed, falling back to the minted environment", file=sys.stderr)
+        return None
 
-    minted_inline = '\\mintinline{formatted_attributes}{{{settings[language]}}}{{{content}}}'
+    path = None
+    if settings["cache"] == "yes":
+        path = os.path.join(resolve_path(settings["cache_dir"], directory) or get_cache_dir(), "minted.sqlite")
+    return Highlighter(settings["style"], path)
 
-    if settings["key"] == "Code":
-        template = minted_inline
-    elif settings["caption_long"]:
-        template = minted_captioned
+
+class Highlighter(object):
+    """
+    Highlights code with Pygments and formats it for the Verbatim environment of fancyvrb. This way LaTeX doesn't have
+    to call Pygments for every code block (and doesn't need ``-shell-escape``). The highlighted code is cached in a
+    SQLite database keyed by the code, the language, the options and the versions of Pygments and the filter.
+    """
+
+    def __init__(self, style="default", path=None):
+        """
+        :param style: The name of the Pygments style
+        :type style: str
+        :param path: The path of the database or ``None`` to only keep the highlighted code in memory
+        :type path: str | None
+        """
+        from pygments.formatters import LatexFormatter
+        from pygments.util import ClassNotFound
+
+        try:
+            self.formatter = LatexFormatter(style=style)
+        except ClassNotFound:
+            print("Minted - Unknown style {}, using the default style".format(style), file=sys.stderr)
+            self.formatter = LatexFormatter()
+        self.style = style
+        self.memory = {}
+        self.entries = []
+        self.connection = connect_database(path, "CREATE TABLE IF NOT EXISTS highlights "
+                                                 "(key TEXT PRIMARY KEY, value TEXT)", "Minted") if path else None
+        self.used = False
+
+    def get_element(self, content, key, paired_attributes, classes, settings):
+        """
+        Creates the raw LaTeX element for the highlighted code.
+
+        :param content: The code
+        :type content: str
+        :param key: The type of the element ("CodeBlock" or "Code")
+        :type key: str
+        :param paired_attributes: The attributes of the code.
+        :type paired_attributes: dict[str, str]
+        :param classes: The classes of the code
+        :type classes: list[str]
+        :param settings: The settings of the code
+        :type settings: dict[str, str]
+        :return: The element in a list
+        :rtype: list[dict]
+        """
+        self.used = True
+        if key == "Code":
+            return [RawInline("latex", "\\texttt{" + self.highlight(content, settings["language"], "", True) + "}")]
+
+        code_block = self.highlight(content, settings["language"], format_verbatim_options(paired_attributes, classes))
+        if settings["caption_long"]:
+            code_block = VERBATIM_CAPTIONED.format(content=code_block, **settings)
+        return [RawBlock("latex", code_block)]
+
+    @instrumented("highlight")
+    def highlight(self, content, language, options="", inline=False):
+        """
+        Highlights the code or returns the cached result.
+
+        :param content: The code
+        :type content: str
+        :param language: The name of the language
+        :type language: str
+        :param options: The options of the Verbatim environment
+        :type options: str
+        :param inline: Should only the highlighted code without the environment be returned
+        :type inline: bool
+        :return: The highlighted code as LaTeX
+        :rtype: str
+        """
+        text = "\0".join([__VERSION__, pygments.__version__, self.style, language, options, str(inline), content])
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+        value = self.memory.get(key)
+        if value is None and self.connection is not None:
+            row = self.connection.execute("SELECT value FROM highlights WHERE key = ?", (key,)).fetchone()
+            value = row[0] if row else None
+        if value is None:
+            value = self.render(content, language, options, inline)
+            self.entries.append((key, value))
+        self.memory[key] = value
+        return value
+
+    def render(self, content, language, options, inline):
+        from pygments.lexers import get_lexer_by_name
+        from pygments.lexers.special import TextLexer
+        from pygments.util import ClassNotFound
+
+        try:
+            lexer = get_lexer_by_name(language)
+        except ClassNotFound:
+            if language != "text":
+                print("Minted - Unknown language {}, highlighting as text".format(language), file=sys.stderr)
+            lexer = TextLexer()
+
+        self.formatter.verboptions = options
+        self.formatter.nowrap = inline
+        return pygments.highlight(content, lexer, self.formatter).rstrip("\n")
+
+    def get_style_definitions(self):
+        """
+        :return: The LaTeX commands for the style that have to be defined once before the highlighted code
+        :rtype: str
+        """
+        return self.formatter.get_style_defs().strip()
+
+    def close(self):
+        """
+        Writes the newly highlighted code to the database and closes it.
+        """
+        if self.connection is None:
+            return
+        try:
+            self.connection.executemany("INSERT OR REPLACE INTO highlights VALUES (?, ?)", self.entries)
+            self.connection.commit()
+        except sqlite3.Error as error:
+            print("Minted - Couldn't write to cache: {}".format(error), file=sys.stderr)
+        finally:
+            self.connection.close()
+            self.connection = None
+            self.entries = []
+
+
+def format_verbatim_options(attributes, classes):
+    """
+    Formats the attributes and classes of the code as options for the Verbatim environment. Options that are only
+    understood by minted are left out.
+
+    :param attributes: The paired attributes of the code
+    :type attributes: dict[str, str]
+    :param classes: The classes of the code
+    :type classes: list[str]
+    :return: The options separated by commas
+    :rtype: str
+    """
+    result = ["{}={}".format(key, value) for key, value in attributes.items() if key in VERBATIM_OPTIONS]
+    result = result + [key for key in classes if key in VERBATIM_OPTIONS]
+    if "linenos" in classes or attributes.get("linenos", "false") != "false":
+        result.append("numbers=left")
+    return ",".join(sorted(result))
+
+
+def get_manifest(meta, directory=None):
+    """
+    Returns the manifest for an incremental build ("incremental" setting). It is stored in the cache directory. Only
+    code blocks are taken from the manifest, because formatting inline code is faster than looking it up. Code that is
+    deduplicated isn't taken from the manifest either because its output depends on the earlier code.
+
+    :param meta: The metadata of the document.
+    :type meta: dict
+    :param directory: The directory that a relative cache directory is resolved against
+    :type directory: str | None
+    :return: The manifest or ``None`` if the code should always be formatted
+    :rtype: pandocjson.Manifest | None
+    """
+    settings = DOCUMENT_SETTINGS.resolve_meta(meta)
+    if settings["incremental"] != "yes":
+        return None
+    return Manifest(os.path.join(resolve_path(settings["cache_dir"], directory) or get_cache_dir(), "manifest.sqlite"),
+                    "Minted")
+
+
+def load_manifest(document, fmt, meta, manifest, highlighter=None):
+    """
+    Looks up all code blocks of the document in the manifest at once (see :meth:`pandocjson.Manifest.load`).
+
+    :param document: The document
+    :type document: list | dict
+    :param fmt: The target output format
+    :type fmt: str
+    :param meta: The metadata of the document.
+    :type meta: dict
+    :param manifest: The manifest or ``None`` if the code should always be formatted
+    :type manifest: pandocjson.Manifest | None
+    :param highlighter: The highlighter if the code is highlighted with Pygments
+    :type highlighter: Highlighter | None
+    """
+    if manifest is None:
+        return
+
+    keys = []
+
+    def collect(key, value, fmt, meta):
+        if key == "CodeBlock" and check_preconditions(key, value, meta):
+            (_, classes, paired_attributes), content = value
+            paired_attributes = map_attributes(paired_attributes)
+            settings = generate_settings(paired_attributes, meta, key)
+            keys.append(manifest.key(get_inputs(content, key, paired_attributes, classes, settings, highlighter)))
+
+    walk(document, collect, fmt, meta, frozenset(["CodeBlock"]))
+    manifest.load(keys)
+
+
+def get_snippets(meta):
+    """
+    Returns the index for repeated code if it should only be included once in the document ("minted-dedup: yes").
+
+    :param meta: The metadata of the document.
+    :type meta: dict
+    :return: The index or ``None`` if every occurrence should be included
+    :rtype: Snippets | None
+    """
+    if DOCUMENT_SETTINGS.resolve_meta(meta)["dedup"] != "yes":
+        return None
+    return Snippets()
+
+
+class Snippets(object):
+    """
+    Index of the code that was already included in the document. The first occurrence of code is saved in LaTeX (as a
+    box, a saved Verbatim environment or a macro) and all further occurrences with the same content, language and
+    attributes only reference it. This keeps the document small and LaTeX has to highlight the code only once.
+    Code with a caption is never deduplicated and neither are long code blocks in the minted environment.
+    The boxes are declared once at the beginning of the document (see :func:`add_definitions`), so that saving the code
+    again (e.g. in a heading that is repeated in the table of contents) doesn't define them twice.
+    """
+
+    def __init__(self):
+        self.references = {}
+        self.boxes = []
+
+    @staticmethod
+    def accepts(key, content, highlighted=False):
+        """
+        Checks if the code can be deduplicated. Code blocks in the minted environment are saved in a box which can't be
+        split across pages, so only short code blocks are deduplicated (see :data:`DEDUP_BOX_LINES`).
+
+        :param key: The type of the element ("CodeBlock" or "Code")
+        :type key: str
+        :param content: The code
+        :type content: str
+        :param highlighted: Is the code highlighted with Pygments (instead of using the minted environment)
+        :type highlighted: bool
+        :return: ``True`` if the code can be deduplicated
+        :rtype: bool
+        """
+        return highlighted or key == "Code" or content.count("\n") < DEDUP_BOX_LINES
+
+    def get(self, identifier):
+        """
+        :param identifier: The type of the element, the content, the language, the attributes and the classes
+        :type identifier: tuple
+        :return: The element that references the saved code or ``None`` if the code wasn't included yet
+        :rtype: dict | None
+        """
+        reference = self.references.get(identifier)
+        if reference is None:
+            return None
+        element = RawInline if reference[0] == "Code" else RawBlock
+        return element("latex", reference[1])
+
+    def add(self, identifier, element, highlighted=False):
+        """
+        Saves the code of the first occurrence so that it can be referenced by the further occurrences.
+
+        :param identifier: The type of the element, the content, the language, the attributes and the classes
+        :type identifier: tuple
+        :param element: The raw element with the formatted code
+        :type element: dict
+        :param highlighted: Was the code highlighted with Pygments (instead of using the minted environment)
+        :type highlighted: bool
+        :return: The element that saves and shows the code
+        :rtype: dict
+        """
+        name = get_snippet_name(len(self.references))
+        key, code = identifier[0], element["c"][1]
+
+        if highlighted and key == "Code":
+            saved = "\\gdef\\{}{{{}}}".format(name, code)
+            reference = "\\{}{{}}".format(name)
+        elif highlighted:
+            begin, rest = code.split("\n", 1)
+            options = begin[len("\\begin{Verbatim}"):]
+            saved = "\\begin{{SaveVerbatim}}{}{{{}}}\n{}".format(options, name, rest[:-len("\\end{Verbatim}")])
+            saved += "\\end{SaveVerbatim}\n"
+            reference = "\\UseVerbatim{}{{{}}}".format(options, name)
+        elif key == "Code":
+            saved = "\\begin{{lrbox}}{{\\{0}}}{1}\\end{{lrbox}}".format(name, code)
+            saved += "\\global\\setbox\\{0}=\\copy\\{0}".format(name)
+            reference = "\\usebox{{\\{}}}".format(name)
+            self.boxes.append(name)
+        else:
+            saved = "\\begin{{lrbox}}{{\\{0}}}\\begin{{minipage}}{{\\linewidth}}\n".format(name)
+            saved += code + "\n\\end{minipage}\\end{lrbox}"
+            saved += "\\global\\setbox\\{0}=\\copy\\{0}\n".format(name)
+            reference = "\\noindent\\usebox{{\\{}}}".format(name)
+            self.boxes.append(name)
+
+        self.references[identifier] = (key, reference)
+        element = RawInline if key == "Code" else RawBlock
+        return element("latex", saved + reference)
+
+    def get_declarations(self):
+        """
+        :return: The LaTeX commands that declare the boxes for the saved code
+        :rtype: str
+        """
+        return "\n".join("\\newsavebox{{\\{}}}".format(name) for name in self.boxes)
+
+
+def get_snippet_name(index):
+    """
+    Creates the name of the LaTeX macro or box for the saved code. The name only consists of letters because LaTeX
+    doesn't allow numbers in the names of macros.
+
+    :param index: The number of the saved code (starting with 0)
+    :type index: int
+    :return: The name, e.g. "mintedsnippetA" for 0 or "mintedsnippetBA" for 26
+    :rtype: str
+    """
+    name = ""
+    while True:
+        index, rest = divmod(index, 26)
+        name = chr(ord("A") + rest) + name
+        if not index:
+            return "mintedsnippet" + name
+
+
+def add_definitions(document, highlighter, snippets=None):
+    """
+    Adds the definitions of the Pygments style (if any code was highlighted) and the declarations of the boxes for
+    repeated code at the beginning of the document.
+
+    :param document: The document
+    :type document: list | dict
+    :param highlighter: The highlighter that was used for the document
+    :type highlighter: Highlighter | None
+    :param snippets: The index of repeated code that was used for the document
+    :type snippets: Snippets | None
+    :return: The document
+    :rtype: list | dict
+    """
+    blocks = []
+    if highlighter is not None and highlighter.used:
+        blocks.append(RawBlock("latex", highlighter.get_style_definitions()))
+    if snippets is not None and snippets.boxes:
+        blocks.append(RawBlock("latex", snippets.get_declarations()))
+    if not blocks:
+        return document
+
+    if isinstance(document, dict):
+        document["blocks"] = blocks + document["blocks"]
     else:
-        template = minted_simple
+        document[1] = blocks + document[1]
+    return document
 
-    template = textwrap.dedent(template).strip()
-    return template.format(**locals())
+
+def apply(document, fmt, meta, directory=None):
+    """
+    Applies the filter to the document.
+
+    :param document: The document
+    :type document: list | dict
+    :param fmt: The target output format
+    :type fmt: str
+    :param meta: The metadata of the document.
+    :type meta: dict
+    :param directory: The directory that relative paths are resolved against (by default the working directory)
+    :type directory: str | None
+    :return: The filtered document
+    :rtype: list | dict
+    """
+    highlighter, manifest = get_highlighter(meta, directory), get_manifest(meta, directory)
+    snippets = get_snippets(meta)
+    action = partial(minted, highlighter=highlighter, snippets=snippets, manifest=manifest)
+    try:
+        load_manifest(document, fmt, meta, manifest, highlighter)
+        document = walk(document, action, fmt, meta, ELEMENT_TYPES)
+        return add_definitions(document, highlighter, snippets)
+    finally:
+        if highlighter is not None:
+            highlighter.close()
+        if manifest is not None:
+            manifest.close()
 
 
 def parse_arguments():
@@ -171,6 +665,8 @@ def parse_arguments():
     :return: The arguments from the command line.
     :rtype: argparse.Namespace
     """
+    import argparse
+
     parser = argparse.ArgumentParser(description=__doc__,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument("-v", '--version', action='version', version='%(prog)s ' + __VERSION__)
@@ -183,9 +679,10 @@ def main():
     This is the main method that gets data from stdin,
     applies the filter and returns the result to stdout.
     """
-    toJSONFilter(minted)
+    run_filter("Minted", apply, types=ELEMENT_TYPES)
 
 
 if __name__ == "__main__":
-    # parse_arguments()
+    if not started_by_pandoc():
+        parse_arguments()
     main()
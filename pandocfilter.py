@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Apply the csvtable and minted filters to a pandoc document in a single pass.
+
+Running the filters one after another with ``pandoc --filter csvtable.py --filter minted.py`` makes pandoc serialize
+the whole document for each filter and start a new Python interpreter every time. This script reads the document once
+and applies all filters while walking it a single time.
+
+With --batch many documents in pandoc's JSON format (e.g. from ``pandoc -t json``) are filtered in one process. The
+results are written next to the documents.
+"""
+
+from __future__ import print_function
+
+import glob
+import os
+import sys
+import time
+from collections import OrderedDict
+from functools import partial
+
+import csvtable
+import minted
+from pandocjson import decode_meta_value, get_meta, run_filter, started_by_pandoc, walk
+
+# The suffix that is added to the names of the filtered documents in batch mode
+BATCH_SUFFIX = ".filtered"
+
+# The number of documents that are filtered at the same time in batch mode
+BATCH_WORKERS = os.cpu_count() or 1
+
+__VERSION__ = "0.1"
+__AUTHOR__ = "Julien Hadley Jack <git@jlhj.de>"
+
+# The filters that can be combined with their names
+FILTERS = OrderedDict([
+    ("csvtable", csvtable),
+    ("minted", minted),
+])
+
+# The types of the elements that the filters are interested in
+ELEMENT_TYPES = frozenset().union(*[module.ELEMENT_TYPES for module in FILTERS.values()])
+
+
+def combine(actions):
+    """
+    Combines the actions of several filters into one action for a single walk through the document.
+    The actions are tried in order and the first one that returns a replacement for an element wins. The elements
+    inside of the replacement are still visited by all actions.
+
+    :param actions: The actions of the filters
+    :type actions: list[callable]
+    :return: The combined action
+    :rtype: callable
+    """
+    def action(key, value, fmt, meta):
+        for filter_action in actions:
+            result = filter_action(key, value, fmt, meta)
+            if result is not None:
+                return result
+
+    return action
+
+
+def get_order(arguments, meta):
+    """
+    Returns the names of the filters in the order that they should be applied. The command line argument takes
+    precedence over the "filters" setting in the metadata. By default all filters are applied.
+
+    :param arguments: The arguments from the command line
+    :type arguments: argparse.Namespace | None
+    :param meta: The metadata of the document.
+    :type meta: dict
+    :return: The names of the filters
+    :rtype: list[str]
+    :raises ValueError: If a filter doesn't exist.
+    """
+    if arguments is not None and arguments.filters:
+        names = arguments.filters.split(",")
+    elif "filters" in meta:
+        names = decode_meta_value(meta["filters"]).split(",")
+    else:
+        names = list(FILTERS)
+
+    names = [name.strip() for name in names if name.strip()]
+    unknown = [name for name in names if name not in FILTERS]
+    if unknown:
+        raise ValueError("Unknown filters: " + ", ".join(unknown))
+    return names
+
+
+def apply_filters(document, fmt, names, workers=0, processes=False, shared=False, directory=None):
+    """
+    Applies the filters to the document in a single walk.
+
+    :param document: The document
+    :type document: list | dict
+    :param fmt: The target output format
+    :type fmt: str
+    :param names: The names of the filters in the order that they should be applied
+    :type names: list[str]
+    :param workers: The number of workers that create the tables of the csvtable filter
+    :type workers: int
+    :param processes: Should the tables be created in processes instead of threads
+    :type processes: bool
+    :param shared: Are the resources of the csvtable filter shared with other documents that are filtered at the same
+      time. They are then released by the caller instead of after this document.
+    :type shared: bool
+    :param directory: The directory that relative paths are resolved against (by default the working directory)
+    :type directory: str | None
+    :return: The filtered document
+    :rtype: list | dict
+    """
+    meta = get_meta(document)
+    highlighter = minted.get_highlighter(meta, directory) if "minted" in names else None
+    manifest = minted.get_manifest(meta, directory) if "minted" in names else None
+    snippets = minted.get_snippets(meta) if "minted" in names else None
+    try:
+        minted.load_manifest(document, fmt, meta, manifest, highlighter)
+        actions = []
+        for name in names:
+            if name == "csvtable":
+                actions.append(csvtable.prepare(document, fmt, meta, workers, processes, directory))
+            else:
+                actions.append(partial(minted.minted, highlighter=highlighter, snippets=snippets, manifest=manifest))
+        types = frozenset().union(*[FILTERS[name].ELEMENT_TYPES for name in names])
+        document = walk(document, combine(actions), fmt, meta, types)
+        return minted.add_definitions(document, highlighter, snippets)
+    finally:
+        if not shared:
+            csvtable.close_resources()
+        if highlighter is not None:
+            highlighter.close()
+        if manifest is not None:
+            manifest.close()
+
+
+def parse_arguments(args=None):
+    """
+    Provides a minimal command line interface that shows help text and version information
+
+    :param args: The arguments that should be parsed instead of the ones from the command line
+    :type args: list[str] | None
+    :return: The arguments from the command line.
+    :rtype: argparse.Namespace
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", '--version', action='version', version='%(prog)s ' + __VERSION__)
+    parser.add_argument("format", nargs="?", default="", help="The target output format (provided by pandoc)")
+    parser.add_argument("-f", "--filters", help="The filters separated by commas in the order they should be applied "
+                                                "(default: {})".format(",".join(FILTERS)))
+    parser.add_argument("-j", "--parallel", type=int, metavar="WORKERS",
+                        help="Create the tables in parallel with this number of workers")
+    parser.add_argument("--processes", action="store_true", help="Use processes instead of threads as workers")
+    parser.add_argument("--batch", nargs="+", metavar="PATH",
+                        help="Filter these JSON documents, directories with JSON documents or glob patterns instead of "
+                             "reading the document from stdin")
+    parser.add_argument("--batch-suffix", default=BATCH_SUFFIX, metavar="SUFFIX",
+                        help="Write the filtered documents next to the documents with this suffix before the extension "
+                             "(default: %(default)s)")
+    parser.add_argument("--batch-workers", type=int, default=BATCH_WORKERS, metavar="WORKERS",
+                        help="Filter this number of documents at the same time (default: %(default)s)")
+
+    return parser.parse_known_args(args)[0]
+
+
+def find_documents(paths, suffix=BATCH_SUFFIX):
+    """
+    Returns the documents for the batch mode. Directories are searched for JSON files and glob patterns are expanded.
+    The documents that were already filtered are left out of both, so they aren't filtered again.
+
+    :param paths: The paths of documents or directories or glob patterns
+    :type paths: list[str]
+    :param suffix: The suffix of the filtered documents
+    :type suffix: str
+    :return: The paths of the documents in the order they were given (and sorted by name for directories and patterns)
+    :rtype: list[str]
+    """
+    documents = OrderedDict()
+    for path in paths:
+        if os.path.isdir(path):
+            found = [name for name in sorted(glob.glob(os.path.join(path, "*.json")))
+                     if not name.endswith(suffix + ".json")]
+        elif glob.has_magic(path):
+            found = [name for name in sorted(glob.glob(path)) if not name.endswith(suffix + ".json")]
+        else:
+            found = [path]
+        documents.update((document, None) for document in found)
+    return list(documents)
+
+
+def get_output_path(path, suffix=BATCH_SUFFIX):
+    """
+    Returns the path of the filtered document next to the document (e.g. ``chapter.filtered.json``).
+
+    :param path: The path of the document
+    :type path: str
+    :param suffix: The suffix that is added before the extension
+    :type suffix: str
+    :return: The path of the filtered document
+    :rtype: str
+    """
+    root, extension = os.path.splitext(path)
+    return root + suffix + (extension or ".json")
+
+
+def filter_file(path, output, fmt, arguments=None):
+    """
+    Applies the filters to a document in a file. The resources of the csvtable filter are shared with the other
+    documents of the batch, so they have to be released with :func:`csvtable.close_resources` afterwards. The result
+    is written to a temporary file that replaces the output only if the document was filtered, so a failed document
+    doesn't leave an empty or partial output behind.
+
+    :param path: The path of the document
+    :type path: str
+    :param output: The path of the filtered document
+    :type output: str
+    :param fmt: The target output format
+    :type fmt: str
+    :param arguments: The arguments from the command line
+    :type arguments: argparse.Namespace | None
+    :return: The timings in seconds for each stage
+    :rtype: dict[str, float]
+    """
+    def apply(document, fmt, meta):
+        workers, processes = csvtable.get_parallel_settings(arguments, meta)
+        return apply_filters(document, fmt, get_order(arguments, meta), workers, processes, shared=True)
+
+    temporary = "{}.{}.tmp".format(output, os.getpid())
+    try:
+        with open(path, "rb") as stdin, open(temporary, "w", encoding="utf-8") as stdout:
+            timings = run_filter("PandocFilter", apply, fmt, ELEMENT_TYPES, stdin, stdout)
+        os.replace(temporary, output)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return timings
+
+
+def run_batch(paths, fmt, arguments=None, suffix=BATCH_SUFFIX, workers=BATCH_WORKERS):
+    """
+    Filters many documents in one process. The documents are filtered by a pool of threads, which share the conversion
+    cache, the HTTP session and the backend of the csvtable filter. The time that each document took is reported on
+    stderr. A document that can't be filtered is reported and doesn't stop the other documents.
+
+    :param paths: The paths of documents or directories or glob patterns
+    :type paths: list[str]
+    :param fmt: The target output format
+    :type fmt: str
+    :param arguments: The arguments from the command line
+    :type arguments: argparse.Namespace | None
+    :param suffix: The suffix of the filtered documents
+    :type suffix: str
+    :param workers: The number of documents that are filtered at the same time
+    :type workers: int
+    :return: The timings of each document or ``None`` if it couldn't be filtered
+    :rtype: collections.OrderedDict[str, dict[str, float] | None]
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def process(path):
+        try:
+            return filter_file(path, get_output_path(path, suffix), fmt, arguments)
+        except Exception as error:
+            print("PandocFilter - Couldn't filter {}: {!r}".format(path, error), file=sys.stderr)
+
+    documents = find_documents(paths, suffix)
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = OrderedDict(zip(documents, executor.map(process, documents)))
+    finally:
+        csvtable.close_resources()
+
+    for path, timings in results.items():
+        if timings is not None:
+            print("PandocFilter - {}: {}".format(path, ", ".join("{} {:.3f}s".format(stage, seconds)
+                                                                 for stage, seconds in timings.items())),
+                  file=sys.stderr)
+    failed = sum(timings is None for timings in results.values())
+    print("PandocFilter - Filtered {} documents in {:.3f}s ({} failed)".format(len(results) - failed,
+                                                                            time.time() - start, failed),
+          file=sys.stderr)
+    return results
+
+
+def main(arguments=None):
+    """
+    This is the main method that gets data from stdin,
+    applies the filters and returns the result to stdout.
+
+    :param arguments: The arguments from the command line. Without them the first argument is the output format.
+    :type arguments: argparse.Namespace | None
+    """
+    def apply(document, fmt, meta):
+        workers, processes = csvtable.get_parallel_settings(arguments, meta)
+        return apply_filters(document, fmt, get_order(arguments, meta), workers, processes)
+
+    if arguments is not None and arguments.batch:
+        results = run_batch(arguments.batch, arguments.format, arguments, arguments.batch_suffix,
+                            arguments.batch_workers)
+        if None in results.values():
+            sys.exit(1)
+        return
+
+    run_filter("PandocFilter", apply, arguments.format if arguments else None, ELEMENT_TYPES)
+
+
+if __name__ == '__main__':
+    main(None if started_by_pandoc() else parse_arguments())
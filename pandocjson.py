@@ -0,0 +1,998 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reading, walking and writing the JSON documents that pandoc passes to the filters.
+
+The document is read from stdin as bytes and decoded with `orjson <https://pypi.org/project/orjson/>`_ if it is
+installed (or the json module otherwise). The result is written to stdout in chunks. This makes reading and writing
+faster, but it doesn't lower the peak memory use: the whole document is decoded into memory and orjson also encodes
+it to one string before it is written. The module also contains small helpers that are shared by the filters.
+"""
+
+from __future__ import print_function
+
+import codecs
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from pandocfilters import stringify
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__VERSION__ = "0.1"
+__AUTHOR__ = "Julien Hadley Jack <git@jlhj.de>"
+
+# The size of the chunks that are written to stdout
+CHUNK_SIZE = 64 * 1024
+
+# Environment variable that enables the report of the timings on stderr
+TIMINGS_VARIABLE = "PANDOCFILTER_TIMINGS"
+
+# Environment variable with the file that the report of the timings is appended to instead of stderr
+TIMINGS_FILE_VARIABLE = "PANDOCFILTER_TIMINGS_FILE"
+
+# Environment variable with the file for the statistics of the profiler (can be read with the pstats module)
+PROFILE_VARIABLE = "PANDOCFILTER_PROFILE"
+
+# The time in seconds after which unused entries are removed from the manifest of an incremental build
+MANIFEST_MAX_AGE = 30 * 24 * 60 * 60
+
+# The number of keys that are looked up with one query when the entries of the manifest are loaded
+MANIFEST_BATCH = 500
+
+# Pandoc elements that never contain other elements
+LEAF_TYPES = frozenset([
+    "Str", "Space", "SoftBreak", "LineBreak", "Code", "Math", "RawInline",
+    "CodeBlock", "RawBlock", "HorizontalRule", "Null",
+])
+
+
+def walk(x, action, fmt, meta, types=None):
+    """
+    Walk a tree, applying an action to every object. This works like ``pandocfilters.walk`` (including the possible
+    return values of the action) with two differences:
+
+    * Lists and objects are only copied if something inside of them changed. Unchanged parts of the tree are returned
+      as they are.
+    * If the types of the elements are given, the action is only called for these elements and elements that can't
+      contain other elements (e.g. ``Str`` or ``Space``) are skipped entirely.
+
+    :param x: The tree
+    :type x: list | dict | object
+    :param action: The function that is called as ``action(key, value, fmt, meta)`` for the elements
+    :type action: callable
+    :param fmt: The target output format
+    :type fmt: str
+    :param meta: The metadata of the document.
+    :type meta: dict
+    :param types: The types of the elements that the action should be called for or ``None`` for all elements
+    :type types: set[str] | frozenset[str] | None
+    :return: The modified tree
+    :rtype: list | dict | object
+    """
+    if isinstance(x, list):
+        array = None
+        for index, item in enumerate(x):
+            result = None
+            if isinstance(item, dict) and "t" in item:
+                key = item["t"]
+                if types is None or key in types:
+                    result = action(key, item["c"] if "c" in item else None, fmt, meta)
+                elif key in LEAF_TYPES:
+                    if array is not None:
+                        array.append(item)
+                    continue
+
+            if result is None:
+                walked = walk(item, action, fmt, meta, types)
+                if walked is item:
+                    if array is not None:
+                        array.append(item)
+                    continue
+                replacement = [walked]
+            elif isinstance(result, list):
+                replacement = [walk(element, action, fmt, meta, types) for element in result]
+            else:
+                replacement = [walk(result, action, fmt, meta, types)]
+
+            if array is None:
+                array = x[:index]
+            array.extend(replacement)
+        return x if array is None else array
+    elif isinstance(x, dict):
+        obj = None
+        for key, value in x.items():
+            walked = walk(value, action, fmt, meta, types)
+            if walked is not value:
+                if obj is None:
+                    obj = dict(x)
+                obj[key] = walked
+        return x if obj is None else obj
+    else:
+        return x
+
+
+def loads(data):
+    """
+    Decodes a JSON document.
+
+    :param data: The encoded document
+    :type data: bytes
+    :return: The document
+    :rtype: list | dict
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+
+def iterencode(document):
+    """
+    Encodes a JSON document in chunks. With orjson the document is encoded at once and the result is split.
+
+    :param document: The document
+    :type document: list | dict
+    :return: The chunks of the encoded document
+    :rtype: collections.Iterator[bytes]
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(document)
+        except TypeError:
+            pass
+        else:
+            view = memoryview(data)
+            for start in range(0, len(data), CHUNK_SIZE):
+                yield view[start:start + CHUNK_SIZE]
+            return
+
+    encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+    chunk = []
+    size = 0
+    for part in encoder.iterencode(document):
+        chunk.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield "".join(chunk).encode("utf-8")
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk).encode("utf-8")
+
+
+def read_data(stream=None):
+    """
+    Reads the encoded document from a stream.
+
+    :param stream: The stream (by default stdin)
+    :type stream: io.IOBase | None
+    :return: The JSON of the document
+    :rtype: bytes
+    """
+    stream = stream or sys.stdin
+    data = getattr(stream, "buffer", stream).read()
+    return data if isinstance(data, bytes) else data.encode("utf-8")
+
+
+def read_document(stream=None):
+    """
+    Reads the document from a stream.
+
+    :param stream: The stream (by default stdin)
+    :type stream: io.IOBase | None
+    :return: The document
+    :rtype: list | dict
+    """
+    return loads(read_data(stream))
+
+
+def write_data(data, stream=None):
+    """
+    Writes the encoded document to a stream without changing it.
+
+    :param data: The JSON of the document
+    :type data: bytes
+    :param stream: The stream (by default stdout)
+    :type stream: io.IOBase | None
+    """
+    stream = stream or sys.stdout
+    binary = getattr(stream, "buffer", None)
+    if binary is not None:
+        stream.flush()
+        binary.write(data)
+        binary.flush()
+    else:
+        stream.write(data.decode("utf-8"))
+
+
+def contains_types(data, types):
+    """
+    Checks quickly if the encoded document could contain elements of the types without decoding it. Every element type
+    appears as a JSON string in the document, so if none of the strings is found, the filter has nothing to do.
+
+    :param data: The JSON of the document
+    :type data: bytes
+    :param types: The types of the elements (e.g. "CodeBlock")
+    :type types: collections.Iterable[str]
+    :return: ``False`` if there certainly are no such elements
+    :rtype: bool
+    """
+    return any('"{}"'.format(element_type).encode("utf-8") in data for element_type in types)
+
+
+def write_document(document, stream=None):
+    """
+    Writes the document to a stream in chunks. For text streams the chunks are decoded incrementally, because a chunk
+    can end in the middle of a character.
+
+    :param document: The document
+    :type document: list | dict
+    :param stream: The stream (by default stdout)
+    :type stream: io.IOBase | None
+    """
+    stream = stream or sys.stdout
+    binary = getattr(stream, "buffer", None)
+    if binary is not None:
+        stream.flush()
+        for chunk in iterencode(document):
+            binary.write(chunk)
+        binary.flush()
+    else:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in iterencode(document):
+            stream.write(decoder.decode(chunk))
+        stream.write(decoder.decode(b"", final=True))
+
+
+def get_meta(document):
+    """
+    Returns the metadata of a document for the old and new JSON structure used by pandoc.
+
+    :param document: The document
+    :type document: list | dict
+    :return: The metadata
+    :rtype: dict
+    """
+    if "meta" in document:
+        return document["meta"]
+    return document[0]["unMeta"] if document[0] else {}
+
+
+def get_blocks(document):
+    """
+    Returns the blocks of a document for the old and new JSON structure used by pandoc.
+
+    :param document: The document
+    :type document: list | dict
+    :return: The blocks
+    :rtype: list[dict]
+    """
+    if isinstance(document, dict):
+        return document["blocks"]
+    return document[1]
+
+
+def get_cache_dir():
+    """
+    Returns the default directory for the caches of the filters.
+
+    :return: The path of the directory
+    :rtype: str
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "pandocfilter")
+
+
+def resolve_path(path, directory=None):
+    """
+    Resolves a relative path against a directory.
+
+    :param path: The path (or an empty string)
+    :type path: str
+    :param directory: The directory or ``None`` to keep the path relative to the working directory
+    :type directory: str | None
+    :return: The resolved path or the empty string
+    :rtype: str
+    """
+    return os.path.join(directory, path) if path and directory else path
+
+
+def connect_database(path, statement, name):
+    """
+    Opens a SQLite database that is used as a cache and creates its table if necessary.
+
+    :param path: The path of the database
+    :type path: str
+    :param statement: The statement that creates the table
+    :type statement: str
+    :param name: The name of the filter used in error messages
+    :type name: str
+    :return: The connection or ``None`` if the database couldn't be opened
+    :rtype: sqlite3.Connection | None
+    """
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.execute(statement)
+        return connection
+    except (OSError, sqlite3.Error) as error:
+        print("{} - Couldn't open cache {}: {}".format(name, path, error), file=sys.stderr)
+
+
+class Manifest(object):
+    """
+    Record of the elements that a filter created in earlier runs for an incremental build. The entries are keyed by
+    everything that the output depends on (the content and attributes of the element, the relevant settings, the
+    version of the referenced files and the version of the filter), so unchanged elements can be reused instead of
+    creating them again. Entries that weren't used for :data:`MANIFEST_MAX_AGE` seconds are removed.
+    """
+
+    def __init__(self, path, name):
+        """
+        :param path: The path of the database
+        :type path: str
+        :param name: The name of the filter used for the keys and in the report
+        :type name: str
+        """
+        self.name = name
+        self.connection = connect_database(path, "CREATE TABLE IF NOT EXISTS outputs "
+                                                 "(key TEXT PRIMARY KEY, value TEXT, accessed REAL)", name)
+        self.entries = {}
+        self.loaded = {}
+        self.accessed = []
+        self.stats = {"reused": 0, "rebuilt": 0}
+
+    def key(self, inputs):
+        text = json.dumps([self.name, inputs], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get(self, inputs):
+        """
+        Returns the element that was created for the inputs before.
+
+        :param inputs: Everything that the element depends on (has to be serializable as JSON)
+        :type inputs: list
+        :return: The element or ``None`` if there is none for the inputs
+        :rtype: list | dict | None
+        """
+        return self.get_entry(self.key(inputs))
+
+    def get_entry(self, key):
+        value = self.entries.get(key)
+        if value is None and key in self.loaded:
+            value = self.loaded[key]
+        elif value is None and self.connection is not None:
+            row = self.connection.execute("SELECT value FROM outputs WHERE key = ?", (key,)).fetchone()
+            value = row[0] if row else None
+        if value is None:
+            return None
+
+        self.accessed.append((time.time(), key))
+        self.stats["reused"] += 1
+        return json.loads(value)
+
+    def load(self, keys):
+        """
+        Reads the entries for many keys with a few queries, so that the database doesn't have to be queried for every
+        element while the document is filtered.
+
+        :param keys: The keys of the entries (see :meth:`key`)
+        :type keys: collections.Iterable[str]
+        """
+        if self.connection is None:
+            return
+
+        keys = [key for key in OrderedDict.fromkeys(keys) if key not in self.loaded]
+        for start in range(0, len(keys), MANIFEST_BATCH):
+            batch = keys[start:start + MANIFEST_BATCH]
+            self.loaded.update(dict.fromkeys(batch))
+            statement = "SELECT key, value FROM outputs WHERE key IN ({})".format(", ".join("?" * len(batch)))
+            self.loaded.update(self.connection.execute(statement, batch))
+
+    def set(self, inputs, element):
+        """
+        Records the element that was created for the inputs.
+
+        :param inputs: Everything that the element depends on (has to be serializable as JSON)
+        :type inputs: list
+        :param element: The created element
+        :type element: list | dict
+        """
+        self.set_entry(self.key(inputs), element)
+
+    def set_entry(self, key, element):
+        self.entries[key] = json.dumps(element)
+        self.stats["rebuilt"] += 1
+
+    def build(self, inputs, create):
+        """
+        Returns the element that was created for the inputs before or creates and records it. The key is computed
+        before the element is created, so it doesn't matter if the inputs are changed while creating it.
+
+        :param inputs: Everything that the element depends on (has to be serializable as JSON)
+        :type inputs: list
+        :param create: Function without arguments that creates the element
+        :type create: callable
+        :return: The element
+        :rtype: list | dict | None
+        """
+        key = self.key(inputs)
+        element = self.get_entry(key)
+        if element is None:
+            element = create()
+            if element is not None:
+                self.set_entry(key, element)
+        return element
+
+    def close(self):
+        """
+        Writes the new entries to the database, removes old ones and reports how many elements were reused.
+        """
+        print("{} - Reused {} and rebuilt {} elements".format(self.name, self.stats["reused"], self.stats["rebuilt"]),
+              file=sys.stderr)
+        if self.connection is None:
+            return
+        try:
+            now = time.time()
+            self.connection.executemany("UPDATE outputs SET accessed = ? WHERE key = ?", self.accessed)
+            self.connection.executemany("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?)",
+                                        [(key, value, now) for key, value in self.entries.items()])
+            self.connection.execute("DELETE FROM outputs WHERE accessed < ?", (now - MANIFEST_MAX_AGE,))
+            self.connection.commit()
+        except sqlite3.Error as error:
+            print("{} - Couldn't write the manifest: {}".format(self.name, error), file=sys.stderr)
+        finally:
+            self.connection.close()
+            self.connection = None
+            self.entries, self.loaded, self.accessed = {}, {}, []
+
+
+def get_format():
+    """
+    Returns the target output format that pandoc passes as the first argument to the filter.
+
+    :return: The output format
+    :rtype: str
+    """
+    return sys.argv[1] if len(sys.argv) > 1 else ""
+
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Measures the time of a stage.
+
+    :param timings: The timings in seconds for each stage
+    :type timings: dict[str, float]
+    :param stage: The name of the stage
+    :type stage: str
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.time() - start
+
+
+class Instrumentation(object):
+    """
+    Collects the time spent in the stages of the filters (e.g. reading a CSV file or converting cells with pandoc) and
+    counters like the number of started pandoc processes. Nothing is measured unless it is enabled. The times of
+    stages that call each other overlap and stages that run in worker processes are not included.
+    """
+
+    def __init__(self, enabled=False):
+        """
+        :param enabled: Should the stages be measured
+        :type enabled: bool
+        """
+        self.enabled = enabled
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+        self.lock = threading.Lock()
+
+    def reset(self, enabled=False):
+        with self.lock:
+            self.enabled = enabled
+            self.timings = OrderedDict()
+            self.counters = OrderedDict()
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            total, calls = self.timings.get(stage, (0.0, 0))
+            self.timings[stage] = (total + seconds, calls + 1)
+
+    def iterate(self, stage, iterator):
+        """
+        Measures the time spent producing the items of a lazy iterator (e.g. reading and parsing the rows of a file
+        while they are consumed). The time is added to the stage when the iterator is closed.
+
+        :param stage: The name of the stage
+        :type stage: str
+        :param iterator: The iterator
+        :type iterator: collections.Iterator
+        :return: The iterator itself if the instrumentation is disabled or an iterator that measures the time
+        :rtype: collections.Iterator
+        """
+        if not self.enabled:
+            return iterator
+        return TimedIterator(self, stage, iterator)
+
+    def count(self, counter, amount=1):
+        """
+        Increases a counter if the instrumentation is enabled.
+
+        :param counter: The name of the counter
+        :type counter: str
+        :param amount: The amount that is added
+        :type amount: int
+        """
+        if self.enabled:
+            with self.lock:
+                self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def report(self, name, timings):
+        """
+        Creates the report with the timings of the stages and the counters.
+
+        :param name: The name of the filter
+        :type name: str
+        :param timings: The timings in seconds of decoding, walking and encoding the document
+        :type timings: dict[str, float]
+        :return: The lines of the report
+        :rtype: list[str]
+        """
+        with self.lock:
+            stages, counters = list(self.timings.items()), list(self.counters.items())
+        lines = ["{} - {}".format(name, ", ".join("{} {:.3f}s".format(stage, seconds)
+                                                  for stage, seconds in timings.items()))]
+        for stage, (seconds, calls) in stages:
+            lines.append("{} - {} {:.3f}s in {} calls".format(name, stage, seconds, calls))
+        for counter, value in counters:
+            lines.append("{} - {} {}".format(name, counter, value))
+        return lines
+
+
+class LocalInstrumentation(object):
+    """
+    The instrumentation of the document that the current thread filters. The daemon and the batch mode filter several
+    documents at the same time, so every document gets its own :class:`Instrumentation` when it is started (see
+    :meth:`reset`) and the report only contains its own stages and counters. Worker threads that help with a document
+    use its instrumentation through :meth:`bind`. Other threads use a default instrumentation that is never reported.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.default = Instrumentation()
+
+    @property
+    def current(self):
+        return getattr(self.local, "instrumentation", None) or self.default
+
+    @property
+    def enabled(self):
+        return self.current.enabled
+
+    @enabled.setter
+    def enabled(self, enabled):
+        self.current.enabled = enabled
+
+    def reset(self, enabled=False):
+        """
+        Starts a new instrumentation for the document of the current thread.
+
+        :param enabled: Should the stages be measured
+        :type enabled: bool
+        :return: The instrumentation of the document
+        :rtype: Instrumentation
+        """
+        self.local.instrumentation = Instrumentation(enabled)
+        return self.local.instrumentation
+
+    def bind(self, function):
+        """
+        Returns a function that runs with the instrumentation of the current thread in another thread (e.g. in a pool
+        of threads that create the tables of the document).
+
+        :param function: The function
+        :type function: callable
+        :return: The function that uses the instrumentation of the current thread
+        :rtype: callable
+        """
+        instrumentation = self.current
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            previous = getattr(self.local, "instrumentation", None)
+            self.local.instrumentation = instrumentation
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.instrumentation = previous
+        return wrapper
+
+    def __getattr__(self, name):
+        return getattr(self.current, name)
+
+
+class TimedIterator(object):
+    """
+    Iterator that measures the time spent in the wrapped iterator (see :meth:`Instrumentation.iterate`).
+    """
+
+    def __init__(self, instrumentation, stage, iterator):
+        """
+        :param instrumentation: The instrumentation that the time is added to
+        :type instrumentation: Instrumentation
+        :param stage: The name of the stage
+        :type stage: str
+        :param iterator: The wrapped iterator
+        :type iterator: collections.Iterator
+        """
+        self.instrumentation = instrumentation
+        self.stage = stage
+        self.iterator = iterator
+        self.seconds = 0.0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.time()
+        try:
+            return next(self.iterator)
+        finally:
+            self.seconds += time.time() - start
+
+    next = __next__
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        start = time.time()
+        try:
+            if hasattr(self.iterator, "close"):
+                self.iterator.close()
+        finally:
+            self.instrumentation.add_time(self.stage, self.seconds + time.time() - start)
+
+
+# The instrumentation that is used by all filters for the document of the current thread
+INSTRUMENTATION = LocalInstrumentation()
+
+
+def instrumented(stage):
+    """
+    Decorator that adds the time spent in a function to the instrumentation if it is enabled.
+
+    :param stage: The name of the stage in the report
+    :type stage: str
+    :return: The decorator
+    :rtype: callable
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION.enabled:
+                return function(*args, **kwargs)
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                INSTRUMENTATION.add_time(stage, time.time() - start)
+        return wrapper
+    return decorator
+
+
+def get_meta_setting(meta, key, default_value=""):
+    """
+    Returns a setting from the metadata as text.
+
+    :param meta: The metadata of the document.
+    :type meta: dict
+    :param key: The key of the setting
+    :type key: str
+    :param default_value: The value if the setting doesn't exist
+    :type default_value: str
+    :return: The value of the setting
+    :rtype: str
+    """
+    if key not in meta:
+        return default_value
+    return decode_meta_value(meta[key])
+
+
+def decode_meta_value(value):
+    """
+    Decodes a value of the metadata to text. Pandoc wraps the values in elements like MetaString, MetaInlines or
+    MetaBool (while documents created by scripts often contain plain values). Boolean values become "yes" or "no" and
+    the items of lists are separated by commas.
+
+    :param value: The value from the metadata
+    :type value: dict | list | str | bool | int | float
+    :return: The value as text
+    :rtype: str
+    """
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, dict):
+        if value.get("t") == "MetaBool":
+            return "yes" if value["c"] else "no"
+        if value.get("t") == "MetaString":
+            return value["c"]
+        if value.get("t") == "MetaList":
+            return ",".join(decode_meta_value(item) for item in value["c"])
+        return stringify(value)
+    if isinstance(value, list):
+        if all(not isinstance(item, dict) or item.get("t", "").startswith("Meta") for item in value):
+            return ",".join(decode_meta_value(item) for item in value)
+        return stringify(value)
+    return str(value)
+
+
+class Setting(object):
+    """
+    Description of a setting of a filter: where it can be given, its default value and how its value is checked.
+    """
+
+    # The values that are accepted for boolean settings
+    TRUE_VALUES = frozenset(["yes", "true", "1", "on"])
+    FALSE_VALUES = frozenset(["no", "false", "0", "off", ""])
+
+    def __init__(self, aliases, default="", kind="text", choices=None, meta=True, empty=True):
+        """
+        :param aliases: The names of the attribute of the element in the order of their precedence
+        :type aliases: str | list[str]
+        :param default: The value if the setting isn't given
+        :type default: str | list[str]
+        :param kind: The type of the value: "text", "bool" ("yes" or "no"), "number" (text that can be converted to a
+          number), "choice" (one of the choices) or "list" (a list of text from a list or separated by commas)
+        :type kind: str
+        :param choices: The allowed values for the type "choice"
+        :type choices: list[str] | None
+        :param meta: The names in the metadata of the document (``True`` for the names of the attributes and ``False``
+          if the setting can only be given as attribute)
+        :type meta: bool | str | list[str]
+        :param empty: Can an attribute set the setting to an empty value (otherwise an empty attribute is ignored and
+          the value from the metadata is used)
+        :type empty: bool
+        """
+        self.aliases = [aliases] if isinstance(aliases, str) else list(aliases)
+        self.default = default
+        self.kind = kind
+        self.choices = choices
+        self.meta = self.aliases if meta is True else [] if meta is False else [meta] if isinstance(meta, str) else meta
+        self.empty = empty
+
+    def convert(self, value):
+        """
+        Converts and checks the value of the setting.
+
+        :param value: The value as text (or list for the type "list")
+        :type value: str | list[str]
+        :return: The checked value
+        :rtype: str | list[str]
+        :raises ValueError: If the value isn't valid for the setting
+        """
+        if self.kind == "list":
+            items = value if isinstance(value, list) else value.split(",")
+            return [item.strip() for item in items if item.strip()]
+        value = value.strip() if self.kind != "text" else value
+        if self.kind == "bool":
+            if value.lower() in self.TRUE_VALUES:
+                return "yes"
+            if value.lower() in self.FALSE_VALUES:
+                return "no"
+        elif self.kind == "number":
+            if not value:
+                return value
+            try:
+                float(value)
+                return value
+            except ValueError:
+                pass
+        elif self.kind == "choice":
+            if value.lower() in self.choices:
+                return value.lower()
+        else:
+            return value
+        raise ValueError(value)
+
+
+class SettingsResolver(object):
+    """
+    Resolves the settings of a filter from the attributes of an element and the metadata of the document. The
+    metadata is decoded, checked and combined with the defaults only once per document, so that the settings of an
+    element only need a lookup of its attributes. Attributes take precedence over the metadata.
+    """
+
+    def __init__(self, name, settings):
+        """
+        :param name: The name of the filter used in messages
+        :type name: str
+        :param settings: The settings with their name as key
+        :type settings: dict[str, Setting]
+        """
+        self.name = name
+        self.settings = settings
+        self.aliases = {}
+        for key, setting in settings.items():
+            for rank, alias in enumerate(setting.aliases):
+                self.aliases.setdefault(alias, (key, rank))
+        self.cached = (None, None)
+
+    def resolve_meta(self, meta):
+        """
+        Returns the settings from the metadata of the document and the defaults. The result is reused as long as the
+        same metadata is passed (the metadata isn't changed while a document is filtered).
+
+        :param meta: The metadata of the document.
+        :type meta: dict
+        :return: The settings
+        :rtype: dict[str, str | list[str]]
+        """
+        cached_meta, view = self.cached
+        if cached_meta is meta and meta is not None:
+            return view
+
+        view = {}
+        for key, setting in self.settings.items():
+            view[key] = setting.default
+            for alias in setting.meta:
+                if meta and alias in meta:
+                    view[key] = self.convert(key, decode_meta_value(meta[alias]))
+                    break
+        self.cached = (meta, view)
+        return view
+
+    def resolve(self, paired_attributes, meta):
+        """
+        Returns the settings for an element.
+
+        :param paired_attributes: The attributes of the element
+        :type paired_attributes: dict[str, str]
+        :param meta: The metadata of the document.
+        :type meta: dict
+        :return: The settings
+        :rtype: dict[str, str | list[str]]
+        """
+        settings = dict(self.resolve_meta(meta))
+        ranks = {}
+        for alias, value in paired_attributes.items():
+            key, rank = self.aliases.get(alias, (None, 0))
+            if key is None or not (value or self.settings[key].empty):
+                continue
+            if rank < ranks.get(key, len(self.settings[key].aliases)):
+                ranks[key] = rank
+                settings[key] = self.convert(key, value)
+        return settings
+
+    def convert(self, key, value):
+        setting = self.settings[key]
+        try:
+            return setting.convert(value)
+        except ValueError:
+            print("{} - Invalid value for {}: {}".format(self.name, key, value), file=sys.stderr)
+            return setting.default
+
+
+def write_report(lines, path=None):
+    """
+    Writes the report to a file or stderr (the filtered document is written to stdout).
+
+    :param lines: The lines of the report
+    :type lines: list[str]
+    :param path: The path of the file that the report is appended to or ``None`` for stderr
+    :type path: str | None
+    """
+    if not path:
+        print("\n".join(lines), file=sys.stderr)
+        return
+    try:
+        with open(path, "a") as report:
+            report.write("\n".join(lines) + "\n")
+    except OSError as error:
+        print("Couldn't write the report to {}: {}".format(path, error), file=sys.stderr)
+
+
+def started_by_pandoc(args=None):
+    """
+    Checks if the filter was started by pandoc, which only passes the target output format as argument. In this case
+    the command line parser isn't needed (and argparse doesn't have to be imported).
+
+    :param args: The arguments (by default the ones from the command line)
+    :type args: list[str] | None
+    :return: ``True`` if there are no options that have to be parsed
+    :rtype: bool
+    """
+    args = sys.argv[1:] if args is None else args
+    return len(args) <= 1 and not any(arg.startswith("-") for arg in args)
+
+
+def run_filter(name, apply, fmt=None, types=None, stdin=None, stdout=None, environ=None, directory=None):
+    """
+    Reads the document from stdin, applies a filter and writes the result to stdout.
+
+    The time for decoding, walking and encoding (and the details collected by :data:`INSTRUMENTATION`) is reported if
+    the environment variable ``PANDOCFILTER_TIMINGS`` or the metadata setting ``timings`` is set. The report is written
+    to stderr or appended to the file in ``PANDOCFILTER_TIMINGS_FILE`` (or the ``timings-file`` setting). If
+    ``PANDOCFILTER_PROFILE`` (or the ``profile`` setting) contains a path, the filter is run with cProfile and the
+    statistics are saved there.
+
+    :param name: The name of the filter used in the report
+    :type name: str
+    :param apply: Function that gets the document, the output format and the metadata and returns the filtered document
+    :type apply: callable
+    :param fmt: The target output format (by default the first argument)
+    :type fmt: str | None
+    :param types: The types of the elements that the filter changes. If the document doesn't contain any of them, it is
+      written back without decoding it.
+    :type types: collections.Iterable[str] | None
+    :param stdin: The stream that the document is read from (by default stdin)
+    :type stdin: io.IOBase | None
+    :param stdout: The stream that the result is written to (by default stdout)
+    :type stdout: io.IOBase | None
+    :param environ: The environment variables of the caller (by default the ones of this process)
+    :type environ: dict[str, str] | None
+    :param directory: The working directory of the caller that relative paths of the report and the profile are
+      resolved against (by default the working directory of this process)
+    :type directory: str | None
+    :return: The timings in seconds for each stage
+    :rtype: dict[str, float]
+    """
+    environ = os.environ if environ is None else environ
+    timings = OrderedDict()
+    INSTRUMENTATION.reset(bool(environ.get(TIMINGS_VARIABLE)))
+
+    with timed(timings, "decode"):
+        data = read_data(stdin)
+        document = loads(data) if types is None or contains_types(data, types) else None
+
+    if document is None:
+        with timed(timings, "copy"):
+            write_data(data, stdout)
+        if INSTRUMENTATION.enabled:
+            path = resolve_path(environ.get(TIMINGS_FILE_VARIABLE), directory)
+            write_report(INSTRUMENTATION.report(name, timings), path)
+        return timings
+
+    meta = get_meta(document)
+
+    if get_meta_setting(meta, "timings", "no") not in ["no", "false", ""]:
+        INSTRUMENTATION.enabled = True
+    profile = resolve_path(environ.get(PROFILE_VARIABLE) or get_meta_setting(meta, "profile"), directory)
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    with timed(timings, "walk"):
+        if profiler is not None:
+            profiler.enable()
+        try:
+            result = apply(document, get_format() if fmt is None else fmt, meta)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    with timed(timings, "encode"):
+        write_document(result, stdout)
+
+    if profiler is not None:
+        profiler.dump_stats(profile)
+    if INSTRUMENTATION.enabled:
+        path = environ.get(TIMINGS_FILE_VARIABLE) or get_meta_setting(meta, "timings-file")
+        write_report(INSTRUMENTATION.report(name, timings), resolve_path(path, directory))
+    return timings
@@ -1,24 +1,57 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import csv
+import gzip
+import importlib.util
 import json
+import os
 import sys
 import tempfile
+import threading
 import unittest
-from contextlib import redirect_stdout
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
+import pypandoc
+from pandocfilters import Plain, RawInline, Str, stringify, walk
+
+import benchmark
 import csvtable
+import filterclient
+import filterdaemon
 import minted
+import pandocfilter
+import pandocjson
+
+
+def pandoc_available():
+    try:
+        pypandoc.get_pandoc_version()
+    except OSError:
+        return False
+    return hasattr(pypandoc, "convert")
 
 
 class BasteTest(unittest.TestCase):
 
     def setUp(self):
         self.stdin = sys.stdin
+        self.cache_home = tempfile.TemporaryDirectory()
+        self.environ = patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_home.name})
+        self.environ.start()
 
     def tearDown(self):
         sys.stdin.close()
         sys.stdin = self.stdin
+        self.environ.stop()
+        csvtable.CACHES.clear()
+        csvtable.URL_CACHES.clear()
+        self.cache_home.cleanup()
 
     def helper(self, function, input_file, output_file):
         sys.stdin = open(input_file, 'r')
@@ -38,6 +71,15 @@ class TestMinted(BasteTest):
     def test(self):
         self.helper(minted.main, "data/minted_original.json", "data/minted_result.json")
 
+    def test_format_attributes(self):
+        self.assertEqual('[linenos, style="tango"]',
+                         minted.format_attributes({"style": "tango", "language": "python"}, ["linenos", "minted"]))
+        self.assertEqual("", minted.format_attributes({}, ["minted"]))
+
+    def test_format_inline(self):
+        settings = {"key": "Code", "language": "python"}
+        self.assertEqual("\\mintinline[linenos]{python}{a = {}}", minted.format_code("a = {}", "[linenos]", settings))
+
 
 class TestCsvTable(BasteTest):
 
@@ -58,6 +100,1052 @@ class TestCsvTable(BasteTest):
         self.assertEqual("1234", csvtable.pad_element("1234", 4, "0"))
         self.assertEqual("12", csvtable.pad_element("1234", 2, "0"))
 
+    def test_split_segments(self):
+        separator = {"t": "Para", "c": [{"t": "Str", "c": csvtable.CELL_SEPARATOR}]}
+        text = {"t": "Para", "c": [{"t": "Str", "c": "Text"}]}
+        self.assertListEqual([[]], csvtable.split_segments([]))
+        self.assertListEqual([[text], [], [text]], csvtable.split_segments([text, separator, separator, text]))
+
+    def test_join_lines(self):
+        contents = ["", "Text 1,Text 2", "Text 1,Text 2\n", '"Text\n1",Text 2\nText 3,Text 4', "\n"]
+        for first in contents:
+            for second in contents:
+                joined = (first + "\n" if first else "") + second
+                self.assertListEqual(list(csv.reader(StringIO(joined))),
+                                     list(csv.reader(csvtable.join_lines(StringIO(first), StringIO(second)))))
+
+    def test_get_table_streamed(self):
+        with open("data/csvtable_result.json") as result:
+            expected = [block for block in json.load(result)[1] if block["t"] == "Table"][9]
+
+        settings = csvtable.generate_settings({"file": "data/csvtable_example1.csv", "content_pos": "bottom",
+                                               "header": "yes"}, {})
+        self.assertDictEqual(expected, csvtable.get_table("Text 5,Text 6", settings))
+
+    def test_select_rows(self):
+        def select(**settings):
+            return list(csvtable.select_rows(iter(range(1, 11)), settings))
+
+        self.assertListEqual(list(range(1, 11)), select())
+        self.assertListEqual([1, 2, 3], select(rows="1:3"))
+        self.assertListEqual([9, 10], select(rows="9:"))
+        self.assertListEqual([5], select(rows="5"))
+        self.assertListEqual([3, 4, 5], select(skip="2", limit="3"))
+        self.assertListEqual([3, 4], select(rows="2:6", skip="1", limit="2"))
+
+    def test_get_columns(self):
+        self.assertIsNone(csvtable.get_columns(["Name", "Score"], {"columns": ""}))
+        self.assertListEqual([1, 0, 2], csvtable.get_columns(["Name", " Score"], {"columns": "Score, Name, 3"}))
+
+    def test_get_table_selected(self):
+        settings = csvtable.generate_settings({"header": "yes", "columns": "Score,1", "limit": "1", "align": "RL"}, {})
+        table = csvtable.get_table("Name,Score,Rank\nAda,3,1\nBob,2,2", settings)
+        caption, alignment, widths, header, rows = table["c"]
+        self.assertListEqual([csvtable.ALIGNMENT["r"], csvtable.ALIGNMENT["l"]], alignment)
+        self.assertListEqual([0.0, 0.0], widths)
+        self.assertListEqual(["Score", "Name"], [cell[0]["c"][0]["c"] for cell in header])
+        self.assertListEqual([["3", "Ada"]], [[cell[0]["c"][0]["c"] for cell in row] for row in rows])
+
+    def test_get_table_empty(self):
+        for attributes in [{"rows": "5:"}, {"limit": "0"}, {"header": "yes", "limit": "0"}, {"header": "yes"}]:
+            content = "" if attributes == {"header": "yes"} else "Name,Score\nAda,3"
+            settings = csvtable.generate_settings(attributes, {})
+            header_row = [["Name"], ["Score"]] if attributes.get("limit") and attributes.get("header") else []
+            with benchmark.stub_pandoc():
+                caption, alignment, widths, header, rows = csvtable.get_table(content, dict(settings))["c"]
+                longtable = csvtable.get_longtable(content, dict(settings))
+            self.assertListEqual(header_row, [[cell[0]["c"][0]["c"]] for cell in header], attributes)
+            self.assertListEqual([], rows, attributes)
+            self.assertEqual(len(header_row), len(alignment), attributes)
+            self.assertNotIn("Ada", longtable["c"][1], attributes)
+
+    def test_get_column_types(self):
+        rows = [["1", "\\cmark", "yes", "Text", ""], ["-2.5", "(\\xmark)", "No", "3"], ["50%", "", "", "", ""]]
+        self.assertListEqual(["number", "marker", "boolean", "text", "empty"], csvtable.get_column_types(rows))
+        self.assertListEqual(["number", "text", "text"],
+                             csvtable.merge_column_types(["number", "empty", "number"], ["empty", "text", "marker"]))
+
+    def test_typed_cells(self):
+        with open("data/csvtable_result.json") as result:
+            tables = [block for block in json.load(result)[1] if block["t"] == "Table"]
+        expected = [row[0] for row in tables[-1]["c"][4]]
+        settings = {"colorize": "yes"}
+        cells = ["\\cmark", "\\xmark", "(\\xmark)"]
+        self.assertListEqual(expected, [csvtable.get_typed_cell(cell, "marker", settings) for cell in cells])
+
+    def test_get_table_typed(self):
+        settings = csvtable.generate_settings({"header": "yes", "number_format": ",.2f", "auto_align": "yes"}, {})
+        table = csvtable.get_table("Value,Name,Done\n1234.5,Ada,\\cmark\n2,Bob,\\xmark", settings)
+        caption, alignment, widths, header, rows = table["c"]
+        self.assertListEqual([csvtable.ALIGNMENT["r"], csvtable.ALIGNMENT["d"], csvtable.ALIGNMENT["d"]], alignment)
+        self.assertListEqual(["Value", "Name", "Done"], [cell[0]["c"][0]["c"] for cell in header])
+        self.assertListEqual([[Plain([Str("1,234.50")])], [Plain([Str("Ada")])],
+                              [Plain([RawInline("tex", "\\cmark")])]], rows[0])
+        self.assertListEqual([Plain([Str("2.00")])], rows[1][0])
+
+    def test_number_format_text_column(self):
+        settings = csvtable.generate_settings({"header": "yes", "number_format": ".2f"}, {})
+        content = "ID,Place,Value\n007,Room,1\nA1,12,2.5"
+        with benchmark.stub_pandoc():
+            rows = csvtable.get_table(content, dict(settings))["c"][4]
+            longtable = csvtable.get_longtable(content, dict(settings))["c"][1]
+        self.assertListEqual([Plain([Str("1.00")])], rows[0][2])
+        self.assertListEqual([Plain([Str("2.50")])], rows[1][2])
+        self.assertIn("007 & Room & 1.00", longtable)
+        self.assertIn("A1 & 12 & 2.50", longtable)
+        self.assertNotIn("7.00", longtable)
+        self.assertNotIn("12.00", longtable)
+
+    def test_longtable(self):
+        attributes = [["header", "yes"], ["caption", "Results"], ["longtable", "yes"], ["auto_align", "yes"],
+                      ["widths", "0 0.3"]]
+        value = [["", ["table"], attributes], "Name,Value,Done\nAda Lovelace,50%,\\cmark\nBob *B*,2,\\xmark"]
+        with benchmark.stub_pandoc():
+            table = csvtable.csv_table("CodeBlock", value, "latex", {"cache": "no"})
+            self.assertEqual("Table", csvtable.csv_table("CodeBlock", value, "html", {"cache": "no"})["t"])
+
+        self.assertEqual("RawBlock", table["t"])
+        self.assertEqual("\n".join([
+            "\\begin{longtable}[]{@{}l>{\\raggedleft\\arraybackslash}p{0.30\\columnwidth}l@{}}",
+            "\\caption{Results}\\tabularnewline",
+            "\\toprule", "Name & Value & Done\\tabularnewline", "\\midrule", "\\endfirsthead",
+            "\\toprule", "Name & Value & Done\\tabularnewline", "\\midrule", "\\endhead",
+            "Ada Lovelace & 50\\% & \\cmark\\tabularnewline",
+            "Bob *B* & 2 & \\xmark\\tabularnewline",
+            "\\bottomrule", "\\end{longtable}"]), table["c"][1])
+
+    def test_latex_helpers(self):
+        self.assertEqual("a\\_b \\& \\textbackslash{}c\\{\\}", csvtable.escape_latex("a_b & \\c{}"))
+        self.assertEqual("Mr Smith", csvtable.get_plain_latex(" Mr   Smith "))
+        self.assertIsNone(csvtable.get_plain_latex("**Bold**"))
+        text = "\\textbf{a}\n\nsecond\n\ncsvtablecellseparator\n\ncsvtablecellseparator\n\nline\nbreak"
+        self.assertListEqual(["\\textbf{a}", "", "line break"], csvtable.split_paragraphs(text))
+
+    def test_build_tables(self):
+        attributes = [[], [["file", "data/missing.csv"]], [["header", "yes"]]]
+        blocks = [{"t": "CodeBlock", "c": [["", ["table"], paired], "Text {},Text 1\nText 2,Text 3".format(number)]}
+                  for number, paired in enumerate(attributes)]
+        document = [{"unMeta": {}}, blocks]
+        expected = {id(block["c"]): csvtable.csv_table("CodeBlock", block["c"], "latex", {}) for block in blocks[::2]}
+
+        for processes in [False, True]:
+            self.assertDictEqual(expected, csvtable.build_tables(document, "latex", {}, 2, processes))
+
+    plain_cells = ["", "  ", "Text 1", " Header 2", "Text 3 ", "3.14", "-2", "+1", "50 %", "2017-06-01", "12:30",
+                   "1,000", "x(1)", "a/b", "Why?", "öäüß", "您好"]
+    markdown_cells = ["**Header 1**", "Text 1[@source]", "\\cmark", "1. Item", "(a) Item", "- Item", "    code",
+                      "% Title", "Mr. Smith", "a--b", "Wait...", "snake_case", "öäüß\n", "a\tb", "it's"]
+
+    def test_tokenize_plain(self):
+        for cell in self.plain_cells:
+            self.assertIsNotNone(csvtable.tokenize_plain(cell), cell)
+        for cell in self.markdown_cells:
+            self.assertIsNone(csvtable.tokenize_plain(cell), cell)
+
+    def test_convert_definitions(self):
+        backend = benchmark.StubBackend()
+        segments = ["[x] and [^1]", "[x]: http://example.com", "Text", "", "Note\n\n[^1]: Note"]
+        converted = csvtable.convert_remaining(segments, backend)
+        self.assertEqual(3, backend.conversions)
+        self.assertListEqual([csvtable.convert_markdown(segment, backend) if segment else [] for segment in segments],
+                             converted)
+
+        segments = ["*x*", "", "[x]: http://example.com", "**y**"]
+        with benchmark.stub_pandoc() as backend:
+            self.assertListEqual(segments, csvtable.convert_latex(segments, {"cache": "no"}))
+        self.assertEqual(2, backend.conversions)
+
+    @unittest.skipUnless(pandoc_available(), "pandoc is not installed")
+    def test_convert_definitions_pandoc(self):
+        settings = {"cache": "no", "fast_path": "no"}
+        converted = csvtable.convert_segments(["[x]", "[x]: http://example.com", "[^1]", "[^1]: Note"], settings)
+        self.assertListEqual(csvtable.convert_markdown("[x]"), converted[0])
+        self.assertListEqual(csvtable.convert_markdown("[^1]"), converted[2])
+
+    @unittest.skipUnless(pandoc_available(), "pandoc is not installed")
+    def test_tokenize_plain_pandoc(self):
+        for cell in self.plain_cells:
+            self.assertListEqual(csvtable.convert_markdown(cell), csvtable.tokenize_plain(cell), cell)
+
+
+def module_available(name):
+    return importlib.util.find_spec(name) is not None
+
+
+class TestSources(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.rows = [["Name", "Value"], ["Ada", "1"], ["Bob", "2"]]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_settings(self, file_name, **paired):
+        paired.update({"file": file_name, "header": "yes"})
+        return csvtable.generate_settings(paired, {})
+
+    def get_cells(self, table):
+        header, rows = table["c"][3], table["c"][4]
+        return [[stringify(cell) for cell in row] for row in [header] + rows]
+
+    def test_get_source_format(self):
+        self.assertEqual("csv", csvtable.get_source_format({"file_name": "data/table.csv"}))
+        self.assertEqual("gzip", csvtable.get_source_format({"file_name": "data/table.csv.gz"}))
+        self.assertEqual("parquet", csvtable.get_source_format({"file_name": "table", "format": "pq"}))
+        self.assertEqual("csv", csvtable.get_source_format({"file_name": "table.gz", "format": "csv"}))
+
+    def test_gzip(self):
+        for file_name, paired in [("table.csv.gz", {}), ("table", {"format": "gzip"})]:
+            path = os.path.join(self.directory.name, file_name)
+            with gzip.open(path, "wt") as output:
+                csv.writer(output).writerows(self.rows)
+
+            table = csvtable.get_table("", self.get_settings(path, **paired))
+            self.assertListEqual(self.rows, self.get_cells(table))
+
+    def test_url(self):
+        settings = self.get_settings("http://localhost/table.parquet")
+        self.assertRaises(ValueError, csvtable.open_source, settings["file_name"], settings)
+
+    @unittest.skipUnless(module_available("zstandard"), "zstandard is not installed")
+    def test_zstd(self):
+        import zstandard
+        path = os.path.join(self.directory.name, "table.csv.zst")
+        content = "\n".join(",".join(row) for row in self.rows)
+        with open(path, "wb") as output:
+            output.write(zstandard.ZstdCompressor().compress(content.encode("utf-8")))
+
+        table = csvtable.get_table("", self.get_settings(path))
+        self.assertListEqual(self.rows, self.get_cells(table))
+
+    @unittest.skipUnless(module_available("pyarrow"), "pyarrow is not installed")
+    def test_columnar(self):
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+        data = pyarrow.table({"Name": ["Ada", "Bob"], "Value": [1, 2], "Other": [None, 3.5]})
+        paths = [os.path.join(self.directory.name, name) for name in ["table.parquet", "table.arrow"]]
+        pyarrow.parquet.write_table(data, paths[0])
+        pyarrow.feather.write_feather(data, paths[1], compression="uncompressed")
+
+        for path in paths:
+            table = csvtable.get_table("", self.get_settings(path, columns="Name,Value"))
+            self.assertListEqual(self.rows, self.get_cells(table))
+            table = csvtable.get_table("Carl,3,", self.get_settings(path, content_pos="bottom"))
+            self.assertListEqual(["Carl", "3", ""], self.get_cells(table)[-1])
+
+
+class TestSettings(unittest.TestCase):
+
+    def setUp(self):
+        self.resolver = pandocjson.SettingsResolver("Test", OrderedDict([
+            ("alignment", pandocjson.Setting(["align", "alignment"])),
+            ("header", pandocjson.Setting("header", "no", "bool")),
+            ("limit", pandocjson.Setting("limit", "", "number", meta=False)),
+            ("backend", pandocjson.Setting("backend", "subprocess", "choice", ["subprocess", "server"])),
+            ("exclude", pandocjson.Setting([], ["table"], "list", meta="exclude")),
+        ]))
+
+    def test_decode_meta_value(self):
+        inlines = {"t": "MetaInlines", "c": [{"t": "Str", "c": "a"}, {"t": "Space", "c": []}, {"t": "Str", "c": "b"}]}
+        self.assertEqual("a b", pandocjson.decode_meta_value(inlines))
+        self.assertEqual(";", pandocjson.decode_meta_value({"t": "MetaString", "c": ";"}))
+        self.assertEqual("yes", pandocjson.decode_meta_value({"t": "MetaBool", "c": True}))
+        self.assertEqual("no", pandocjson.decode_meta_value(False))
+        self.assertEqual("a b,c", pandocjson.decode_meta_value({"t": "MetaList", "c": [inlines, "c"]}))
+
+    def test_resolve(self):
+        meta = {"alignment": {"t": "MetaInlines", "c": [{"t": "Str", "c": "lr"}]},
+                "header": {"t": "MetaBool", "c": True}, "limit": "1",
+                "exclude": {"t": "MetaList", "c": [{"t": "MetaString", "c": "table"}, "ditaa"]}}
+        self.assertDictEqual({"alignment": "lr", "header": "yes", "limit": "", "backend": "subprocess",
+                              "exclude": ["table", "ditaa"]}, self.resolver.resolve({}, meta))
+        self.assertIs(self.resolver.resolve_meta(meta), self.resolver.resolve_meta(meta))
+
+        settings = self.resolver.resolve({"alignment": "c", "align": "r", "header": "False", "backend": "Server"}, meta)
+        self.assertEqual(("r", "no", "server"), (settings["alignment"], settings["header"], settings["backend"]))
+
+    def test_invalid(self):
+        with redirect_stderr(StringIO()) as messages:
+            settings = self.resolver.resolve({"limit": "ten", "backend": "docker"}, {"header": "maybe"})
+        self.assertEqual(("", "no", "subprocess"), (settings["limit"], settings["header"], settings["backend"]))
+        self.assertIn("Test - Invalid value for limit: ten", messages.getvalue())
+
+    def test_filters(self):
+        meta = {"delimiter": {"t": "MetaInlines", "c": [{"t": "Str", "c": ";"}]},
+                "minted-language": {"t": "MetaInlines", "c": [{"t": "Str", "c": "python"}]},
+                "minted-exclude": {"t": "MetaList", "c": [{"t": "MetaInlines", "c": [{"t": "Str", "c": "skip"}]}]}}
+        self.assertEqual(";", csvtable.generate_settings({}, meta)["delimiter"])
+        self.assertEqual("python", minted.generate_settings({}, meta, "CodeBlock")["language"])
+        self.assertEqual("python", minted.generate_settings({"language": ""}, meta, "CodeBlock")["language"])
+        self.assertEqual("text", minted.generate_settings({"language": ""}, {}, "CodeBlock")["language"])
+        self.assertEqual("", csvtable.generate_settings({"delimiter": ""}, meta)["delimiter"])
+        self.assertFalse(minted.check_preconditions("CodeBlock", [["", ["skip"], []], ""], meta))
+        self.assertTrue(minted.check_preconditions("CodeBlock", [["", ["table"], []], ""], meta))
+
+
+class TestHighlighter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.meta = {"minted-mode": {"t": "MetaInlines", "c": [{"t": "Str", "c": "pygments"}]},
+                     "minted-cache-dir": self.directory.name}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_apply(self):
+        code_block = {"t": "CodeBlock", "c": [["", ["linenos"], [["language", "python"]]], "x = {1}"]}
+        code = {"t": "Code", "c": [["", [], [["language", "python"]]], "x"]}
+        document = [{"unMeta": self.meta}, [code_block, {"t": "Para", "c": [code]}]]
+
+        result = minted.apply(document, "latex", self.meta)
+        self.assertEqual("RawBlock", result[1][0]["t"])
+        self.assertIn("\\def\\PY@reset", result[1][0]["c"][1])
+        self.assertEqual("\\begin{Verbatim}[commandchars=\\\\\\{\\},numbers=left]\n"
+                         "\\PY{n}{x} \\PY{o}{=} \\PY{p}{\\PYZob{}}\\PY{l+m+mi}{1}\\PY{p}{\\PYZcb{}}\n"
+                         "\\end{Verbatim}", result[1][1]["c"][1])
+        self.assertEqual("\\texttt{\\PY{n}{x}}", result[1][2]["c"][0]["c"][1])
+
+    def test_cache(self):
+        highlighter = minted.get_highlighter(self.meta)
+        first = highlighter.highlight("print(1)", "python")
+        highlighter.close()
+
+        highlighter = minted.get_highlighter(self.meta)
+        highlighter.render = None
+        self.assertEqual(first, highlighter.highlight("print(1)", "python"))
+        highlighter.close()
+
+    def test_disabled(self):
+        self.assertIsNone(minted.get_highlighter({}))
+
+
+class TestSnippets(unittest.TestCase):
+
+    def apply(self, meta):
+        code_block = {"t": "CodeBlock", "c": [["", [], [["language", "python"]]], "import os"]}
+        code = {"t": "Code", "c": [["", [], []], "x"]}
+        document = [{"unMeta": meta}, [code_block, {"t": "Para", "c": [code, code]}, code_block]]
+        return minted.apply(document, "latex", meta)[1]
+
+    def test_minted(self):
+        blocks = self.apply({"minted-dedup": "yes"})
+        self.assertEqual("\\newsavebox{\\mintedsnippetA}\n\\newsavebox{\\mintedsnippetB}", blocks[0]["c"][1])
+        self.assertTrue(blocks[1]["c"][1].startswith("\\begin{lrbox}{\\mintedsnippetA}"))
+        self.assertIn("\\begin{minted}{python}\nimport os\n\\end{minted}", blocks[1]["c"][1])
+        self.assertTrue(blocks[2]["c"][0]["c"][1].startswith("\\begin{lrbox}{\\mintedsnippetB}"))
+        self.assertEqual("\\usebox{\\mintedsnippetB}", blocks[2]["c"][1]["c"][1])
+        self.assertEqual("\\noindent\\usebox{\\mintedsnippetA}", blocks[3]["c"][1])
+
+    def test_long_code_block(self):
+        content = "\n".join("print({})".format(number) for number in range(minted.DEDUP_BOX_LINES + 1))
+        code_block = {"t": "CodeBlock", "c": [["", [], []], content]}
+        meta = {"minted-dedup": "yes"}
+        blocks = minted.apply([{"unMeta": meta}, [code_block, code_block]], "latex", meta)[1]
+        self.assertEqual(2, len(blocks))
+        self.assertEqual(blocks[0], blocks[1])
+        self.assertTrue(blocks[0]["c"][1].startswith("\\begin{minted}"))
+
+    def test_pygments(self):
+        blocks = self.apply({"minted-dedup": "yes", "minted-mode": "pygments", "minted-cache": "no"})
+        self.assertTrue(blocks[1]["c"][1].startswith("\\begin{SaveVerbatim}[commandchars=\\\\\\{\\}]{mintedsnippetA}"))
+        self.assertEqual("\\gdef\\mintedsnippetB{\\texttt{x}}\\mintedsnippetB{}", blocks[2]["c"][0]["c"][1])
+        self.assertEqual("\\mintedsnippetB{}", blocks[2]["c"][1]["c"][1])
+        self.assertEqual("\\UseVerbatim[commandchars=\\\\\\{\\}]{mintedsnippetA}", blocks[3]["c"][1])
+
+    def test_disabled(self):
+        blocks = self.apply({})
+        self.assertEqual(blocks[0], blocks[2])
+
+    def test_get_snippet_name(self):
+        self.assertEqual("mintedsnippetA", minted.get_snippet_name(0))
+        self.assertEqual("mintedsnippetZ", minted.get_snippet_name(25))
+        self.assertEqual("mintedsnippetBA", minted.get_snippet_name(26))
+
+
+class TestPandocFilter(BasteTest):
+
+    def test_minted(self):
+        arguments = pandocfilter.parse_arguments(["latex", "--filters", "minted"])
+        self.helper(lambda: pandocfilter.main(arguments), "data/minted_original.json", "data/minted_result.json")
+
+    def test_combined(self):
+        with open("data/minted_original.json") as original:
+            document = json.load(original)
+        document[1] = [block for block in document[1] if not csvtable.check_preconditions(block["t"], block["c"])]
+        document[1].append({"t": "CodeBlock", "c": [["", ["table"], [["header", "yes"]]], "A,B\nText 1,Text 2"]})
+        separate = walk(walk(document, csvtable.csv_table, "latex", {}), minted.minted, "latex", {})
+
+        for order in [["csvtable", "minted"], ["minted", "csvtable"]]:
+            self.assertListEqual(separate, pandocfilter.apply_filters(document, "latex", order))
+
+    def test_get_order(self):
+        self.assertListEqual(["csvtable", "minted"], pandocfilter.get_order(None, {}))
+        filters = {"t": "MetaList", "c": [{"t": "MetaInlines", "c": [{"t": "Str", "c": "minted"}]}]}
+        self.assertListEqual(["minted"], pandocfilter.get_order(None, {"filters": filters}))
+        with self.assertRaises(ValueError):
+            pandocfilter.get_order(None, {"filters": "minted,unknown"})
+
+    def test_batch(self):
+        with tempfile.TemporaryDirectory() as directory, open("data/minted_original.json") as original:
+            document = json.load(original)
+            document[1] = [block for block in document[1] if not csvtable.check_preconditions(block["t"], block["c"])]
+            document[1].append({"t": "CodeBlock", "c": [["", ["table"], [["header", "yes"]]], "A,B\n1,2"]})
+            paths = [os.path.join(directory, "chapter{}.json".format(number)) for number in range(3)]
+            for path in paths:
+                with open(path, "w") as output:
+                    json.dump(document, output)
+            expected = pandocfilter.apply_filters(document, "latex", ["csvtable", "minted"])
+
+            arguments = pandocfilter.parse_arguments(["latex", "--batch", directory, "--batch-workers", "2"])
+            self.assertListEqual([directory], arguments.batch)
+            with redirect_stderr(StringIO()) as messages:
+                results = pandocfilter.run_batch(arguments.batch, "latex", arguments, workers=2)
+            self.assertListEqual(paths, list(results))
+            self.assertIn("Filtered 3 documents", messages.getvalue())
+            for path in paths:
+                with open(pandocfilter.get_output_path(path)) as result:
+                    self.assertListEqual(expected, json.load(result))
+
+            self.assertListEqual(paths, pandocfilter.find_documents([directory]))
+            pattern = os.path.join(directory, "*[12].json")
+            self.assertListEqual([paths[2], paths[1]], pandocfilter.find_documents([paths[2], pattern]))
+            missing = os.path.join(directory, "missing.json")
+            with redirect_stderr(StringIO()):
+                self.assertIsNone(pandocfilter.run_batch([missing], "latex")[missing])
+
+    def test_batch_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            broken, valid = os.path.join(directory, "broken.json"), os.path.join(directory, "valid.json")
+            with open(broken, "w") as output:
+                output.write('[1, ["CodeBlock"]]')
+            with open(valid, "w") as output:
+                json.dump([{"unMeta": {}}, []], output)
+
+            with redirect_stderr(StringIO()) as messages:
+                results = pandocfilter.run_batch([os.path.join(directory, "*.json")], "latex")
+            self.assertIsNone(results[broken])
+            self.assertIsNotNone(results[valid])
+            self.assertIn("Couldn't filter " + broken + ": TypeError", messages.getvalue())
+            self.assertIn("Filtered 1 documents in", messages.getvalue())
+            self.assertListEqual(sorted(["broken.json", "valid.json", "valid.filtered.json"]),
+                                 sorted(os.listdir(directory)))
+
+            self.assertListEqual([broken, valid], pandocfilter.find_documents([os.path.join(directory, "*.json")]))
+
+
+class TestPandocJson(unittest.TestCase):
+
+    def setUp(self):
+        self.orjson = pandocjson.orjson
+        self.chunk_size = pandocjson.CHUNK_SIZE
+        with open("data/csvtable_result.json", "rb") as result:
+            self.data = result.read()
+
+    def tearDown(self):
+        pandocjson.orjson = self.orjson
+        pandocjson.CHUNK_SIZE = self.chunk_size
+
+    def test_round_trip(self):
+        pandocjson.CHUNK_SIZE = 1024
+        for backend in {self.orjson, None}:
+            pandocjson.orjson = backend
+            document = pandocjson.loads(self.data)
+            chunks = [bytes(chunk) for chunk in pandocjson.iterencode(document)]
+            self.assertGreater(len(chunks), 1)
+            self.assertListEqual(json.loads(self.data.decode("utf-8")), json.loads(b"".join(chunks).decode("utf-8")))
+
+    def test_walk(self):
+        document = pandocjson.loads(self.data)
+
+        def upper(key, value, fmt, meta):
+            if key == "Str":
+                return {"t": "Str", "c": value.upper()}
+            if key == "Space":
+                return []
+
+        self.assertListEqual(walk(document, upper, "latex", {}), pandocjson.walk(document, upper, "latex", {}))
+        self.assertListEqual(walk(document, minted.minted, "latex", {}),
+                             pandocjson.walk(document, minted.minted, "latex", {}, minted.ELEMENT_TYPES))
+
+    def test_walk_unchanged(self):
+        document = pandocjson.loads(self.data)
+        keys = []
+
+        def collect(key, value, fmt, meta):
+            keys.append(key)
+
+        self.assertIs(document, pandocjson.walk(document, collect, "latex", {}, {"Table", "Header"}))
+        self.assertSetEqual({"Table", "Header"}, set(keys))
+
+        result = pandocjson.walk(document, lambda key, value, fmt, meta: [] if key == "Header" else None, "", {})
+        self.assertIsNot(document[1], result[1])
+        self.assertIs(document[0], result[0])
+        self.assertIs(document[1][1], result[1][0])
+
+    def test_write_document(self):
+        document = pandocjson.loads(self.data)
+        with tempfile.TemporaryFile("w+") as tmp:
+            pandocjson.write_document(document, tmp)
+            tmp.seek(0)
+            self.assertListEqual(document, json.load(tmp))
+
+    def test_write_document_text(self):
+        document = [{"unMeta": {}}, [{"t": "Para", "c": [{"t": "Str", "c": "\u00e9" * 100000}]}]]
+        for backend in {self.orjson, None}:
+            pandocjson.orjson = backend
+            with redirect_stdout(StringIO()) as output:
+                pandocjson.write_document(document)
+            self.assertListEqual(document, json.loads(output.getvalue()))
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.stdin = sys.stdin
+
+    def tearDown(self):
+        sys.stdin = self.stdin
+        pandocjson.INSTRUMENTATION.reset()
+        self.directory.cleanup()
+
+    def test_run_filter(self):
+        report = os.path.join(self.directory.name, "report.txt")
+        profile = os.path.join(self.directory.name, "filter.prof")
+        meta = {"timings": {"t": "MetaBool", "c": True}, "timings-file": report, "profile": profile}
+        code = {"t": "Code", "c": [["", [], []], "x"]}
+        sys.stdin = StringIO(json.dumps([{"unMeta": meta}, [{"t": "Para", "c": [code]}]]))
+
+        with redirect_stdout(StringIO()) as output:
+            pandocjson.run_filter("Minted", minted.apply, "latex")
+        self.assertEqual("\\mintinline{text}{x}", json.loads(output.getvalue())[1][0]["c"][0]["c"][1])
+
+        with open(report) as lines:
+            lines = lines.read().splitlines()
+        self.assertRegex(lines[0], r"^Minted - decode \d+\.\d{3}s, walk \d+\.\d{3}s, encode \d+\.\d{3}s$")
+        self.assertRegex(lines[1], r"^Minted - format_code \d+\.\d{3}s in 1 calls$")
+        self.assertTrue(os.path.getsize(profile))
+
+    def test_stages(self):
+        pandocjson.INSTRUMENTATION.reset(True)
+        settings = csvtable.generate_settings({"header": "yes"}, {})
+        csvtable.get_table("Name,Score\nAda,3\nBob,2", settings)
+        self.assertEqual(1, pandocjson.INSTRUMENTATION.timings["read_rows"][1])
+        self.assertEqual(1, pandocjson.INSTRUMENTATION.timings["format_rows"][1])
+
+        cache = csvtable.ConversionCache(version="1")
+        cache.get("*Text*")
+        cache.update({"*Text*": []})
+        cache.get("*Text*")
+        self.assertDictEqual({"cache_misses": 1, "cache_memory_hits": 1}, dict(pandocjson.INSTRUMENTATION.counters))
+
+        rows = pandocjson.INSTRUMENTATION.iterate("rows", iter([1, 2]))
+        self.assertListEqual([1, 2], list(rows))
+        rows.close()
+        rows.close()
+        self.assertEqual(1, pandocjson.INSTRUMENTATION.timings["rows"][1])
+
+    def test_threads(self):
+        instrumentation = pandocjson.INSTRUMENTATION.reset(True)
+        other = []
+
+        def filter_other():
+            other.append(pandocjson.INSTRUMENTATION.reset(False))
+            pandocjson.INSTRUMENTATION.count("downloads")
+
+        thread = threading.Thread(target=filter_other)
+        thread.start()
+        thread.join()
+        count = pandocjson.INSTRUMENTATION.bind(lambda counter: pandocjson.INSTRUMENTATION.count(counter))
+        worker = threading.Thread(target=count, args=("pandoc_requests",))
+        worker.start()
+        worker.join()
+        self.assertTrue(pandocjson.INSTRUMENTATION.enabled)
+        self.assertDictEqual({"pandoc_requests": 1}, dict(instrumentation.counters))
+        self.assertDictEqual({}, dict(other[0].counters))
+
+    def test_disabled(self):
+        instrumentation = pandocjson.Instrumentation()
+        instrumentation.count("downloads")
+        self.assertDictEqual({}, instrumentation.counters)
+        instrumentation.reset(True)
+        instrumentation.count("bytes_fetched", 10)
+        instrumentation.count("bytes_fetched", 5)
+        self.assertDictEqual({"bytes_fetched": 15}, instrumentation.counters)
+
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.stdin = sys.stdin
+
+    def tearDown(self):
+        sys.stdin = self.stdin
+
+    def test_imports(self):
+        for module in ["csvtable", "minted", "pandocfilter"]:
+            times = benchmark.measure_imports(module)
+            self.assertListEqual([], [name for name in benchmark.LAZY_MODULES if name in times])
+            self.assertLess(times[module], benchmark.IMPORT_BUDGET)
+
+    def test_unchanged(self):
+        data = json.dumps([{"unMeta": {}}, [{"t": "Para", "c": [{"t": "Str", "c": "Text"}]}]])
+        sys.stdin = StringIO(data)
+
+        with redirect_stdout(StringIO()) as output:
+            timings = pandocjson.run_filter("CsvTable", None, "latex", csvtable.ELEMENT_TYPES)
+        self.assertEqual(data, output.getvalue())
+        self.assertListEqual(["decode", "copy"], list(timings))
+
+    def test_started_by_pandoc(self):
+        self.assertTrue(pandocjson.started_by_pandoc([]))
+        self.assertTrue(pandocjson.started_by_pandoc(["latex"]))
+        self.assertFalse(pandocjson.started_by_pandoc(["latex", "-j", "2"]))
+        self.assertFalse(pandocjson.started_by_pandoc(["--version"]))
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "daemon.sock")
+        self.thread = threading.Thread(target=filterdaemon.serve, args=(self.path, 0.5))
+        self.thread.start()
+        while not os.path.exists(self.path):
+            self.thread.join(0.01)
+
+        table = {"t": "CodeBlock", "c": [["", ["table"], [["header", "yes"]]], "Name,Value\nAda,1\nBob,2"]}
+        code_block = {"t": "CodeBlock", "c": [["", [], [["language", "python"]]], "x = 1"]}
+        code = {"t": "Code", "c": [["", [], []], "x"]}
+        meta = {"cache": {"t": "MetaString", "c": "no"}}
+        self.data = json.dumps([{"unMeta": meta}, [table, code_block, {"t": "Para", "c": [code]}]]).encode("utf-8")
+        self.argv, self.stdin = sys.argv, sys.stdin
+
+    def tearDown(self):
+        sys.argv, sys.stdin = self.argv, self.stdin
+        self.thread.join()
+        self.directory.cleanup()
+
+    def run_main(self, main):
+        sys.argv, sys.stdin = ["filter", "latex"], StringIO(self.data.decode("utf-8"))
+        with redirect_stdout(StringIO()) as output:
+            main()
+        return output.getvalue().encode("utf-8")
+
+    def run_client(self, name, results=None):
+        stdout, stderr = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+        with stdout, stderr:
+            status = filterclient.filter_document(self.data, name, "latex", self.path, stdout, stderr)
+            stdout.seek(0)
+            result = (status, stdout.read())
+        if results is not None:
+            results.append(result)
+        return result
+
+    def test_same_output(self):
+        mains = {"csvtable": partial(csvtable.main, None), "minted": minted.main,
+                 "pandocfilter": partial(pandocfilter.main, None)}
+        for name in filterclient.FILTERS:
+            self.assertTupleEqual((0, self.run_main(mains[name])), self.run_client(name))
+
+    def test_concurrent(self):
+        results = []
+        threads = [threading.Thread(target=self.run_client, args=("pandocfilter", results)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8, len(results))
+        self.assertEqual(1, len(set(results)))
+        self.assertEqual(0, results[0][0])
+
+    def test_client_directory(self):
+        table = {"t": "CodeBlock", "c": [["", ["table"], [["file", "table.csv"]]], ""]}
+        data = json.dumps([{"unMeta": {"cache": {"t": "MetaString", "c": "no"}}}, [table]]).encode("utf-8")
+        cwd = os.getcwd()
+        connections = []
+        try:
+            for name in ["first", "second"]:
+                directory = os.path.join(self.directory.name, name)
+                os.mkdir(directory)
+                with open(os.path.join(directory, "table.csv"), "w") as csv_file:
+                    csv_file.write("Name\n" + name.title())
+                os.chdir(directory)
+                connections.append(filterclient.connect(self.path, start=False))
+                filterclient.send_request(connections[-1], "csvtable", "latex", data)
+        finally:
+            os.chdir(cwd)
+
+        for name, connection in zip(["First", "Second"], connections):
+            stdout, stderr = BytesIO(), BytesIO()
+            with connection:
+                self.assertEqual(0, filterclient.receive_response(connection, stdout, stderr))
+            self.assertIn(name, stdout.getvalue().decode("utf-8"))
+            self.assertNotIn({"First": "Second", "Second": "First"}[name], stdout.getvalue().decode("utf-8"))
+
+    def test_client_environment(self):
+        environment = {"PANDOCFILTER_TIMINGS": "1", "PANDOCFILTER_TIMINGS_FILE": "timings.txt"}
+        cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        try:
+            with patch.dict(os.environ, environment):
+                self.assertEqual(0, self.run_client("csvtable")[0])
+        finally:
+            os.chdir(cwd)
+        with open(os.path.join(self.directory.name, "timings.txt")) as report:
+            self.assertIn("CsvTable", report.read())
+
+    def test_overlapping_timings(self):
+        report = os.path.join(self.directory.name, "timings.txt")
+        barrier = threading.Barrier(2, timeout=5)
+        prepare = csvtable.prepare
+
+        def wait_and_prepare(*args):
+            barrier.wait()
+            return prepare(*args)
+
+        connections = []
+        with patch.object(csvtable, "prepare", wait_and_prepare):
+            for environment in [{"PANDOCFILTER_TIMINGS": "1", "PANDOCFILTER_TIMINGS_FILE": report}, {}]:
+                with patch.dict(os.environ, environment):
+                    for key in filterclient.ENVIRONMENT_VARIABLES:
+                        if key not in environment:
+                            os.environ.pop(key, None)
+                    connections.append(filterclient.connect(self.path, start=False))
+                    filterclient.send_request(connections[-1], "csvtable", "latex", self.data)
+
+            messages = []
+            for connection in connections:
+                stderr = BytesIO()
+                with connection:
+                    self.assertEqual(0, filterclient.receive_response(connection, BytesIO(), stderr))
+                messages.append(stderr.getvalue().decode("utf-8"))
+
+        with open(report) as lines:
+            lines = lines.read().splitlines()
+        self.assertEqual(1, sum(line.startswith("CsvTable - decode") for line in lines))
+        self.assertTrue(any(line.startswith("CsvTable - get_table") for line in lines))
+        self.assertNotIn("CsvTable - decode", messages[1])
+
+    def test_errors(self):
+        self.assertEqual(2, self.run_client("unknown")[0])
+        self.data = b"[\"CodeBlock\""
+        self.assertEqual(1, self.run_client("minted")[0])
+        self.assertIsNone(filterdaemon.create_server(self.path))
+
+    def test_idle_timeout(self):
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestConversionCache(unittest.TestCase):
+
+    blocks = [{"t": "Para", "c": [{"t": "Str", "c": "Text"}]}]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_memory(self):
+        cache = csvtable.ConversionCache(version="1.19")
+        self.assertIsNone(cache.get("**Text**"))
+        cache.update({"**Text**": self.blocks})
+        self.assertListEqual(self.blocks, cache.get("**Text**"))
+        self.assertIsNone(cache.get("**Text**", "latex"))
+        self.assertDictEqual({"memory_hits": 1, "disk_hits": 0, "misses": 2}, cache.stats)
+
+    def test_disk(self):
+        csvtable.ConversionCache(self.path, version="1.19").update({"**Text**": self.blocks})
+        cache = csvtable.ConversionCache(self.path, version="1.19")
+        self.assertListEqual(self.blocks, cache.get("**Text**"))
+        self.assertListEqual(self.blocks, cache.get("**Text**"))
+        self.assertDictEqual({"memory_hits": 1, "disk_hits": 1, "misses": 0}, cache.stats)
+        self.assertIsNone(csvtable.ConversionCache(self.path, version="2.0").get("**Text**"))
+
+    def test_eviction(self):
+        size = len(json.dumps(self.blocks))
+        cache = csvtable.ConversionCache(self.path, memory_size=size, disk_size=2 * size, version="1.19")
+        for content in ["a", "b", "c"]:
+            cache.update({content: self.blocks})
+        self.assertEqual(1, len(cache.memory))
+        self.assertEqual(2, cache.connection.execute("SELECT COUNT(*) FROM conversions").fetchone()[0])
+        self.assertIsNone(csvtable.ConversionCache(self.path, version="1.19").get("a"))
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.meta = {"incremental": "yes", "cache_dir": self.directory.name, "minted-cache-dir": self.directory.name}
+        self.csv_file = os.path.join(self.directory.name, "table.csv")
+        with open(self.csv_file, "w") as csv_file:
+            csv_file.write("Text 1,Text 2\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_build(self):
+        path = os.path.join(self.directory.name, "manifest.sqlite")
+        manifest = pandocjson.Manifest(path, "Test")
+        self.assertEqual({"t": "Null"}, manifest.build(["input"], lambda: {"t": "Null"}))
+        self.assertIsNone(manifest.build(["other"], lambda: None))
+        manifest.close()
+
+        manifest = pandocjson.Manifest(path, "Test")
+        self.assertEqual({"t": "Null"}, manifest.build(["input"], None))
+        self.assertIsNone(manifest.get(["other"]))
+        self.assertDictEqual({"reused": 1, "rebuilt": 0}, manifest.stats)
+        manifest.close()
+
+    def filter_tables(self, workers=0):
+        blocks = [{"t": "CodeBlock", "c": [["", ["table"], [["file", self.csv_file]]], ""]},
+                  {"t": "CodeBlock", "c": [["", ["table"], []], "Text 3,Text 4"]}]
+        document = [{"unMeta": self.meta}, blocks]
+        action = csvtable.prepare(document, "latex", self.meta, workers)
+        result = walk(document, action, "latex", self.meta)
+        stats = dict(next(iter(csvtable.MANIFESTS.values())).stats)
+        csvtable.close_resources()
+        return result, stats
+
+    def test_csvtable(self):
+        for workers in [0, 2]:
+            first, stats = self.filter_tables(workers)
+            second, stats = self.filter_tables(workers)
+            self.assertListEqual(first, second)
+            self.assertDictEqual({"reused": 2, "rebuilt": 0}, stats)
+
+        with open(self.csv_file, "a") as csv_file:
+            csv_file.write("Text 5,Text 6\n")
+        _, stats = self.filter_tables()
+        self.assertDictEqual({"reused": 1, "rebuilt": 1}, stats)
+
+    def test_minted(self):
+        code_block = {"t": "CodeBlock", "c": [["", [], [["language", "python"]]], "import os"]}
+        code = {"t": "Code", "c": [["", [], []], "x"]}
+        document = [{"unMeta": self.meta}, [code_block, {"t": "Para", "c": [code]}]]
+        first = minted.apply(document, "latex", self.meta)
+
+        manifest = minted.get_manifest(self.meta)
+        minted.load_manifest(document, "latex", self.meta, manifest)
+        self.assertEqual(1, len(manifest.loaded))
+        self.assertIsNotNone(next(iter(manifest.loaded.values())))
+        self.assertEqual(first[1], walk(document[1], partial(minted.minted, manifest=manifest), "latex", self.meta))
+        self.assertDictEqual({"reused": 1, "rebuilt": 0}, manifest.stats)
+        manifest.close()
+
+    def test_load(self):
+        manifest = pandocjson.Manifest(os.path.join(self.directory.name, "manifest.sqlite"), "Test")
+        for number in range(pandocjson.MANIFEST_BATCH + 1):
+            manifest.set([number], {"t": "Null"})
+        manifest.close()
+
+        manifest = pandocjson.Manifest(os.path.join(self.directory.name, "manifest.sqlite"), "Test")
+        keys = [manifest.key([number]) for number in range(pandocjson.MANIFEST_BATCH + 2)]
+        manifest.load(keys)
+        self.assertEqual(pandocjson.MANIFEST_BATCH + 1, sum(value is not None for value in manifest.loaded.values()))
+        manifest.connection.close()
+        manifest.connection = None
+        self.assertEqual({"t": "Null"}, manifest.get([0]))
+        self.assertIsNone(manifest.get([pandocjson.MANIFEST_BATCH + 1]))
+        manifest.close()
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_generate_csv(self):
+        rows = list(csv.reader(StringIO(benchmark.generate_csv(5, 3, markdown=0.5))))
+        self.assertEqual(6, len(rows))
+        self.assertTrue(all(len(row) == 3 for row in rows))
+        self.assertEqual(benchmark.generate_csv(5, 3, 0.5), benchmark.generate_csv(5, 3, 0.5))
+
+    def test_run_benchmarks(self):
+        parameters = {"rows": 5, "columns": 3, "markdown": 0.5, "tables": 2, "code_blocks": 3, "inline_codes": 3}
+        get_backend = csvtable.get_backend
+        results = json.loads(json.dumps(benchmark.run_benchmarks(parameters, repeat=2, stub=True)))
+        self.assertIs(get_backend, csvtable.get_backend)
+        for name, result in results["results"].items():
+            self.assertNotIn("error", result, name)
+            self.assertEqual(2, len(result["times"]))
+        self.assertEqual(len(results["results"]) + 1, len(benchmark.compare_results(results, results)))
+
+
+class PandocServerHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for ``pandoc-server`` that converts every text to a paragraph with a single string. The response has the
+    same structure as the one of pandoc 3 (which uses the new JSON structure for documents). Texts starting with
+    "fail" are rejected like content that pandoc can't convert.
+    """
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        if request["text"].startswith("fail"):
+            self.send_error(400, "Unknown reader")
+            return
+
+        document = {"pandoc-api-version": [1, 23, 1], "meta": {},
+                    "blocks": [{"t": "Para", "c": [{"t": "Str", "c": request["text"]}]}]}
+        body = json.dumps({"output": json.dumps(document), "base64": False, "messages": []}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestServerBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), PandocServerHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        csvtable.close_backends()
+
+    def test_convert_many(self):
+        backend = csvtable.ServerBackend(4, [self.url])
+        contents = ["**Text {}**".format(number) for number in range(20)]
+        converted = [pandocjson.get_blocks(json.loads(result))[0]["c"][0]["c"]
+                     for result in backend.convert_many(contents)]
+        self.assertListEqual(contents, converted)
+        backend.close()
+
+    def test_fallback(self):
+        backend = csvtable.ServerBackend(1, [self.url])
+        backend.fallback = benchmark.StubBackend()
+        with redirect_stderr(StringIO()) as messages:
+            self.assertListEqual([{"t": "Para", "c": [Str("fail")]}], csvtable.convert_markdown("fail", backend))
+            self.assertFalse(backend.failed)
+            self.assertEqual("Text", csvtable.convert_markdown("Text", backend)[0]["c"][0]["c"])
+
+            self.server.shutdown()
+            self.server.server_close()
+            self.assertListEqual([{"t": "Para", "c": [Str("Text")]}], csvtable.convert_markdown("Text", backend))
+            self.assertTrue(backend.failed)
+        self.assertEqual(2, backend.fallback.conversions)
+        self.assertEqual(2, messages.getvalue().count("CsvTable - Couldn't convert with pandoc server"))
+        backend.close()
+
+    def test_convert_segments(self):
+        settings = {"cache": "no", "backend": "server", "workers": "2", "pandoc_server": self.url}
+        self.assertListEqual([[{"t": "Para", "c": [{"t": "Str", "c": "*Text*"}]}], []],
+                             csvtable.convert_segments(["*Text*", ""], settings))
+
+
+class CsvHandler(BaseHTTPRequestHandler):
+    """
+    Serves the same CSV content for every path.
+    """
+
+    content = "Header 1,Header 2\nText 1,Text 2\n"
+    etag = '"example"'
+    status_codes = []
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == self.etag:
+            self.status_codes.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = self.content.encode("utf-8")
+        self.status_codes.append(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CsvServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), CsvHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/example.csv".format(self.server.server_port)
+        self.directory = tempfile.TemporaryDirectory()
+        CsvHandler.status_codes = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+
+class TestPrefetch(CsvServerTest):
+
+    @staticmethod
+    def code_block(paired_attributes, classes=("table",)):
+        return {"t": "CodeBlock", "c": [["", list(classes), paired_attributes], ""]}
+
+    def test_prefetch_sources(self):
+        meta = {"cache_dir": self.directory.name}
+        document = [{"unMeta": meta}, [
+            self.code_block([["url", self.url]]),
+            {"t": "Div", "c": [["", [], []], [self.code_block([["file", "data/csvtable_example1.csv"]])]]},
+            self.code_block([["file", "data/missing.csv"]]),
+            self.code_block([["file", "data/csvtable_example2.csv"]], ["python"]),
+        ]]
+        self.assertListEqual([self.url, "data/csvtable_example1.csv", "data/missing.csv"],
+                             list(csvtable.collect_sources(document, "latex", meta)))
+
+        sources = csvtable.prefetch_sources(document, "latex", meta)
+        path = os.path.abspath("data/csvtable_example1.csv")
+        with open(path) as csv_file:
+            self.assertDictEqual({self.url: CsvHandler.content, path: csv_file.read()}, sources)
+
+        settings = {"file_name": self.url, "content_pos": "top"}
+        self.assertEqual("Text 0\n" + CsvHandler.content, "".join(csvtable.get_csv("Text 0", settings, sources)))
+
+    def test_prefetch_directory(self):
+        meta = {"cache_dir": self.directory.name}
+        document = [{"unMeta": meta}, [self.code_block([["file", "csvtable_example1.csv"]])]]
+        directory = os.path.abspath("data")
+        self.assertListEqual([os.path.join(directory, "csvtable_example1.csv")],
+                             list(csvtable.collect_sources(document, "latex", meta, directory)))
+        self.assertListEqual([os.path.join(directory, "csvtable_example1.csv")],
+                             list(csvtable.prefetch_sources(document, "latex", meta, directory)))
+        self.assertDictEqual({}, csvtable.prefetch_sources(document, "latex", meta))
+
+
+class TestUrlCache(CsvServerTest):
+
+    def cache(self, max_age=0.0, offline=False):
+        return csvtable.UrlCache(os.path.join(self.directory.name, "urls.sqlite"), max_age, offline)
+
+    def test_revalidate(self):
+        for _ in range(2):
+            self.assertEqual(CsvHandler.content, csvtable.get_content_from_url(self.url, self.cache()).getvalue())
+        self.assertListEqual([200, 304], CsvHandler.status_codes)
+
+    def test_max_age(self):
+        for _ in range(2):
+            self.assertEqual(CsvHandler.content, csvtable.get_content_from_url(self.url, self.cache(60)).getvalue())
+        self.assertListEqual([200], CsvHandler.status_codes)
+
+    def test_offline(self):
+        self.assertIsNone(csvtable.get_content_from_url(self.url, self.cache(offline=True)))
+        csvtable.get_content_from_url(self.url, self.cache())
+        self.assertEqual(CsvHandler.content,
+                         csvtable.get_content_from_url(self.url, self.cache(offline=True)).getvalue())
+        self.assertListEqual([200], CsvHandler.status_codes)
+
 
 if __name__ == '__main__':
     unittest.main()